@@ -4,48 +4,92 @@ import pygame
 import io
 import tempfile
 import threading
-import time
-from queue import Queue, Empty
 import logging, logging_config
 
+import audio_decode
+import audio_output
+import event_loop
+
 logging_config.setup_root_logging("edge_tts.log")
 logger = logging.getLogger(__name__)
 
+# Shared output for streamed speech, opened on first use
+_output = None
+_output_lock = threading.Lock()
+# Bumped by clear() so speech that is still downloading stops feeding the output
+_generation = 0
 
-async def play_speech(text="Hello, this is a test!", voice="en-US-AndrewNeural"):
-    """Play voice sample directly without saving to file"""
 
-    communicate = edge_tts.Communicate(text, voice)
+def _get_output():
+    global _output
+    with _output_lock:
+        if _output is None:
+            _output = audio_output.AudioOutput(sample_rate=audio_output.native_sample_rate())
+            _output.start()
+        return _output
 
-    # Get audio data as bytes
-    audio_data = b""
-    async for chunk in communicate.stream():
-        if chunk["type"] == "audio":
-            audio_data += chunk["data"]
 
-    # Play using pygame (you'll need: pip install pygame)
+async def _play_buffered(audio_data):
+    """Play a complete MP3 with pygame (used when it can't be decoded here)"""
     pygame.mixer.init()
     pygame.mixer.music.load(io.BytesIO(audio_data))
     pygame.mixer.music.play()
-
-    # Wait for playback to finish
     while pygame.mixer.music.get_busy():
         await asyncio.sleep(0.1)
 
 
-async def speak_async(text, voice="en-US-AndrewNeural"):
-    """Start TTS but don't wait for completion"""
+async def _speak(text, voice):
+    """
+    Speaks `text` while it downloads: each batch of MP3 frames is decoded and queued
+    for playback as soon as it has arrived, so long replies start after the first
+    packets. Returns once the speech has played (or clear() was called).
+    """
+    generation = _generation
     communicate = edge_tts.Communicate(text, voice)
-    audio_data = b""
-    async for chunk in communicate.stream():
-        if chunk["type"] == "audio":
-            audio_data += chunk["data"]
+    try:
+        output = _get_output()
+        decoder = audio_decode.MP3StreamDecoder(output.sample_rate)
+    except ValueError as e:
+        logger.warning(f"Cannot stream speech ({e}); playing it once downloaded.")
+        decoder = None
+
+    audio_data = bytearray()
+    stream = communicate.stream()
+    try:
+        async for chunk in stream:
+            if generation != _generation:
+                return
+            if chunk["type"] != "audio":
+                continue
+            if decoder is None:
+                audio_data += chunk["data"]
+                continue
+            pcm = decoder.process(chunk["data"])
+            if pcm is not None:
+                # write() blocks while the output buffer is full; keep the loop free
+                await asyncio.to_thread(output.write, pcm)
+    finally:
+        # Close the download now when stopped or on an error, not when collected
+        await stream.aclose()
+
+    if decoder is None:
+        await _play_buffered(bytes(audio_data))
+        return
+    pcm = decoder.flush()
+    if pcm is not None and generation == _generation:
+        await asyncio.to_thread(output.write, pcm)
+    # Wait for the end of the speech to be played, or to be cleared
+    await output.mark().wait_async()
 
-    pygame.mixer.init()
-    pygame.mixer.music.load(io.BytesIO(audio_data))
-    pygame.mixer.music.play()
-    while pygame.mixer.music.get_busy():
-        time.sleep(0.1)
+
+async def play_speech(text="Hello, this is a test!", voice="en-US-AndrewNeural"):
+    """Play voice sample directly without saving to file"""
+    await _speak(text, voice)
+
+
+async def speak_async(text, voice="en-US-AndrewNeural"):
+    """Speak text, returning once it has been played"""
+    await _speak(text, voice)
 
 
 async def save_speech(text="Hello, this is a test!", voice="en-US-AndrewNeural"):
@@ -74,76 +118,63 @@ def clean_tmp_audio(tmpfile_path):
         print(f"Error deleting temporary file {tmpfile_path}: {e}")
 
 
-_play_queue = Queue()
-_worker_started = False
-
+# Queued texts, consumed by _tts_worker on the shared event loop (only touched there)
+_play_queue = None
+_worker = None
+_worker_lock = threading.Lock()
 
-def _tts_worker():
 
+async def _tts_worker(queue):
     while True:
-        text = _play_queue.get()
+        text = await queue.get()
         try:
             if not text:
                 logger.debug("Received empty text from queue, skipping.")
                 continue
             logger.info(f"Starting TTS playback for text: {text[:50]}...")
-            # Start async playback (returns immediately)
-            try:
-                asyncio.run(speak_async(text))
-            except Exception as e:
-                logger.error("Exception in _tts_worker:", exc_info=True)
-                logger.error(f"Exception in _tts_worker: {e}")
-
-            # Wait for playback to start (up to ~2s)
-            waited = 0.0
-            try:
-                while (
-                    not pygame.mixer.get_init() or not pygame.mixer.music.get_busy()
-                ) and waited < 2.0:
-                    time.sleep(0.05)
-                    waited += 0.05
-
-                if waited >= 2.0:
-                    logger.warning("Playback did not start within 2 seconds.")
-            except Exception as e:
-                logger.error("Exception in _tts_worker:", exc_info=True)
-                logger.error(f"Exception in _tts_worker: {e}")
-            # Then wait until it finishes
-            while pygame.mixer.get_init() and pygame.mixer.music.get_busy():
-                time.sleep(0.05)
+            # Returns once the speech has played
+            await speak_async(text)
             logger.info("TTS playback finished.")
         except Exception as e:
             logger.error(f"Exception in _tts_worker: {e}", exc_info=True)
         finally:
-            _play_queue.task_done()
+            queue.task_done()
 
 
 def _ensure_worker():
-    global _worker_started
-    if not _worker_started:
-        threading.Thread(target=_tts_worker, daemon=True).start()
-        _worker_started = True
+    global _play_queue, _worker
+    with _worker_lock:
+        if _worker is None or _worker.done():
+            _play_queue = asyncio.Queue()
+            _worker = event_loop.submit(_tts_worker(_play_queue))
+        return _play_queue
 
 
 def enqueue(text: str):
-    _ensure_worker()
-    _play_queue.put(text)
+    queue = _ensure_worker()
+    event_loop.call_soon(queue.put_nowait, text)
+
+
+def _discard_queued(queue):
+    while not queue.empty():
+        queue.get_nowait()
+        queue.task_done()
 
 
 def clear():
     # stop any current audio and empty the queue
+    global _generation
+    _generation += 1
+    if _output is not None:
+        _output.clear()
     try:
         pygame.mixer.music.stop()
     except Exception:
         pass
-    try:
-        while True:
-            _play_queue.get_nowait()
-            _play_queue.task_done()
-    except Empty:
-        pass
+    if _play_queue is not None:
+        event_loop.call_soon(_discard_queued, _play_queue)
 
 
 if __name__ == "__main__":
     # Test speech generation
-    asyncio.run(speak_async("Hello, this is a test!"))
+    event_loop.submit(speak_async("Hello, this is a test!")).result()
@@ -1,13 +1,13 @@
 import asyncio
 import openai
-import pygame
-import io
 import tempfile
 import threading
-import time
-from queue import Queue, Empty
 
 import logging_config, logging
+import audio_decode
+import audio_output
+import event_loop
+import http_transport
 from openai.helpers import LocalAudioPlayer  # Add this import
 
 root_logger = logging_config.setup_root_logging("openai.log")
@@ -33,28 +33,47 @@ DEFAULT_MODEL = "gpt-4o-mini-tts"
 logger = logging.getLogger(__name__)
 
 
-# Keep your original speak_async for backward compatibility
+# Shared output for speech, opened on first use
+_output = None
+_output_lock = threading.Lock()
+# Bumped by clear() so speech that is still downloading stops feeding the output
+_generation = 0
+
+
+def _get_output():
+    global _output
+    with _output_lock:
+        if _output is None:
+            _output = audio_output.AudioOutput(sample_rate=audio_output.native_sample_rate())
+            _output.start()
+        return _output
+
+
 async def speak_async(text, voice=DEFAULT_VOICE, model=DEFAULT_MODEL):
-    """Start TTS but don't wait for completion (OpenAI TTS) - Legacy version"""
+    """
+    Speak text with OpenAI TTS, playing the PCM stream as it arrives; returns once
+    it has played. Must run on the shared loop from `event_loop`.
+    """
     logger.info(f"speak_async called with text={text!r}, voice={voice}, model={model}")
+    generation = _generation
     try:
-        logger.info("Requesting OpenAI TTS audio bytes (async)...")
-        response = await asyncio.to_thread(
-            lambda: openai.audio.speech.create(model=model, voice=voice, input=text)
-        )
-        print(response)
-        audio_data = response.content
+        output = _get_output()
+        converter = audio_decode.PCMConverter(output.sample_rate)
+        logger.info("Requesting OpenAI TTS audio stream (async)...")
+        client = http_transport.get_async_openai_client()
+        async with client.audio.speech.with_streaming_response.create(
+            model=model, voice=voice, input=text, response_format="pcm"
+        ) as response:
+            async for data in response.iter_bytes():
+                if generation != _generation:
+                    return
+                pcm = converter.process(data)
+                if pcm:
+                    # write() blocks while the output buffer is full; keep the loop free
+                    await asyncio.to_thread(output.write, pcm)
         logger.info("Received audio data from OpenAI TTS.")
-
-        # Start playback in background thread - DON'T wait for it
-        try:
-            pygame.mixer.init()
-            pygame.mixer.music.load(io.BytesIO(audio_data))
-            pygame.mixer.music.play()
-            while pygame.mixer.music.get_busy():
-                time.sleep(0.1)
-        except Exception as e:
-            print(f"Error in background playback: {e}")
+        # Wait for the end of the speech to be played, or to be cleared
+        await output.mark().wait_async()
 
     except Exception as e:
         logger.error(f"Error in speak_async: {e}", exc_info=True)
@@ -71,7 +90,9 @@ async def save_speech(
     try:
         logger.info("Requesting OpenAI TTS audio bytes for saving...")
         response = await asyncio.to_thread(
-            lambda: openai.audio.speech.create(model=model, voice=voice, input=text)
+            lambda: http_transport.get_openai_client().audio.speech.create(
+                model=model, voice=voice, input=text
+            )
         )
         audio_data = response.content
         logger.info("Received audio data from OpenAI TTS.")
@@ -105,59 +126,55 @@ def clean_tmp_audio(tmpfile_path):
         print(f"Error deleting temporary file {tmpfile_path}: {e}")
 
 
-_play_queue = Queue()
-_worker_started = False
+# Queued texts, consumed by _tts_worker on the shared event loop (only touched there)
+_play_queue = None
+_worker = None
+_worker_lock = threading.Lock()
 
 
-def _tts_worker():
+async def _tts_worker(queue):
     while True:
-        text = _play_queue.get()
+        text = await queue.get()
         try:
             if not text:
                 continue
-            # Start async playback (returns immediately)
-            asyncio.run(speak_async(text))
-            # Wait for playback to start (up to ~2s)
-            waited = 0.0
-            while (
-                not pygame.mixer.get_init() or not pygame.mixer.music.get_busy()
-            ) and waited < 2.0:
-                time.sleep(0.05)
-                waited += 0.05
-            # Then wait until it finishes
-            while pygame.mixer.get_init() and pygame.mixer.music.get_busy():
-                time.sleep(0.05)
+            # Returns once the speech has played
+            await speak_async(text)
         finally:
-            _play_queue.task_done()
+            queue.task_done()
 
 
 def _ensure_worker():
-    global _worker_started
-    if not _worker_started:
-        threading.Thread(target=_tts_worker, daemon=True).start()
-        _worker_started = True
+    global _play_queue, _worker
+    with _worker_lock:
+        if _worker is None or _worker.done():
+            _play_queue = asyncio.Queue()
+            _worker = event_loop.submit(_tts_worker(_play_queue))
+        return _play_queue
 
 
 def enqueue(text: str):
-    _ensure_worker()
-    _play_queue.put(text)
+    queue = _ensure_worker()
+    event_loop.call_soon(queue.put_nowait, text)
+
+
+def _discard_queued(queue):
+    while not queue.empty():
+        queue.get_nowait()
+        queue.task_done()
 
 
 def clear():
     # stop any current audio and empty the queue
-    try:
-        pygame.mixer.music.stop()
-    except Exception:
-        pass
-    try:
-        while True:
-            _play_queue.get_nowait()
-            _play_queue.task_done()
-    except Empty:
-        pass
+    global _generation
+    _generation += 1
+    if _output is not None:
+        _output.clear()
+    if _play_queue is not None:
+        event_loop.call_soon(_discard_queued, _play_queue)
 
 
 if __name__ == "__main__":
     # Test speech generation
     logger.info("Running TTS-openAI module as main. Testing play_speech().")
-    asyncio.run(speak_async("Hello, this is a test!"))
+    event_loop.submit(speak_async("Hello, this is a test!")).result()
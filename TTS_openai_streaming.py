@@ -6,6 +6,8 @@ import threading
 import queue
 import time
 import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait as wait_for_futures
 
 from PyQt6.QtWidgets import (
     QApplication,
@@ -20,9 +22,13 @@ from PyQt6.QtWidgets import (
 from PyQt6.QtCore import QThread, pyqtSignal, QObject
 
 import openai
-import pygame
-from openai import OpenAI
 import logging_config
+import http_transport
+import audio_output
+import audio_decode
+import tts_backends
+import tts_cache
+import tts_metrics
 
 logging_config.setup_root_logging("TTS_openai_streaming.log")
 logger = logging.getLogger(__name__)
@@ -30,11 +36,58 @@ logger = logging.getLogger(__name__)
 # Replace with your actual OpenAI API key
 api_key = os.getenv("OPENAI_API_KEY")
 
+# "pcm" speech output: raw 24 kHz, 16-bit signed little-endian, mono
+PCM_SAMPLE_RATE = audio_decode.PCM_SAMPLE_RATE
+STREAM_READ_SIZE = 4096
+
+# Sent down the TTSService worker queues on shutdown
+_END_OF_STREAM = object()
+
+# Common abbreviations that shouldn't end sentences
+ABBREVIATIONS = frozenset(
+    {
+        "Dr.",
+        "Mr.",
+        "Mrs.",
+        "Ms.",
+        "Prof.",
+        "Sr.",
+        "Jr.",
+        "vs.",
+        "etc.",
+        "i.e.",
+        "e.g.",
+        "Inc.",
+        "Ltd.",
+        "Corp.",
+        "U.S.",
+        "U.K.",
+        "a.m.",
+        "p.m.",
+    }
+)
+
 
 class SentenceChunker:
-    """Sophisticated sentence detection and chunking"""
+    """Sophisticated sentence detection and chunking
+
+    `next_chunks` implements the adaptive policy used for streamed replies: the first
+    chunk is cut at the first complete clause so audio starts early, later chunks
+    carry more sentences to save per-request overhead, and no chunk grows past
+    `max_chunk_chars` even when the text has no punctuation (code, lists).
+    """
+
+    # A clause shorter than this is not worth its own request
+    FIRST_CHUNK_MIN_CHARS = 20
+    # Sentences per chunk for the 2nd, 3rd, ... chunk (the last value repeats)
+    CHUNK_SENTENCES = (1, 2, 3)
+    MAX_CHUNK_CHARS = 250
+
+    def __init__(self, max_chunk_chars: int = MAX_CHUNK_CHARS):
+        self.max_chunk_chars = max_chunk_chars
+        # Clause boundaries, only once the following text has started
+        self.clause_pattern = re.compile(r"[,;:\u2013\u2014](?=\s)")
 
-    def __init__(self):
         # Pattern for sentence boundaries with sophisticated handling
         self.sentence_pattern = re.compile(
             r"(?<!\w\.\w.)(?<![A-Z][a-z]\.)(?<![A-Z]\.)(?<=\.|\!|\?)\s+(?=[A-Z])",
@@ -42,26 +95,7 @@ class SentenceChunker:
         )
 
         # Common abbreviations that shouldn't end sentences
-        self.abbreviations = {
-            "Dr.",
-            "Mr.",
-            "Mrs.",
-            "Ms.",
-            "Prof.",
-            "Sr.",
-            "Jr.",
-            "vs.",
-            "etc.",
-            "i.e.",
-            "e.g.",
-            "Inc.",
-            "Ltd.",
-            "Corp.",
-            "U.S.",
-            "U.K.",
-            "a.m.",
-            "p.m.",
-        }
+        self.abbreviations = set(ABBREVIATIONS)
 
     def split_sentences(self, text: str):
         """Split text into sentences with sophisticated boundary detection.
@@ -111,9 +145,351 @@ class SentenceChunker:
 
         return chunks, remainder
 
+    def next_chunks(self, text: str, chunks_sent: int = 0, final: bool = False):
+        """Cut the chunks that are ready to speak off the front of streamed text.
+
+        Args:
+            text: Text received so far that has not been chunked yet.
+            chunks_sent: Chunks already sent for this reply (picks the chunk size).
+            final: The reply is complete, so everything left is flushed.
+
+        Returns (chunks, remainder) where remainder is the text still waiting.
+        """
+        chunks = []
+        while True:
+            chunk, text = self._next_chunk(text, chunks_sent + len(chunks), final)
+            if not chunk:
+                return chunks, text
+            chunks.append(chunk)
+
+    def _next_chunk(self, text: str, index: int, final: bool):
+        if not text.strip():
+            return None, "" if final else text
+        ends_open = not text[-1].isspace()
+        sentences, remainder = self.split_sentences(text)
+        if sentences and not remainder and ends_open and not final:
+            # "version 3." may still continue; a sentence counts as complete only
+            # once the text after it has started
+            remainder = sentences.pop()
+
+        def rest(*parts):
+            # Rejoin what is left, keeping whether the text ended in whitespace
+            tail = " ".join(part for part in parts if part)
+            return tail + " " if tail and not ends_open else tail
+
+        if index == 0:
+            head = sentences[0] if sentences else remainder
+            for match in self.clause_pattern.finditer(head):
+                if match.end() >= self.FIRST_CHUNK_MIN_CHARS:
+                    after = head[match.end() :].strip()
+                    later = sentences[1:] + [remainder] if sentences else []
+                    return self._cap(head[: match.end()].strip(), rest(after, *later))
+            if sentences:
+                return self._cap(sentences[0], rest(*sentences[1:], remainder))
+        else:
+            sizes = self.CHUNK_SENTENCES
+            wanted = sizes[min(index - 1, len(sizes) - 1)]
+            if len(sentences) >= wanted or (final and sentences):
+                taken = sentences[:wanted]
+                while len(taken) > 1 and len(" ".join(taken)) > self.max_chunk_chars:
+                    taken.pop()
+                later = sentences[len(taken) :]
+                return self._cap(" ".join(taken), rest(*later, remainder))
+
+        pending = " ".join(sentences + [remainder]).strip()
+        if final:
+            return self._cap(pending, "")
+        if len(pending) > self.max_chunk_chars:
+            # Unpunctuated text: stop it from building up an unbounded chunk
+            return self._cap(pending, " " if not ends_open else "")
+        return None, text
+
+    def _cap(self, chunk: str, rest: str):
+        """Split `chunk` at a line break or space so it fits `max_chunk_chars`."""
+        limit = self.max_chunk_chars
+        if len(chunk) <= limit:
+            return chunk, rest
+        cut = chunk.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = chunk.rfind(" ", 0, limit)
+        if cut <= 0:
+            cut = limit
+        overflow = chunk[cut:].strip()
+        return chunk[:cut].strip(), overflow + (" " + rest if rest.strip() else rest)
+
+
+def _is_word(ch: str) -> bool:
+    """True for the characters the regex class \\w matches."""
+    return ch.isalnum() or ch == "_"
+
+
+class StreamingSentenceChunker:
+    """Incremental sentence chunker for one streamed reply
+
+    `feed()` takes each delta as it arrives and returns the chunks it completes;
+    `flush()` returns what is left once the reply has ended. Each character is looked
+    at once, when it arrives, and confirmed sentence ends are kept as offsets into the
+    unsent text, so the work per delta does not grow with the length of the reply.
+
+    Chunk sizes follow `SentenceChunker.next_chunks`, and so do sentence ends: a
+    ".", "!" or "?" directly followed by whitespace and an upper-case A-Z letter,
+    with the same abbreviation and initial exceptions. For a complete reply the
+    chunks are the ones `next_chunks(text)` returns, followed by those of the final
+    call on the text it leaves (up to the whitespace between sentences, which is
+    kept rather than joined with a space).
+    While streaming, a sentence end is only confirmed once the next word has
+    started, whereas `next_chunks` re-run on each delta may cut at "U.S. " before
+    it sees the "team" that follows.
+    """
+
+    FIRST_CHUNK_MIN_CHARS = SentenceChunker.FIRST_CHUNK_MIN_CHARS
+    CHUNK_SENTENCES = SentenceChunker.CHUNK_SENTENCES
+    MAX_CHUNK_CHARS = SentenceChunker.MAX_CHUNK_CHARS
+    CLAUSE_MARKS = ",;:–—"
+    # split_sentences' test for a finished last sentence
+    _TERMINATED = re.compile(r"[.!?]['\"\)\]]*\s*$")
+
+    def __init__(self, max_chunk_chars: int = MAX_CHUNK_CHARS):
+        self.max_chunk_chars = max_chunk_chars
+        self.reset()
+
+    def reset(self):
+        """Forget the current reply."""
+        self.chunks_sent = 0
+        self._buf = ""  # text received but not sent yet
+        self._scanned = 0  # offset of the first character not looked at yet
+        self._bounds = []  # offsets just past confirmed sentence ends
+        self._clause = None  # offset past the first clause long enough to send
+        self._clause_mark = None  # offset past a clause mark, until whitespace follows
+        self._stop = None  # offset past terminal punctuation, until the next word
+        self._gap = False  # whitespace has followed self._stop
+
+    @property
+    def pending(self) -> bool:
+        """True if there is unsent text."""
+        return bool(self._buf.strip())
+
+    def feed(self, delta: str):
+        """
+        Adds streamed text and returns the chunks that became ready to speak.
+        """
+        if delta:
+            self._buf += delta
+            self._scan()
+        return self._emit(final=False)
+
+    def flush(self):
+        """
+        Returns the remaining chunks of a finished reply and resets for the next one.
+        """
+        chunks = self._emit(final=True)
+        self.reset()
+        return chunks
+
+    def _scan(self):
+        buf = self._buf
+        for i in range(self._scanned, len(buf)):
+            ch = buf[i]
+            if ch.isspace():
+                if self._stop is not None:
+                    self._gap = True
+                if (
+                    self._clause_mark == i
+                    and self._clause is None
+                    and self.chunks_sent == 0
+                    and i >= self.FIRST_CHUNK_MIN_CHARS
+                ):
+                    self._clause = i
+                continue
+            if self._stop is not None:
+                if self._gap and "A" <= ch <= "Z" and self._is_sentence_end(self._stop):
+                    self._bounds.append(self._stop)
+                # Otherwise "3.14", "example.com", '"Hi." he', "2. Run": no break
+                self._stop = None
+                self._gap = False
+            if ch in ".!?":
+                self._stop = i + 1
+            elif ch in self.CLAUSE_MARKS:
+                self._clause_mark = i + 1
+        self._scanned = len(buf)
+
+    def _is_sentence_end(self, end: int) -> bool:
+        # The same exceptions as SentenceChunker.sentence_pattern
+        buf = self._buf
+        p = end - 1
+        before = buf[max(0, p - 3) : p]
+        if len(before) == 3 and before[1] == "." and _is_word(before[0]) and _is_word(before[2]):
+            return False  # "e.g.", "x.y?"
+        if buf[p] != ".":
+            return True
+        if "A" <= before[-1:] <= "Z":
+            return False  # "J."
+        if len(before) >= 2 and "A" <= before[-2] <= "Z" and "a" <= before[-1] <= "z":
+            return False  # "Mr."
+        start = p
+        while start > 0 and not buf[start - 1].isspace():
+            start -= 1
+        word = buf[start : p + 1]
+        # split_sentences protects abbreviations wherever they occur, even in a word
+        return not any(word.endswith(abbr) for abbr in ABBREVIATIONS)
+
+    def _emit(self, final: bool):
+        if final:
+            # A finished last sentence counts as one, as in split_sentences
+            end = len(self._buf.rstrip())
+            last = self._bounds[-1] if self._bounds else 0
+            if end > last and self._TERMINATED.search(self._buf, last, end):
+                self._bounds.append(end)
+        chunks = []
+        while True:
+            end = self._next_cut(final)
+            if end is None:
+                return chunks
+            chunk = self._buf[:end].strip()
+            self._consume(end)
+            if chunk:
+                chunks.append(chunk)
+                self.chunks_sent += 1
+
+    def _next_cut(self, final: bool):
+        bounds = self._bounds
+        end = None
+        if self.chunks_sent == 0:
+            if self._clause is not None and (not bounds or self._clause < bounds[0]):
+                end = self._clause
+            elif bounds:
+                end = bounds[0]
+        else:
+            sizes = self.CHUNK_SENTENCES
+            wanted = sizes[min(self.chunks_sent - 1, len(sizes) - 1)]
+            if len(bounds) >= wanted or (final and bounds):
+                taken = min(wanted, len(bounds))
+                while taken > 1 and bounds[taken - 1] > self.max_chunk_chars:
+                    taken -= 1
+                end = bounds[taken - 1]
+        if end is None:
+            if final and self._buf:
+                end = len(self._buf)
+            elif len(self._buf.lstrip()) > self.max_chunk_chars:
+                # Unpunctuated text: stop it from building up an unbounded chunk
+                end = len(self._buf)
+            else:
+                return None
+        return self._cap(end)
+
+    def _cap(self, end: int) -> int:
+        """Move `end` back to a line break or space so the chunk fits."""
+        buf = self._buf
+        start = 0
+        while start < end and buf[start].isspace():
+            start += 1
+        limit = start + self.max_chunk_chars
+        if end <= limit:
+            return end
+        cut = buf.rfind("\n", start, limit)
+        if cut <= start:
+            cut = buf.rfind(" ", start, limit)
+        if cut <= start:
+            cut = limit
+        return cut
+
+    def _consume(self, end: int):
+        self._buf = self._buf[end:]
+        self._scanned -= end
+        self._bounds = [b - end for b in self._bounds if b > end]
+        if self._clause is not None:
+            self._clause = self._clause - end if self._clause > end else None
+        if self._clause_mark is not None:
+            self._clause_mark = self._clause_mark - end if self._clause_mark > end else None
+        if self._stop is not None and self._stop <= end:
+            self._stop = None
+            self._gap = False
+        elif self._stop is not None:
+            self._stop -= end
+
+
+class AudioStream:
+    """PCM audio for one chunk, written by the synthesis thread while it is played."""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.finished = False
+        self.cancelled = False
+        self.error = None
+        self._blocks = deque()
+        self._size = 0
+        self._cond = threading.Condition()
+
+    def write(self, data: bytes):
+        with self._cond:
+            if self.cancelled:
+                return
+            self._blocks.append(data)
+            self._size += len(data)
+            self._cond.notify_all()
+
+    def close(self, error: Optional[Exception] = None):
+        with self._cond:
+            self.finished = True
+            self.error = error
+            self._cond.notify_all()
+
+    def cancel(self):
+        """Drop buffered audio and end the stream at once; later writes are ignored."""
+        with self._cond:
+            self.cancelled = True
+            self.finished = True
+            self._blocks.clear()
+            self._size = 0
+            self._cond.notify_all()
+
+    def wait_started(self, timeout: Optional[float] = None) -> bool:
+        """Block until the first bytes arrive or the stream ends; True if there is audio."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._blocks or self.finished, timeout)
+            return bool(self._blocks)
+
+    def read(self, min_bytes: int = 1, timeout: Optional[float] = None) -> Optional[bytes]:
+        """
+        Returns the buffered bytes once at least `min_bytes` are available (or the
+        stream has ended), b"" on timeout, or None at end of stream.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._size >= min_bytes or self.finished, timeout)
+            if not self._blocks:
+                return None if self.finished else b""
+            data = b"".join(self._blocks)
+            self._blocks.clear()
+            self._size = 0
+            return data
+
 
 class TTSService(QObject):
-    """Persistent TTS service that stays active for the app lifetime"""
+    """Persistent TTS service that stays active for the app lifetime
+
+    Chunks are synthesized by a bounded pool of concurrent requests, and the audio
+    is handed to playback strictly in the order the chunks were added. With
+    `stream_audio` on, speech is played as the bytes arrive, so a chunk starts
+    playing after its first network packet rather than once it has been fully
+    synthesized.
+
+    Each chunk goes to the backend (`tts_backends`) the selector picks: the active
+    one while it keeps up, the fastest healthy one when it degrades. A chunk whose
+    backend fails before sending audio is retried on the next one.
+
+    All audio goes through one continuous `audio_output.AudioOutput` stream at the
+    device's native rate, so chunks play back to back without gaps. Speech is
+    decoded and resampled to that rate in the synthesis pool as it arrives, so the
+    playback thread only copies ready buffers.
+
+    The worker threads only ever block on queues, conditions and output markers, so
+    an idle service makes no wakeups and start/stop take effect at once. Shutdown
+    sends an end-of-stream sentinel down the queues, and each worker forwards it to
+    the next before exiting.
+    """
+
+    # Default number of speech requests allowed in flight at once
+    MAX_IN_FLIGHT = 3
 
     error_occurred = pyqtSignal(str)
     chunk_generated = pyqtSignal(str)  # Signal when chunk audio is ready
@@ -121,28 +497,83 @@ class TTSService(QObject):
     playback_stopped = pyqtSignal()
     playback_finished = pyqtSignal()
     queue_status_changed = pyqtSignal(int)  # Number of items in queue
-
-    def __init__(self, api_key: str):
+    chunk_timing = pyqtSignal(dict)  # Timing record of a finished chunk (tts_metrics)
+
+    def __init__(
+        self,
+        api_key: str,
+        max_in_flight: int = MAX_IN_FLIGHT,
+        output_latency=audio_output.DEFAULT_LATENCY,
+        backends: Optional[List[tts_backends.TTSBackend]] = None,
+    ):
         super().__init__()
-        self.client = OpenAI(api_key=api_key)
+        self.client = http_transport.get_openai_client(api_key)
+        # Speech backends in order of preference, chosen per reply by latency and health
+        self.backends = tts_backends.BackendSelector(
+            backends or tts_backends.default_backends(self.client)
+        )
         self.chunker = SentenceChunker()
-
-        # Service state
+        self.max_in_flight = max(1, max_in_flight)
+
+        # Speech settings (for the OpenAI backend); all of them are part of the cache key
+        self.tts_model = "gpt-4o-mini-tts"
+        self.voice = "coral"
+        self.speed = 1.0
+        # Anything but "pcm" is fetched whole, then decoded (needs soundfile)
+        self.response_format = "pcm"
+        # Play speech as it downloads (pcm, or mp3 with soundfile); False waits for
+        # each chunk's full audio
+        self.stream_audio = True
+        # Synthesized audio is reused for re-reads and recurring phrases
+        self.cache = tts_cache.TTSCache()
+
+        # Service state; changes to it are signalled through _state
         self.is_service_active = True
         self.is_playing = False
         self.should_stop_playback = False
-
-        # Queues
-        self.chunk_input_queue = queue.Queue()  # Text chunks to process
-        self.audio_queue = queue.Queue()  # Generated audio data
+        self._state = threading.Condition()
+
+        # Queues; every item carries the epoch it was added in, and chunks their timing
+        self.chunk_input_queue = queue.Queue()  # (epoch, text, timing) to process
+        self.pending_queue = queue.Queue()  # (epoch, text, future, stream, timing) in order
+        # (epoch, samples / AudioStream / Marker / None, timing or None)
+        self.audio_queue = queue.Queue()
+        # Per-chunk stage timings, logged to tts_metrics.DEFAULT_LOG_PATH
+        self.metrics = tts_metrics.TTSMetrics(on_record=self.chunk_timing.emit)
+
+        # Concurrent synthesis: the semaphore bounds requests in flight. Each stop
+        # starts a new epoch; requests from an older one are aborted and their
+        # results dropped wherever they have got to.
+        self.synthesis_pool = ThreadPoolExecutor(
+            max_workers=self.max_in_flight, thread_name_prefix="TTSSynthesis"
+        )
+        self._in_flight = threading.BoundedSemaphore(self.max_in_flight)
+        self._pending_count = 0
+        self._pending_lock = threading.Lock()
+        self._epoch = 0
+        # Replies are numbered so that each keeps one voice: its backend is chosen
+        # when its first chunk is dispatched, and only changes on a failure before
+        # any of its audio has been heard.
+        self._reply = 0
+        self._complete_reply = (None, None)  # (reply, its whole text) when known upfront
+        self._backend_reply = None
+        self._reply_backend = None
+        self._reply_heard = False
+        self._streams = set()  # AudioStreams still downloading, cancelled on stop
+        self._responses = set()  # Open speech responses, closed on stop
+        # Output marker for the end of the queued audio, once nothing else is pending
+        self._drain_marker = None
 
         # Worker threads
         self.generation_thread = None
+        self.ordering_thread = None
         self.playback_thread = None
 
-        # Initialize pygame mixer
-        pygame.mixer.init(frequency=22050, size=-16, channels=2, buffer=512)
-        logger.info("Pygame mixer initialized.")
+        # One long-lived output stream for the whole session
+        self.output = audio_output.AudioOutput(
+            sample_rate=audio_output.native_sample_rate(), latency=output_latency
+        )
+        self.output.start()
 
         # Tone setting for TTS Model
         self.TTS_instructions = None
@@ -158,6 +589,13 @@ class TTSService(QObject):
             self.generation_thread.start()
             logger.info("Generation worker thread started.")
 
+        if self.ordering_thread is None or not self.ordering_thread.is_alive():
+            self.ordering_thread = threading.Thread(
+                target=self._ordering_worker, daemon=True, name="TTSOrderingWorker"
+            )
+            self.ordering_thread.start()
+            logger.info("Ordering worker thread started.")
+
         if self.playback_thread is None or not self.playback_thread.is_alive():
             self.playback_thread = threading.Thread(
                 target=self._playback_worker, daemon=True, name="TTSPlaybackWorker"
@@ -166,75 +604,190 @@ class TTSService(QObject):
             logger.info("Playback worker thread started.")
 
     def _generation_worker(self):
-        """Persistent thread that processes chunks sequentially"""
+        """Persistent thread that dispatches chunks to the synthesis pool in order"""
         logger.info("Generation worker started and waiting for chunks.")
 
-        while self.is_service_active:
+        while True:
+            item = self.chunk_input_queue.get()
+            if item is _END_OF_STREAM:
+                self.pending_queue.put(_END_OF_STREAM)
+                break
+            epoch, chunk_text, timing = item
+
             try:
-                # Get next chunk text (blocking with timeout)
-                chunk_text = self.chunk_input_queue.get(timeout=1.0)
+                # Wait for a free synthesis slot; keeps at most max_in_flight requests open
+                self._in_flight.acquire()
+                if epoch != self._epoch or not self.is_service_active:
+                    # Stopped since the chunk was added
+                    self._in_flight.release()
+                    continue
 
-                if not self.is_service_active:
-                    break
+                with self._pending_lock:
+                    self._pending_count += 1
+                timing.dispatched_at = time.perf_counter()
+                settings = self._speech_settings()
+                backend = self._backend_for_reply(timing.reply, chunk_text, settings)
+                timing.backend = backend.name
+                cached = self.cache.get(backend.cache_key(chunk_text, settings))
+                if cached is not None:
+                    logger.info(f"TTS cache hit for chunk: {chunk_text[:60]}...")
+                    self._reply_audio_started(timing.reply)
+                    timing.source = "cache"
+                    timing.bytes = len(cached)
+                    stream = None
+                    future = self.synthesis_pool.submit(
+                        self._decode_audio, cached, backend.speech_format(settings), timing
+                    )
+                    self.pending_queue.put((epoch, chunk_text, future, stream, timing))
+                    continue
 
-                logger.info(f"Generating audio for chunk: {chunk_text[:60]}...")
+                logger.info(
+                    f"Dispatching audio generation to {backend.name} for chunk: "
+                    f"{chunk_text[:60]}..."
+                )
+                timing.source = "network"
+                response_format = backend.speech_format(settings)
+                if self.stream_audio and audio_decode.can_stream(response_format):
+                    stream = AudioStream(chunk_text)
+                    with self._pending_lock:
+                        self._streams.add(stream)
+                    future = self.synthesis_pool.submit(
+                        self._stream_audio, stream, epoch, timing, backend, settings
+                    )
+                else:
+                    stream = None
+                    future = self.synthesis_pool.submit(
+                        self._generate_audio, chunk_text, epoch, timing, backend, settings
+                    )
+                self.pending_queue.put((epoch, chunk_text, future, stream, timing))
+            except Exception as e:
+                if self.is_service_active:
+                    logger.error(f"Chunk generation error: {str(e)}")
+                    self.error_occurred.emit(f"Chunk generation error: {str(e)}")
+            finally:
+                # Mark task as done
+                self.chunk_input_queue.task_done()
 
-                # Generate audio for this chunk
-                audio_data = self._generate_audio(chunk_text)
-                if audio_data is not None:
-                    self.audio_queue.put(audio_data)
-                    self.chunk_generated.emit(chunk_text[:60] + "...")
-                    logger.info("Audio chunk generated and queued.")
+        logger.info("Generation worker exiting.")
 
-                # Update queue status
-                self.queue_status_changed.emit(self.get_total_queue_size())
+    def _ordering_worker(self):
+        """Persistent thread that queues synthesized audio in the original chunk order"""
+        logger.info("Ordering worker started.")
 
-                # Mark task as done
-                self.chunk_input_queue.task_done()
+        while True:
+            item = self.pending_queue.get()
+            if item is _END_OF_STREAM:
+                self.audio_queue.put(_END_OF_STREAM)
+                break
+            epoch, chunk_text, future, stream, timing = item
 
-            except queue.Empty:
-                # No chunks available, continue waiting
-                continue
+            try:
+                # Later chunks may already be done; they wait here until their turn.
+                # A stream is queued for playback as soon as its first bytes arrive.
+                if stream is not None:
+                    audio_data = stream if stream.wait_started() else None
+                else:
+                    audio_data = future.result()
+                if epoch != self._epoch:
+                    logger.info("Discarding audio generated before playback was stopped.")
+                    self.metrics.record(timing, "cancelled")
+                elif audio_data is not None:
+                    timing.ready_at = time.perf_counter()
+                    self.audio_queue.put((epoch, audio_data, timing))
+                    self.chunk_generated.emit(chunk_text[:60] + "...")
+                    logger.info("Audio chunk generated and queued.")
+                else:
+                    self.metrics.record(timing, "failed")
             except Exception as e:
+                self.metrics.record(timing, "failed")
                 if self.is_service_active:
                     logger.error(f"Chunk generation error: {str(e)}")
                     self.error_occurred.emit(f"Chunk generation error: {str(e)}")
+            finally:
+                if stream is not None:
+                    # The synthesis slot stays taken until the download completes
+                    wait_for_futures([future])
+                with self._pending_lock:
+                    self._pending_count -= 1
+                    self._streams.discard(stream)
+                self._in_flight.release()
+                # The chunk no longer counts as pending; if it was the last one (or
+                # failed), playback can now tell that the reply is over
+                self.audio_queue.put((epoch, None, None))
+                # Update queue status
+                self.queue_status_changed.emit(self.get_total_queue_size())
 
-        logger.info("Generation worker exiting.")
+        logger.info("Ordering worker exiting.")
 
     def _playback_worker(self):
         """Persistent thread for audio playback"""
         logger.info("Playback worker started and waiting for audio.")
 
-        while self.is_service_active:
-            try:
-                if not self.is_playing:
-                    time.sleep(0.1)  # Wait for play command
-                    continue
-
-                # Get next audio chunk (blocking with timeout)
-                audio_data = self.audio_queue.get(timeout=1.0)
+        while True:
+            item = self.audio_queue.get()
+            if item is _END_OF_STREAM:
+                break
+            epoch, audio_data, timing = item
 
-                if not self.is_service_active or self.should_stop_playback:
+            try:
+                if isinstance(audio_data, audio_output.Marker):
+                    # The output played everything queued before the marker
+                    if audio_data is self._drain_marker:
+                        self._drain_marker = None
+                        if (
+                            not audio_data.cancelled
+                            and epoch == self._epoch
+                            and self.is_playing
+                            and self.get_total_queue_size() == 0
+                        ):
+                            logger.info("All queues empty, finishing playback.")
+                            self._finish_playback()
                     continue
 
-                # Play the audio chunk
-                logger.info("Playing audio chunk.")
-                self._play_audio_chunk(audio_data)
-
-                # Update queue status
-                self.queue_status_changed.emit(self.get_total_queue_size())
+                if audio_data is not None:
+                    # Audio waits here until playback is started (or dropped on stop)
+                    with self._state:
+                        self._state.wait_for(
+                            lambda: self.is_playing
+                            or epoch != self._epoch
+                            or not self.is_service_active
+                        )
+                    if epoch != self._epoch or not self.is_service_active:
+                        self.metrics.record(timing, "cancelled")
+                        continue
+
+                    # Queue the audio chunk right behind the previous one
+                    logger.info("Playing audio chunk.")
+                    self._drain_marker = None
+                    # The chunk is heard once the output reaches its first sample
+                    start = self.output.mark()
+                    start.add_done_callback(lambda m, t=timing: self._chunk_audible(t, m))
+                    self._play_audio_chunk(audio_data)
+                    frames = self.output.written_frames - start.position
+                    timing.audio_seconds = frames / self.output.sample_rate
+                    if epoch != self._epoch:
+                        timing.played_at = time.perf_counter()
+                        self.metrics.record(timing, "interrupted")
+                    else:
+                        # ...and has played out once it reaches the last one
+                        self.output.mark().add_done_callback(
+                            lambda m, t=timing: self._chunk_played(t, m)
+                        )
+
+                    # Update queue status
+                    self.queue_status_changed.emit(self.get_total_queue_size())
 
-            except queue.Empty:
-                # No audio available, check if we should finish
                 if (
                     self.is_playing
-                    and self.audio_queue.empty()
-                    and self.chunk_input_queue.empty()
+                    and self._drain_marker is None
+                    and self.get_total_queue_size() == 0
                 ):
-                    logger.info("All queues empty, finishing playback.")
-                    self._finish_playback()
-                continue
+                    # Everything is in the output buffer; finish once it has played
+                    marker = self.output.mark()
+                    self._drain_marker = marker
+                    marker.add_done_callback(
+                        lambda m, f=epoch: self.audio_queue.put((f, m, None))
+                    )
             except Exception as e:
                 if self.is_service_active:
                     logger.error(f"Playback error: {str(e)}")
@@ -242,50 +795,284 @@ class TTSService(QObject):
 
         logger.info("Playback worker exiting.")
 
-    def _generate_audio(self, text: str) -> Optional[bytes]:
-        """Generate audio for a single chunk"""
-        if not self.is_service_active:
+    def _chunk_audible(self, timing: tts_metrics.ChunkTiming, marker: audio_output.Marker):
+        # Runs on the audio thread (or the one that cleared the output)
+        if not marker.cancelled:
+            timing.play_started_at = time.perf_counter()
+
+    def _chunk_played(self, timing: tts_metrics.ChunkTiming, marker: audio_output.Marker):
+        timing.played_at = time.perf_counter()
+        self.metrics.record(timing, "interrupted" if marker.cancelled else "played")
+
+    def _speech_settings(self) -> dict:
+        """Speech settings handed to the backends (as for `audio.speech.create`)"""
+        return dict(
+            model=self.tts_model,
+            voice=self.voice,
+            speed=self.speed,
+            response_format=self.response_format,
+            instructions=self.TTS_instructions,  # You can customize this string as needed
+        )
+
+    def _backend_for_reply(
+        self, reply: int, text: str, settings: dict
+    ) -> tts_backends.TTSBackend:
+        """The backend speaking `reply`, chosen when its first chunk comes through"""
+        with self._pending_lock:
+            if reply == self._backend_reply:
+                return self._reply_backend
+        # A re-read keeps the voice it was first spoken in, straight from the cache
+        backend = next(
+            (
+                b
+                for b in self.backends.backends
+                if b.cache_key(text, settings) in self.cache
+            ),
+            None,
+        )
+        if backend is None:
+            # A short complete reply may go to the offline backend; a streamed one
+            # is never known to be short, so it is not split across voices
+            complete_reply, complete_text = self._complete_reply
+            backend = self.backends.choose(
+                text=complete_text if complete_reply == reply else None
+            )
+        with self._pending_lock:
+            self._backend_reply = reply
+            self._reply_backend = backend
+            self._reply_heard = False
+        return backend
+
+    def _reply_audio_started(self, reply: int):
+        """From now on the reply's voice is fixed, even if its backend fails"""
+        with self._pending_lock:
+            if reply == self._backend_reply:
+                self._reply_heard = True
+
+    def _reply_fallback(
+        self,
+        reply: int,
+        tried: List[tts_backends.TTSBackend],
+        accept=None,
+    ) -> Optional[tts_backends.TTSBackend]:
+        """The backend to retry a failed chunk on, or None to keep the reply's voice"""
+        with self._pending_lock:
+            if reply != self._backend_reply:
+                return None
+            current = self._reply_backend
+            if current not in tried and (accept is None or accept(current)):
+                # Another chunk of the reply has already moved it to a new backend
+                return current
+            if self._reply_heard:
+                return None
+        fallback = self.backends.choose(exclude=tried, accept=accept)
+        with self._pending_lock:
+            if fallback is not None and reply == self._backend_reply and not self._reply_heard:
+                self._reply_backend = fallback
+        return fallback
+
+    def _decode_audio(
+        self,
+        data: bytes,
+        response_format: str,
+        timing: Optional[tts_metrics.ChunkTiming] = None,
+    ):
+        """Speech response bytes as int16 samples at the output rate"""
+        samples, rate = audio_decode.decode(data, response_format)
+        samples = audio_decode.resample(samples, rate, self.output.sample_rate)
+        if timing is not None:
+            timing.synthesized_at = time.perf_counter()
+        return samples
+
+    def _is_current(self, epoch: int) -> bool:
+        return epoch == self._epoch and self.is_service_active
+
+    def _download_speech(
+        self,
+        text: str,
+        epoch: int,
+        timing: tts_metrics.ChunkTiming,
+        backend: tts_backends.TTSBackend,
+        settings: dict,
+        on_data=None,
+    ) -> Optional[bytes]:
+        """Download speech for `text` from `backend`, passing each block to `on_data`
+
+        Returns the complete audio (also stored in the cache), or None if the epoch
+        ended first. A stop closes the response, so the connection is dropped even
+        while the server is still synthesizing.
+        """
+        parts = []
+        requested_at = time.perf_counter()
+        try:
+            with backend.stream(text, settings) as response:
+                with self._pending_lock:
+                    self._responses.add(response)
+                try:
+                    for data in response.iter_bytes(STREAM_READ_SIZE):
+                        if not self._is_current(epoch):
+                            break
+                        if timing.first_byte_at is None:
+                            timing.first_byte_at = time.perf_counter()
+                            self.backends.record_latency(
+                                backend, timing.first_byte_at - requested_at
+                            )
+                            self._reply_audio_started(timing.reply)
+                        timing.bytes += len(data)
+                        if on_data is not None:
+                            on_data(data)
+                        parts.append(data)
+                finally:
+                    with self._pending_lock:
+                        self._responses.discard(response)
+        except Exception:
+            if self._is_current(epoch):
+                raise
+        if not self._is_current(epoch):
+            logger.info(f"TTS request cancelled: {text[:60]}...")
+            return None
+        audio = b"".join(parts)
+        self.backends.record_usage(backend, text, settings)
+        self.cache.put(backend.cache_key(text, settings), audio)
+        return audio
+
+    def _synthesize(
+        self,
+        text: str,
+        epoch: int,
+        timing: tts_metrics.ChunkTiming,
+        backend: tts_backends.TTSBackend,
+        settings: dict,
+        on_data_for=None,
+    ):
+        """Download speech, moving on to another backend if one fails before any audio
+
+        A chunk only moves while none of its reply has been heard, so that a reply
+        is never spoken in two voices.
+
+        `on_data_for(backend)` returns the `on_data` callback for a backend's format.
+        Returns (audio or None, the backend that produced it).
+        """
+        tried = []
+        while True:
+            tried.append(backend)
+            on_data = on_data_for(backend) if on_data_for is not None else None
+            try:
+                audio = self._download_speech(text, epoch, timing, backend, settings, on_data)
+                return audio, backend
+            except Exception as e:
+                self.backends.record_failure(backend, e)
+                if timing.first_byte_at is not None or not self._is_current(epoch):
+                    raise
+                # Streamed chunks can only switch to a backend that also streams
+                accept = None
+                if on_data_for is not None:
+                    accept = lambda b: audio_decode.can_stream(b.speech_format(settings))
+                fallback = self._reply_fallback(timing.reply, tried, accept)
+                if fallback is None:
+                    raise
+                logger.warning(f"Retrying chunk with the {fallback.name} TTS backend.")
+                backend = fallback
+                timing.backend = backend.name
+
+    def _generate_audio(
+        self,
+        text: str,
+        epoch: int,
+        timing: tts_metrics.ChunkTiming,
+        backend: tts_backends.TTSBackend,
+        settings: dict,
+    ):
+        """Generate audio for a single chunk, decoded for the output"""
+        if not self._is_current(epoch):
             return None
 
         try:
             logger.info(f"Requesting TTS for: {text[:60]}...")
-            response = self.client.audio.speech.create(
-                model="gpt-4o-mini-tts",
-                voice="coral",
-                input=text,
-                speed=1.0,
-                response_format="mp3",
-                instructions=self.TTS_instructions,  # You can customize this string as needed
-            )
-            logger.info("TTS audio received from OpenAI.")
-            return response.content
+            audio, backend = self._synthesize(text, epoch, timing, backend, settings)
+            if audio is None:
+                return None
+            logger.info(f"TTS audio received from {backend.name}.")
+            return self._decode_audio(audio, backend.speech_format(settings), timing)
         except Exception as e:
             logger.error(f"Audio generation failed: {str(e)}")
             self.error_occurred.emit(f"Audio generation failed: {str(e)}")
             return None
 
-    def _play_audio_chunk(self, audio_data: bytes):
-        """Play a single audio chunk"""
+    def _stream_audio(
+        self,
+        stream: AudioStream,
+        epoch: int,
+        timing: tts_metrics.ChunkTiming,
+        backend: tts_backends.TTSBackend,
+        settings: dict,
+    ):
+        """Download speech for a chunk into `stream` as the bytes arrive
+
+        Blocks are decoded and resampled to the output rate on the way in, so
+        `stream` only ever holds whole samples ready to be written to the output.
+        """
+        error = None
+        decoders = []
+
+        def on_data_for(backend):
+            decoder = audio_decode.stream_decoder(
+                backend.speech_format(settings), self.output.sample_rate
+            )
+            decoders.append(decoder)
+
+            def on_data(data):
+                pcm = decoder.process(data)
+                if pcm is not None and len(pcm):
+                    stream.write(bytes(pcm))
+
+            return on_data
+
+        try:
+            if self._is_current(epoch):
+                logger.info(f"Requesting streamed TTS for: {stream.text[:60]}...")
+                audio, _ = self._synthesize(
+                    stream.text, epoch, timing, backend, settings, on_data_for
+                )
+                if audio is not None:
+                    pcm = decoders[-1].flush()
+                    if pcm is not None and len(pcm):
+                        stream.write(bytes(pcm))
+                    timing.synthesized_at = time.perf_counter()
+                    logger.info("Streamed TTS audio complete.")
+        except Exception as e:
+            error = e
+            logger.error(f"Audio generation failed: {str(e)}")
+            self.error_occurred.emit(f"Audio generation failed: {str(e)}")
+        finally:
+            stream.close(error)
+
+    def _play_audio_stream(self, stream: AudioStream):
+        """Write a PCM stream to the output as its bytes arrive"""
+        while self.is_service_active and not self.should_stop_playback:
+            # Blocks until bytes arrive; stop cancels the stream, which ends the read
+            data = stream.read()
+            if data is None:
+                break
+            self.output.write(data)
+        if stream.error is not None and not self.should_stop_playback:
+            logger.warning("Streamed chunk ended early after a download error.")
+
+    def _play_audio_chunk(self, audio_data):
+        """Queue a single audio chunk (decoded samples or an AudioStream) for output
+
+        Returns once the chunk is in the output buffer, so the next chunk can be
+        queued directly behind it with no gap.
+        """
         if not self.is_service_active or self.should_stop_playback:
             return
 
         try:
-            # Load audio data into pygame
-            audio_file = io.BytesIO(audio_data)
-            pygame.mixer.music.load(audio_file)
-            pygame.mixer.music.play()
-            logger.info("Audio chunk loaded and playback started.")
-
-            # Wait for playback to complete (non-blocking check)
-            while (
-                pygame.mixer.music.get_busy()
-                and not self.should_stop_playback
-                and self.is_service_active
-            ):
-                time.sleep(0.05)  # Shorter sleep for more responsive stopping
-
-            logger.info("Audio chunk playback finished.")
-
+            if isinstance(audio_data, AudioStream):
+                self._play_audio_stream(audio_data)
+            else:
+                self.output.write(audio_data)
+            logger.info("Audio chunk queued for output.")
         except Exception as e:
             if self.is_service_active:
                 logger.error(f"Exception during audio playback: {str(e)}")
@@ -293,8 +1080,10 @@ class TTSService(QObject):
 
     def _finish_playback(self):
         """Called when playback naturally finishes"""
-        self.is_playing = False
-        self.should_stop_playback = False
+        with self._state:
+            self.is_playing = False
+            self.should_stop_playback = False
+            self._state.notify_all()
         self.playback_finished.emit()
         logger.info("Playback naturally finished.")
 
@@ -305,7 +1094,10 @@ class TTSService(QObject):
             return
 
         logger.info(f"Adding chunk to queue: {chunk_text[:60]}...")
-        self.chunk_input_queue.put(chunk_text)
+        epoch = self._epoch
+        self.chunk_input_queue.put(
+            (epoch, chunk_text, tts_metrics.ChunkTiming(chunk_text, epoch, self._reply))
+        )
         self.queue_status_changed.emit(self.get_total_queue_size())
         logger.info(f"Queue size: {self.get_total_queue_size()}")
 
@@ -315,11 +1107,13 @@ class TTSService(QObject):
             logger.warning("Cannot add text: service is not active.")
             return
 
-        chunks, _ = self.chunker.create_chunks(text, 3)
+        chunks, _ = self.chunker.next_chunks(text, final=True)
         logger.info(f"Text split into {len(chunks)} chunks.")
 
+        self.start_reply(text)
         for chunk in chunks:
             self.add_chunk(chunk)
+        return chunks
 
     def start_playback(self):
         """Start playing queued audio"""
@@ -332,34 +1126,77 @@ class TTSService(QObject):
             return
 
         logger.info("Starting playback.")
-        self.is_playing = True
-        self.should_stop_playback = False
+        with self._state:
+            self.is_playing = True
+            self.should_stop_playback = False
+            self._state.notify_all()
         self.playback_started.emit()
+        # Audio may all have been queued before the start; check for the end of it
+        self.audio_queue.put((self._epoch, None, None))
+
+    def start_reply(self, text: Optional[str] = None):
+        """Chunks added from now on belong to a new reply, which may use another backend
+
+        Pass the reply's `text` when it is already complete (a status phrase, a
+        re-read); only then can a short reply go to the offline backend.
+        """
+        self._reply += 1
+        self._complete_reply = (self._reply, text)
+
+    @property
+    def epoch(self) -> int:
+        """Current epoch; it advances on every stop."""
+        return self._epoch
 
     def stop_playback(self):
-        """Stop playback and clear queues"""
-        if not self.is_playing:
+        """Stop playback, cancel synthesis in flight and clear queues
+
+        Also used for barge-in: it is safe to call before playback has started, and
+        then cancels the chunks still being synthesized.
+        """
+        was_playing = self.is_playing
+        if not was_playing and not self.get_total_queue_size():
             logger.info("Playback is not currently running.")
             return
 
         logger.info("Stopping playback and clearing queues.")
-        self.should_stop_playback = True
-        self.is_playing = False
+        self._halt()
+
+        self.queue_status_changed.emit(0)
+        if was_playing:
+            self.playback_stopped.emit()
+
+    def _halt(self):
+        """Silence the output and drop everything queued or still downloading"""
+        with self._state:
+            self.should_stop_playback = True
+            self.is_playing = False
+            # New epoch: audio still being synthesized is dropped when it arrives
+            self._epoch += 1
+            self._reply += 1
+            self._state.notify_all()
 
         # Stop current audio playback
         try:
-            pygame.mixer.music.stop()
+            self.output.clear()
             logger.info("Audio playback stopped.")
         except Exception as e:
             logger.warning(f"Exception while stopping playback: {str(e)}")
 
-        # Clear queues
+        with self._pending_lock:
+            streams = list(self._streams)
+            responses = list(self._responses)
+        for stream in streams:
+            stream.cancel()
+        for response in responses:
+            # Aborts the download; its worker sees the new epoch and gives up quietly
+            try:
+                response.close()
+            except Exception as e:
+                logger.debug(f"Error closing a cancelled TTS response: {e}")
         self._clear_queue(self.audio_queue)
         self._clear_queue(self.chunk_input_queue)
 
-        self.queue_status_changed.emit(0)
-        self.playback_stopped.emit()
-
     def _clear_queue(self, q):
         """Clear all items from a queue"""
         try:
@@ -369,31 +1206,32 @@ class TTSService(QObject):
             pass
 
     def get_total_queue_size(self):
-        """Get total number of items in all queues"""
-        return self.chunk_input_queue.qsize() + self.audio_queue.qsize()
+        """Get total number of items in all queues, including chunks being synthesized"""
+        with self._pending_lock:
+            pending = self._pending_count
+        return self.chunk_input_queue.qsize() + pending + self.audio_queue.qsize()
 
     def shutdown(self):
         """Shutdown the service"""
         logger.info("Shutting down TTS service.")
         self.is_service_active = False
-        self.should_stop_playback = True
-        self.is_playing = False
-
-        # Stop current playback
-        try:
-            pygame.mixer.music.stop()
-        except Exception:
-            pass
-
-        # Clear queues
-        self._clear_queue(self.audio_queue)
-        self._clear_queue(self.chunk_input_queue)
+        self._halt()
+        # Each worker passes the sentinel on to the next one and exits
+        self.chunk_input_queue.put(_END_OF_STREAM)
+        self.synthesis_pool.shutdown(wait=False, cancel_futures=True)
 
         # Wait for threads to finish
         if self.generation_thread and self.generation_thread.is_alive():
             self.generation_thread.join(timeout=2.0)
+        if self.ordering_thread and self.ordering_thread.is_alive():
+            self.ordering_thread.join(timeout=2.0)
         if self.playback_thread and self.playback_thread.is_alive():
             self.playback_thread.join(timeout=2.0)
+        self.output.close()
+        if self.metrics.records:
+            logger.info(f"TTS chunk timings this session:\n{self.metrics.format_summary()}")
+            logger.info(f"TTS backends this session:\n{self.backends.format_summary()}")
+        self.metrics.close()
 
         logger.info("TTS service shutdown complete.")
 
@@ -554,10 +1392,10 @@ def main():
     # Check for required packages
     try:
         import openai
-        import pygame
-    except ImportError as e:
+        import sounddevice
+    except (ImportError, OSError) as e:
         logger.error(f"Missing required package: {e}")
-        print("Install with: pip install openai pygame")
+        print("Install with: pip install openai sounddevice")
         sys.exit(1)
 
     window = SimpleTTSApp()
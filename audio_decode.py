@@ -0,0 +1,429 @@
+"""
+Decoding and resampling of synthesized speech into output-ready PCM.
+
+TTSService runs this in its worker pool as soon as a chunk's audio arrives, so that
+what reaches the playback thread is already int16 PCM at the output device's rate
+and playing a chunk is a plain buffer copy. numpy (and libsndfile, when soundfile is
+installed) release the GIL for the heavy loops, so chunks decode in parallel.
+
+"pcm" (raw 24 kHz int16) and "wav" are handled natively; mp3, flac, opus and the
+other compressed formats need the optional `soundfile` package. `MP3StreamDecoder`
+decodes an MP3 download (edge-tts) while it is still arriving.
+"""
+
+import io
+import wave
+import struct
+import logging
+from typing import Optional, Union
+
+import numpy as np
+import logging_config
+
+try:
+    import soundfile
+except (ImportError, OSError):  # OSError: libsndfile not found
+    soundfile = None
+
+root_logger = logging_config.setup_root_logging("audio_decode.log")
+logger = logging.getLogger(__name__)
+
+__all__ = (
+    "decode",
+    "can_decode",
+    "can_stream",
+    "stream_decoder",
+    "resample",
+    "Resampler",
+    "PCMConverter",
+    "MP3StreamDecoder",
+    "WAVStreamDecoder",
+    "PCM_SAMPLE_RATE",
+)
+
+# Rate of the OpenAI TTS "pcm" response format
+PCM_SAMPLE_RATE = 24000
+
+# MP3 frame header tables, indexed by the header's version bits (3: MPEG-1, 2: MPEG-2,
+# 0: MPEG-2.5) and bitrate/sample rate fields. Only Layer III is handled.
+_MP3_BITRATES = {
+    3: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_MP3_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+# Frames decoded again in front of each new batch. The synthesis filter overlaps with
+# the previous frames, and the bit reservoir lets a frame use up to
+# MP3_RESERVOIR_BYTES of the frames before it, so the warm-up is this many frames
+# plus however many more it takes to cover the reservoir at low bitrates.
+MP3_WARMUP_FRAMES = 6
+MP3_RESERVOIR_BYTES = 511
+# New frames collected before a batch is decoded (about 0.25 s at 24 kHz)
+MP3_MIN_FRAMES = 10
+
+
+def _to_mono_int16(samples: np.ndarray) -> np.ndarray:
+    if samples.ndim > 1:
+        samples = samples.mean(axis=1)
+    if samples.dtype != np.int16:
+        samples = np.clip(np.rint(samples), -32768, 32767).astype(np.int16)
+    return samples
+
+
+def decode(data: bytes, response_format: str = "pcm"):
+    """
+    Decodes a speech response to mono int16 samples.
+
+    Args:
+        data: The response body.
+        response_format: The format the speech was requested in.
+
+    Returns:
+        tuple: (samples, sample_rate)
+
+    Raises:
+        ValueError: If the format cannot be decoded here.
+    """
+    if response_format == "pcm":
+        usable = len(data) & ~1
+        return np.frombuffer(data[:usable], dtype=np.int16), PCM_SAMPLE_RATE
+    if response_format == "wav" and soundfile is None:
+        with wave.open(io.BytesIO(data)) as wav:
+            if wav.getsampwidth() != 2:
+                raise ValueError("Only 16-bit WAV can be decoded without soundfile")
+            frames = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+            frames = frames.reshape(-1, wav.getnchannels())
+            return _to_mono_int16(frames), wav.getframerate()
+    if soundfile is None:
+        raise ValueError(f"Decoding {response_format} audio requires soundfile")
+    samples, rate = soundfile.read(io.BytesIO(data), dtype="int16")
+    return _to_mono_int16(samples), rate
+
+
+def can_decode(response_format: str) -> bool:
+    """
+    Returns True if speech in `response_format` can be decoded here.
+    """
+    return response_format in ("pcm", "wav") or soundfile is not None
+
+
+def can_stream(response_format: str) -> bool:
+    """
+    Returns True if speech in `response_format` can be decoded while it downloads.
+    """
+    return response_format in ("pcm", "wav") or (
+        response_format == "mp3" and soundfile is not None
+    )
+
+
+def stream_decoder(response_format: str, dst_rate: int):
+    """
+    Returns a decoder for a speech download in `response_format`: its `process(data)`
+    and `flush()` return int16 PCM at `dst_rate` (or None while there is none yet).
+
+    Raises:
+        ValueError: If the format cannot be decoded while streaming.
+    """
+    if response_format == "pcm":
+        return PCMConverter(dst_rate)
+    if response_format == "wav":
+        return WAVStreamDecoder(dst_rate)
+    if response_format == "mp3":
+        return MP3StreamDecoder(dst_rate)
+    raise ValueError(f"{response_format} audio cannot be decoded while streaming")
+
+
+def resample(samples: np.ndarray, src_rate: int, dst_rate: int) -> np.ndarray:
+    """
+    Returns `samples` converted from `src_rate` to `dst_rate`.
+    """
+    if src_rate == dst_rate:
+        return samples
+    resampler = Resampler(src_rate, dst_rate)
+    return resampler.process(samples)
+
+
+class Resampler:
+    """Streaming linear-interpolation resampler for mono int16 audio.
+
+    Blocks can be fed as they arrive (from a streamed download); the position between
+    input samples carries over from one block to the next, so the joins are seamless.
+    """
+
+    def __init__(self, src_rate: int, dst_rate: int):
+        self.src_rate = src_rate
+        self.dst_rate = dst_rate
+        self._step = src_rate / dst_rate
+        self._pos = 0.0  # next output position, in input samples from _last
+        self._last = None  # last input sample of the previous block
+
+    def process(self, block: Union[bytes, np.ndarray]) -> np.ndarray:
+        """
+        Returns the output samples that `block` completes.
+        """
+        if isinstance(block, (bytes, bytearray, memoryview)):
+            block = np.frombuffer(block, dtype=np.int16)
+        if self.src_rate == self.dst_rate or not len(block):
+            return block
+        if self._last is None:
+            source = block.astype(np.float32)
+        else:
+            source = np.concatenate(([self._last], block.astype(np.float32)))
+        end = len(source) - 1
+        count = int((end - self._pos) // self._step) + 1 if end >= self._pos else 0
+        positions = self._pos + np.arange(count) * self._step
+        out = np.interp(positions, np.arange(len(source)), source)
+        self._pos = (positions[-1] + self._step - end) if count else self._pos - end
+        self._last = source[-1]
+        return np.rint(out).astype(np.int16)
+
+
+class PCMConverter:
+    """Turns streamed "pcm" response bytes into int16 bytes at `dst_rate`.
+
+    Keeps an odd trailing byte for the next block, so every block it returns holds
+    whole samples.
+    """
+
+    def __init__(self, dst_rate: int, src_rate: int = PCM_SAMPLE_RATE):
+        self._resampler = Resampler(src_rate, dst_rate)
+        self._leftover = b""
+
+    def process(self, data: bytes) -> Optional[bytes]:
+        data = self._leftover + data
+        usable = len(data) & ~1
+        self._leftover = data[usable:]
+        if not usable:
+            return None
+        return self._resampler.process(data[:usable]).tobytes()
+
+    def flush(self) -> Optional[bytes]:
+        # A trailing odd byte is not a sample; nothing else is held back
+        return None
+
+
+def _mp3_frame(header) -> Optional[tuple]:
+    """
+    Returns (frame_bytes, samples_per_frame) for a Layer III frame header, or None
+    if the four bytes are not one.
+    """
+    if header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return None
+    version = (header[1] >> 3) & 3
+    layer = (header[1] >> 1) & 3
+    bitrate_index = header[2] >> 4
+    rate_index = (header[2] >> 2) & 3
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    bitrate = _MP3_BITRATES[3 if version == 3 else 2][bitrate_index] * 1000
+    rate = _MP3_RATES[version][rate_index]
+    padding = (header[2] >> 1) & 1
+    if version == 3:
+        return 144 * bitrate // rate + padding, 1152
+    return 72 * bitrate // rate + padding, 576
+
+
+def _mp3_side_info_end(header) -> int:
+    """Offset of the first byte after a Layer III frame's header and side info."""
+    mono = header[3] >> 6 == 3
+    if (header[1] >> 3) & 3 == 3:
+        side = 17 if mono else 32
+    else:
+        side = 9 if mono else 17
+    return (4 if header[1] & 1 else 6) + side
+
+
+def _mp3_xing_frame(header, frames: int) -> bytes:
+    """
+    Builds a silent Xing header frame announcing `frames` frames, in the format of
+    `header`. libsndfile (mpg123) otherwise estimates the length of a headerless
+    stream from its first frame, which cuts VBR audio short.
+    """
+    # No CRC, no padding, and a bitrate big enough to hold the tag
+    header = bytes((header[0], header[1] | 1, 0x80 | (header[2] & 0x0C), header[3]))
+    length, _ = _mp3_frame(header)
+    frame = bytearray(length)
+    frame[:4] = header
+    offset = _mp3_side_info_end(header)
+    frame[offset : offset + 12] = b"Xing" + struct.pack(">II", 1, frames)
+    return bytes(frame)
+
+
+class MP3StreamDecoder:
+    """Turns an MP3 stream into int16 PCM at `dst_rate` while it is still downloading.
+
+    Incoming bytes go into one growable buffer that is scanned for whole frames.
+    Every `min_frames` new frames are decoded as a batch, together with the warm-up
+    frames before them; the warm-up output is dropped, so the batches join sample
+    for sample. Decoded frames leave the buffer, which only ever holds the warm-up
+    and the frames still waiting.
+
+    Each batch goes to libsndfile behind a synthesized Xing frame holding its frame
+    count, so constant and variable bitrate streams both decode in full. A Xing/Info
+    frame at the start of the stream is dropped, which means the encoder delay that
+    a whole-file decode trims is kept here. Requires soundfile (libsndfile 1.1+ for
+    MP3).
+    """
+
+    def __init__(self, dst_rate: int, min_frames: int = MP3_MIN_FRAMES):
+        if soundfile is None:
+            raise ValueError("Decoding mp3 audio requires soundfile")
+        self.dst_rate = dst_rate
+        self.min_frames = max(1, min_frames)
+        self._buf = bytearray()
+        self._scanned = 0  # buffer offset of the next frame header
+        self._frames = []  # (end offset, samples) of each whole frame in the buffer
+        self._warmup = 0  # leading frames in _frames that are already decoded
+        self._started = False
+        self._resampler = None
+
+    def process(self, data: bytes) -> Optional[np.ndarray]:
+        """
+        Adds downloaded bytes; returns the samples of a newly decoded batch, if the
+        data completed one.
+        """
+        self._buf += data
+        self._scan()
+        if len(self._frames) - self._warmup < self.min_frames:
+            return None
+        return self._decode_batch()
+
+    def flush(self) -> Optional[np.ndarray]:
+        """
+        Decodes the frames still waiting once the download is complete.
+        """
+        self._scan()
+        if len(self._frames) == self._warmup:
+            return None
+        return self._decode_batch()
+
+    def _scan(self):
+        buf = self._buf
+        if not self._started and not self._frames and buf[:3] == b"ID3":
+            if len(buf) < 10:
+                return
+            # Skip an ID3v2 tag (synchsafe size, plus the header itself)
+            size = (buf[6] << 21) | (buf[7] << 14) | (buf[8] << 7) | buf[9]
+            if len(buf) < 10 + size:
+                return
+            del buf[: 10 + size]
+        pos = self._scanned
+        while pos + 4 <= len(buf):
+            frame = _mp3_frame(buf[pos : pos + 4])
+            if frame is None:
+                pos += 1  # not at a frame boundary (junk, tag): resync
+                continue
+            length, samples = frame
+            if pos + length > len(buf):
+                break
+            if not self._started and not self._frames and self._is_info_frame(pos):
+                del buf[: pos + length]
+                pos = 0
+                continue
+            if self._frames and self._frames[-1][0] != pos:
+                # Drop junk between frames so the buffer stays a clean frame run
+                start = self._frames[-1][0]
+                del buf[start:pos]
+                pos = start
+            elif not self._frames and pos:
+                del buf[:pos]
+                pos = 0
+            pos += length
+            self._frames.append((pos, samples))
+        self._scanned = pos
+
+    def _is_info_frame(self, pos: int) -> bool:
+        offset = pos + _mp3_side_info_end(self._buf[pos : pos + 4])
+        return self._buf[offset : offset + 4] in (b"Xing", b"Info")
+
+    def _decode_batch(self) -> Optional[np.ndarray]:
+        end = self._frames[-1][0]
+        new_samples = sum(samples for _, samples in self._frames[self._warmup :])
+        data = _mp3_xing_frame(self._buf[:4], len(self._frames)) + self._buf[:end]
+        try:
+            samples, rate = soundfile.read(io.BytesIO(data), dtype="int16")
+        except Exception as e:
+            logger.warning(f"Could not decode MP3 batch: {e}")
+            samples, rate = np.zeros(0, dtype=np.int16), None
+        samples = _to_mono_int16(samples)
+        if self._started and len(samples) > new_samples:
+            # Keep only the new frames' output; the warm-up frames were played already
+            samples = samples[-new_samples:]
+        self._started = True
+
+        # Keep the last frames as warm-up for the next batch: MP3_WARMUP_FRAMES, and
+        # enough bytes before the newest two to hold a full bit reservoir
+        warmup = min(MP3_WARMUP_FRAMES, len(self._frames))
+        while warmup < len(self._frames):
+            first = self._frames[-warmup - 1][0]
+            if self._frames[-3][0] - first >= MP3_RESERVOIR_BYTES:
+                break
+            warmup += 1
+        keep = self._frames[-warmup:]
+        start = self._frames[-warmup - 1][0] if warmup < len(self._frames) else 0
+        if start:
+            del self._buf[:start]
+            keep = [(offset - start, count) for offset, count in keep]
+        self._frames = keep
+        self._warmup = len(keep)
+        self._scanned -= start
+
+        if rate is None or not len(samples):
+            return None
+        if self._resampler is None:
+            self._resampler = Resampler(rate, self.dst_rate)
+        return self._resampler.process(samples)
+
+
+class WAVStreamDecoder:
+    """Turns a mono 16-bit WAV stream into int16 bytes at `dst_rate` as it arrives.
+
+    Reads the header, then converts the data chunk like "pcm". The sizes in the
+    header are ignored, since a streaming writer (espeak-ng --stdout) cannot know
+    them up front.
+    """
+
+    def __init__(self, dst_rate: int):
+        self.dst_rate = dst_rate
+        self._header = bytearray()
+        self._converter = None
+
+    def process(self, data: bytes) -> Optional[bytes]:
+        if self._converter is None:
+            self._header += data
+            data = self._parse_header()
+            if data is None:
+                return None
+        return self._converter.process(data)
+
+    def flush(self) -> Optional[bytes]:
+        return None
+
+    def _parse_header(self) -> Optional[bytes]:
+        """Returns the bytes after the header once it is complete, else None."""
+        header = self._header
+        if len(header) < 12:
+            return None
+        if header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+            raise ValueError("Not a WAV stream")
+        pos = 12
+        rate = None
+        while pos + 8 <= len(header):
+            chunk_id = bytes(header[pos : pos + 4])
+            size = int.from_bytes(header[pos + 4 : pos + 8], "little")
+            if chunk_id == b"data":
+                if rate is None:
+                    raise ValueError("WAV data before its format chunk")
+                self._converter = PCMConverter(self.dst_rate, src_rate=rate)
+                rest = bytes(header[pos + 8 :])
+                self._header = bytearray()
+                return rest
+            if pos + 8 + size > len(header):
+                return None
+            if chunk_id == b"fmt ":
+                channels = int.from_bytes(header[pos + 10 : pos + 12], "little")
+                rate = int.from_bytes(header[pos + 12 : pos + 16], "little")
+                bits = int.from_bytes(header[pos + 22 : pos + 24], "little")
+                if channels != 1 or bits != 16:
+                    raise ValueError("Only mono 16-bit WAV can be streamed")
+            pos += 8 + size + (size & 1)
+        return None
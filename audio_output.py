@@ -0,0 +1,340 @@
+"""
+Continuous, low-latency audio output fed from a ring buffer.
+
+A single long-lived `sounddevice.OutputStream` plays 16-bit PCM for the whole
+session. Writers append samples to a ring buffer and the device callback copies them
+out, padding with silence when it runs dry, so consecutive chunks play back to back
+with no gap. Markers placed between chunks fire on the exact sample where a chunk
+ends, and `clear()` drops everything queued so playback stops within one device
+buffer.
+
+Without a usable output device (PortAudio missing, headless machines), or with
+SIDEKICK_AUDIO_OUTPUT=null, a clock thread consumes the buffer in real time instead
+(and sleeps while it is empty), so timing behaves the same.
+"""
+
+import asyncio
+import os
+import threading
+import time
+import logging
+from collections import deque
+from typing import Optional, Union
+
+import numpy as np
+import logging_config
+
+try:
+    import sounddevice as sd
+except (ImportError, OSError):  # OSError: PortAudio library not found
+    sd = None
+
+root_logger = logging_config.setup_root_logging("audio_output.log")
+logger = logging.getLogger(__name__)
+
+__all__ = ("AudioOutput", "Marker", "DEFAULT_SAMPLE_RATE", "native_sample_rate")
+
+# OpenAI TTS "pcm" output rate
+DEFAULT_SAMPLE_RATE = 24000
+# Device latency: "low", "high" or seconds; SIDEKICK_AUDIO_LATENCY overrides
+DEFAULT_LATENCY = os.getenv("SIDEKICK_AUDIO_LATENCY", "low")
+# How much audio can be queued ahead of the playhead
+DEFAULT_BUFFER_SECONDS = 60.0
+# Period of the fallback clock when no device is available
+CLOCK_BLOCK_SECONDS = 0.01
+# SIDEKICK_AUDIO_OUTPUT=null forces the silent clock (benchmarks, CI)
+NULL_OUTPUT = os.getenv("SIDEKICK_AUDIO_OUTPUT") == "null"
+
+
+def native_sample_rate(device=None, default: int = DEFAULT_SAMPLE_RATE) -> int:
+    """
+    Returns the output device's own sample rate, so audio written at that rate is
+    played without resampling in the driver; `default` without a usable device.
+    """
+    if NULL_OUTPUT or sd is None:
+        return default
+    try:
+        return int(sd.query_devices(device, "output")["default_samplerate"])
+    except Exception as e:
+        logger.warning(f"Could not query the output device rate ({e}).")
+        return default
+
+
+def _parse_latency(latency):
+    try:
+        return float(latency)
+    except (TypeError, ValueError):
+        return latency
+
+
+class Marker:
+    """Fires when playback reaches a given sample, or when the output is cleared."""
+
+    __slots__ = ("position", "cancelled", "_event", "_callbacks", "_lock")
+
+    def __init__(self, position: int):
+        self.position = position
+        self.cancelled = False
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def _fire(self, cancelled=False):
+        with self._lock:
+            self.cancelled = cancelled
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception as e:
+                logger.error(f"Audio marker callback failed: {e}")
+
+    def add_done_callback(self, callback):
+        """
+        Calls `callback(marker)` once the marker fires, right away if it already has.
+
+        Callbacks may run on the audio device thread, so they must not block.
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def is_set(self) -> bool:
+        return self._event.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Blocks until the marker is reached or cancelled; returns False on timeout.
+        """
+        return self._event.wait(timeout)
+
+    async def wait_async(self):
+        """
+        Awaits the marker from a coroutine without blocking its event loop.
+        """
+        loop = asyncio.get_running_loop()
+        done = loop.create_future()
+
+        def _wake(_marker):
+            loop.call_soon_threadsafe(lambda: done.done() or done.set_result(None))
+
+        self.add_done_callback(_wake)
+        await done
+
+
+class AudioOutput:
+    """One continuous output stream playing PCM queued through `write()`.
+
+    Positions are absolute frame counts since the stream was opened: `write()`
+    advances the write position, the device callback the play position.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int = DEFAULT_SAMPLE_RATE,
+        channels: int = 1,
+        latency=DEFAULT_LATENCY,
+        buffer_seconds: float = DEFAULT_BUFFER_SECONDS,
+        device=None,
+    ):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.latency = _parse_latency(latency)
+        self.device = device
+        self._capacity = int(buffer_seconds * sample_rate)
+        self._ring = np.zeros((self._capacity, channels), dtype=np.int16)
+        self._written = 0
+        self._played = 0
+        self._markers = deque()
+        self._cond = threading.Condition()
+        self._clears = 0
+        self._stream = None
+        self._clock = None
+        self._closed = False
+
+    # ------------------------------------------------------------------ device
+
+    def start(self):
+        """Opens the output stream (or the fallback clock) if it is not running."""
+        if self._stream is not None or self._clock is not None:
+            return
+        self._closed = False
+        if NULL_OUTPUT:
+            logger.info("Audio output disabled; using a silent clock.")
+        elif sd is not None:
+            try:
+                self._stream = sd.OutputStream(
+                    samplerate=self.sample_rate,
+                    channels=self.channels,
+                    dtype="int16",
+                    latency=self.latency,
+                    device=self.device,
+                    callback=self._callback,
+                )
+                self._stream.start()
+                logger.info(
+                    f"Audio output started: {self.sample_rate} Hz, "
+                    f"latency {self._stream.latency * 1000:.0f} ms."
+                )
+                return
+            except Exception as e:
+                self._stream = None
+                logger.warning(f"No audio output device ({e}); using a silent clock.")
+        else:
+            logger.warning("sounddevice is unavailable; using a silent clock.")
+        self._clock = threading.Thread(
+            target=self._run_clock, daemon=True, name="AudioOutputClock"
+        )
+        self._clock.start()
+
+    def close(self):
+        """Stops playback and releases the device."""
+        self.clear()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._stream is not None:
+            try:
+                self._stream.abort()
+                self._stream.close()
+            except Exception as e:
+                logger.warning(f"Error closing audio output: {e}")
+            self._stream = None
+        if self._clock is not None:
+            self._clock.join(timeout=1.0)
+            self._clock = None
+        logger.info("Audio output closed.")
+
+    def _run_clock(self):
+        frames = max(1, int(self.sample_rate * CLOCK_BLOCK_SECONDS))
+        scratch = np.zeros((frames, self.channels), dtype=np.int16)
+        deadline = time.perf_counter()
+        while not self._closed:
+            with self._cond:
+                if self._written == self._played:
+                    # Nothing to play: sleep until a write (or close) instead of ticking
+                    self._cond.wait_for(
+                        lambda: self._written != self._played or self._closed
+                    )
+                    deadline = time.perf_counter()
+            self._callback(scratch, frames, None, None)
+            deadline += frames / self.sample_rate
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                deadline = time.perf_counter()
+
+    def _callback(self, outdata, frames, time_info, status):
+        if status:
+            logger.debug(f"Audio output status: {status}")
+        with self._cond:
+            count = min(frames, self._written - self._played)
+            if count:
+                start = self._played % self._capacity
+                first = min(count, self._capacity - start)
+                outdata[:first] = self._ring[start : start + first]
+                if count > first:
+                    outdata[first:count] = self._ring[: count - first]
+                self._played += count
+                markers = self._markers
+                while markers and markers[0].position <= self._played:
+                    markers.popleft()._fire()
+                self._cond.notify_all()
+        if count < frames:
+            outdata[count:] = 0
+
+    # ----------------------------------------------------------------- writing
+
+    @property
+    def written_frames(self) -> int:
+        """Write position: frames queued since the stream was opened."""
+        with self._cond:
+            return self._written
+
+    @property
+    def queued_frames(self) -> int:
+        """Frames written but not yet played."""
+        with self._cond:
+            return self._written - self._played
+
+    def write(self, pcm: Union[bytes, np.ndarray], timeout: Optional[float] = None) -> int:
+        """
+        Queues int16 PCM behind everything already written.
+
+        Blocks while the ring buffer is full. Returns early (having written only part
+        of the data) if `clear()` is called or `timeout` expires meanwhile.
+
+        Args:
+            pcm: Interleaved int16 samples as bytes or a numpy array.
+            timeout: Maximum seconds to wait for buffer space.
+
+        Returns:
+            int: Number of frames queued.
+        """
+        if self._stream is None and self._clock is None:
+            self.start()
+        if isinstance(pcm, (bytes, bytearray, memoryview)):
+            pcm = np.frombuffer(pcm, dtype=np.int16)
+        samples = np.asarray(pcm, dtype=np.int16).reshape(-1, self.channels)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        done = 0
+        with self._cond:
+            clears = self._clears
+            while done < len(samples):
+                space = self._capacity - (self._written - self._played)
+                if not space:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                    if self._clears != clears or self._closed:
+                        break
+                    continue
+                count = min(space, len(samples) - done)
+                start = self._written % self._capacity
+                first = min(count, self._capacity - start)
+                self._ring[start : start + first] = samples[done : done + first]
+                if count > first:
+                    self._ring[: count - first] = samples[done + first : done + count]
+                self._written += count
+                done += count
+                self._cond.notify_all()
+        return done
+
+    def mark(self) -> Marker:
+        """
+        Returns a marker that fires once everything written so far has been played.
+        """
+        with self._cond:
+            marker = Marker(self._written)
+            if self._written <= self._played:
+                marker._fire()
+            else:
+                self._markers.append(marker)
+            return marker
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """
+        Waits until all queued audio has played; False on timeout or if cleared.
+        """
+        marker = self.mark()
+        return marker.wait(timeout) and not marker.cancelled
+
+    def clear(self):
+        """
+        Drops all queued audio so output goes silent at once; pending markers fire
+        as cancelled and blocked writers return.
+        """
+        with self._cond:
+            dropped = self._written - self._played
+            self._played = self._written
+            self._clears += 1
+            while self._markers:
+                self._markers.popleft()._fire(cancelled=True)
+            self._cond.notify_all()
+        if dropped:
+            logger.info(f"Audio output cleared ({dropped / self.sample_rate:.2f}s dropped).")
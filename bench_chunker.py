@@ -0,0 +1,130 @@
+"""
+Microbenchmark: TTS chunking of a streamed reply, re-scanning vs incremental.
+
+Builds a multi-kilobyte reply (prose with abbreviations, numbers and quotes, a list and
+an unpunctuated code-like run), slices it into token-sized deltas and times both ways
+of cutting it into speech chunks as it streams in:
+  * re-scan: append each delta to the unsent text and call
+    `SentenceChunker.next_chunks`, which splits all of it again;
+  * incremental: `StreamingSentenceChunker.feed(delta)`, which looks at each new
+    character once.
+
+The two use the same sentence rules and give the same chunks for a reply fed in one
+piece, but the chunk counts differ when streaming. When a delta ends right after
+"U.S. " or "e.g. ", the re-scan sees a finished sentence and cuts there. The
+incremental chunker waits for the next word ("team") before it confirms a sentence
+end. Cuts inside long unpunctuated runs also depend on where the deltas fall.
+
+Usage:
+    python bench_chunker.py [--kb 2 8 32] [--delta-chars 4] [--repeat 5]
+"""
+
+import argparse
+import random
+import time
+
+import TTS_openai_streaming as TTS_S
+
+SENTENCES = (
+    "The quick brown fox jumps over the lazy dog near the river bank.",
+    "Dr. Smith said the results, e.g. the latency numbers, looked fine at 3 p.m. today.",
+    'She replied "Great news!" and moved on to the next item on the agenda.',
+    "Version 3.14 of the library ships next week; the U.S. team will test it first.",
+    "Is that really all it takes to make the pipeline respond faster?",
+    "Short one.",
+)
+LIST = "Steps:\n1. Install the package\n2. Run the benchmark\n3. Compare the numbers\n"
+CODE = " ".join(f"value_{i} = compute(value_{i - 1}) + offset" for i in range(1, 40)) + "\n"
+
+
+def build_reply(kb, seed=0):
+    """
+    Returns a reply of about `kb` KiB mixing prose, a list and a long unpunctuated run.
+    """
+    rng = random.Random(seed)
+    parts = []
+    size = 0
+    while size < kb * 1024:
+        roll = rng.random()
+        if roll < 0.05:
+            part = LIST
+        elif roll < 0.08:
+            part = CODE
+        else:
+            part = rng.choice(SENTENCES) + " "
+        parts.append(part)
+        size += len(part)
+    return "".join(parts)
+
+
+def split_deltas(text, delta_chars):
+    return [text[i : i + delta_chars] for i in range(0, len(text), delta_chars)]
+
+
+def chunk_rescan(deltas):
+    """
+    The previous approach: re-split all unsent text on every delta.
+    """
+    chunker = TTS_S.SentenceChunker()
+    chunks = []
+    partial = ""
+    for delta in deltas:
+        partial += delta
+        ready, partial = chunker.next_chunks(partial, len(chunks))
+        chunks.extend(ready)
+    chunks.extend(chunker.next_chunks(partial, len(chunks), final=True)[0])
+    return chunks
+
+
+def chunk_incremental(deltas):
+    """
+    The StreamingSentenceChunker approach: feed each delta, flush at the end.
+    """
+    chunker = TTS_S.StreamingSentenceChunker()
+    chunks = []
+    for delta in deltas:
+        chunks.extend(chunker.feed(delta))
+    chunks.extend(chunker.flush())
+    return chunks
+
+
+def best_of(fn, deltas, repeat):
+    fn(deltas)  # warm-up
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(deltas)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--kb", type=float, nargs="+", default=[2, 8, 32])
+    parser.add_argument("--delta-chars", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(
+        f"  {'reply':>8}{'deltas':>8}{'re-scan ms':>12}{'incr. ms':>10}"
+        f"{'us/delta':>10}{'speedup':>9}{'chunks':>14}"
+    )
+    for kb in args.kb:
+        text = build_reply(kb)
+        deltas = split_deltas(text, args.delta_chars)
+        rescan_t, rescan_chunks = best_of(chunk_rescan, deltas, args.repeat)
+        incr_t, incr_chunks = best_of(chunk_incremental, deltas, args.repeat)
+        # Both must speak the whole reply (hard caps may split a word, so ignore spaces)
+        expected = "".join(text.split())
+        for chunks in (rescan_chunks, incr_chunks):
+            assert "".join("".join(chunks).split()) == expected
+        print(
+            f"  {len(text) / 1024:>6.1f}KB{len(deltas):>8}{rescan_t * 1000:>12.2f}"
+            f"{incr_t * 1000:>10.2f}{incr_t * 1e6 / len(deltas):>10.2f}"
+            f"{rescan_t / incr_t:>8.1f}x{len(rescan_chunks):>7}/{len(incr_chunks):<6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
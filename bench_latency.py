@@ -0,0 +1,292 @@
+"""
+End-to-end latency benchmark: the app's OpenAI pipeline against mock_openai_server.py.
+
+Runs headlessly (offscreen Qt platform, silent real-time audio clock) and measures, over
+several runs:
+  * openai_helper: time-to-first-token of `chat_with_gpt5_stream_async`;
+  * GPTWorker: time-to-first-token as seen by a slot on the Qt main thread;
+  * voice-to-speech: transcription, time-to-first-token and time-to-first-audio from
+    the moment the Talk button is released, with TTSService fed sentence chunks the
+    way SidekickUI does it.
+
+By default a mock server is started in-process; pass --url to use one running
+elsewhere (e.g. `python mock_openai_server.py --port 8765`).
+
+Usage:
+    python bench_latency.py [--runs 10] [--ttft 0.4] [--token-interval 0.02]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# Must be set before Qt and the audio output are imported
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+os.environ.setdefault("SIDEKICK_AUDIO_OUTPUT", "null")
+
+import mock_openai_server
+
+RUN_TIMEOUT = 60.0
+PROMPT = [
+    {"role": "system", "content": [{"type": "input_text", "text": "Be brief."}]},
+    {"role": "user", "content": [{"type": "input_text", "text": "Hello there!"}]},
+]
+
+
+def percentiles(samples):
+    """
+    Returns (p50, p95, mean, max) in milliseconds.
+    """
+    ms = np.asarray(samples) * 1000
+    return np.percentile(ms, 50), np.percentile(ms, 95), ms.mean(), ms.max()
+
+
+def report(title, metrics):
+    print(f"\n{title}")
+    print(f"  {'metric':<26}{'n':>4}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}{'max ms':>10}")
+    for name, samples in metrics.items():
+        if not samples:
+            print(f"  {name:<26}{0:>4}")
+            continue
+        p50, p95, mean, worst = percentiles(samples)
+        print(
+            f"  {name:<26}{len(samples):>4}{p50:>10.1f}{p95:>10.1f}{mean:>10.1f}{worst:>10.1f}"
+        )
+
+
+def wait_until(app, predicate, timeout=RUN_TIMEOUT):
+    """Pumps the Qt event loop until `predicate()` is true."""
+    deadline = time.perf_counter() + timeout
+    while not predicate():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("Timed out waiting for the pipeline")
+        app.processEvents()
+        time.sleep(0.0005)
+
+
+def bench_helper(runs):
+    import event_loop
+    import openai_helper as openai
+    import sse_parser
+
+    async def one_run():
+        start = time.perf_counter()
+        first = None
+        async for event in openai.chat_with_gpt5_stream_async(PROMPT):
+            if first is None and event.type == sse_parser.TEXT_DELTA:
+                first = time.perf_counter() - start
+        return first, time.perf_counter() - start
+
+    metrics = {"time to first token": [], "stream complete": []}
+    for _ in range(runs):
+        first, total = event_loop.submit(one_run()).result(RUN_TIMEOUT)
+        metrics["time to first token"].append(first)
+        metrics["stream complete"].append(total)
+    report("openai_helper.chat_with_gpt5_stream_async", metrics)
+
+
+class _GPTRun:
+    """Runs one GPTWorker request on a QThread, as SidekickUI.launch_gpt_service does."""
+
+    def __init__(self, content, on_delta=None):
+        from PyQt6.QtCore import QThread
+        from gpt_worker import GPTWorker
+        import sse_parser
+
+        self.start = None
+        self.first_token = None
+        self.finished = None
+        self.error = None
+        self._text_delta = sse_parser.TEXT_DELTA
+        self._on_delta = on_delta
+        self.thread = QThread()
+        self.worker = GPTWorker(content)
+        self.worker.moveToThread(self.thread)
+        self.thread.started.connect(self.worker.run)
+        self.worker.chunk.connect(self._on_chunk)
+        self.worker.done.connect(self._on_done)
+        self.worker.error.connect(self._on_error)
+
+    def _on_chunk(self, event):
+        if event.type != self._text_delta:
+            return
+        if self.first_token is None:
+            self.first_token = time.perf_counter()
+        if self._on_delta is not None:
+            self._on_delta(event.delta)
+
+    def _on_done(self):
+        self.finished = time.perf_counter()
+
+    def _on_error(self, message):
+        self.error = message
+        self.finished = time.perf_counter()
+
+    def launch(self):
+        self.start = time.perf_counter()
+        self.thread.start()
+
+    def cleanup(self):
+        self.thread.quit()
+        self.thread.wait()
+
+
+def bench_worker(app, runs):
+    metrics = {"time to first token": [], "done signal": []}
+    for _ in range(runs):
+        run = _GPTRun(PROMPT)
+        run.launch()
+        wait_until(app, lambda: run.finished is not None)
+        run.cleanup()
+        if run.error:
+            raise RuntimeError(run.error)
+        metrics["time to first token"].append(run.first_token - run.start)
+        metrics["done signal"].append(run.finished - run.start)
+    report("GPTWorker (signals delivered to the Qt main thread)", metrics)
+
+
+def _timed_tts_service():
+    import TTS_openai_streaming as TTS_S
+    import tts_cache
+
+    class TimedTTSService(TTS_S.TTSService):
+        """TTSService that records when the first audio chunk starts playing."""
+
+        first_audio_at = None
+
+        def _play_audio_chunk(self, audio_data):
+            if self.first_audio_at is None and not self.should_stop_playback:
+                self.first_audio_at = time.perf_counter()
+            super()._play_audio_chunk(audio_data)
+
+    service = TimedTTSService(os.getenv("OPENAI_API_KEY"))
+    # Every run speaks the same reply; measure synthesis, not cache hits
+    service.cache = tts_cache.TTSCache(directory=None, memory_bytes=0)
+    return service
+
+
+def bench_voice(app, runs):
+    import openai_helper as openai
+    import TTS_openai_streaming as TTS_S
+    import tts_metrics
+
+    tts = _timed_tts_service()
+    tts.chunk_generated.connect(tts.start_playback)
+    chunker = TTS_S.StreamingSentenceChunker()
+    # Three seconds of quiet noise stand in for the recorded voice prompt
+    voice = (np.random.default_rng(0).standard_normal(48000) * 300).astype(np.int16)
+
+    metrics = {
+        "transcription": [],
+        "time to first token": [],
+        "time to first audio": [],
+    }
+    for _ in range(runs):
+        tts.first_audio_at = None
+        chunker.reset()
+
+        def on_delta(delta):
+            # Mirrors SidekickUI.on_gpt_chunk_streaming with auto_read on
+            for chunk in chunker.feed(delta):
+                tts.add_chunk(chunk)
+
+        released = time.perf_counter()
+        text = openai.transcribe_audio(voice, sample_rate=16000)
+        transcribed = time.perf_counter()
+        content = PROMPT[:1] + [
+            {"role": "user", "content": [{"type": "input_text", "text": text}]}
+        ]
+        run = _GPTRun(content, on_delta)
+        run.launch()
+        wait_until(app, lambda: run.finished is not None)
+        run.cleanup()
+        if run.error:
+            raise RuntimeError(run.error)
+        for chunk in chunker.flush():
+            tts.add_chunk(chunk)
+        wait_until(app, lambda: tts.first_audio_at is not None)
+        # Let the reply play out so no audio from this run leaks into the next one
+        wait_until(app, lambda: not tts.is_playing)
+
+        metrics["transcription"].append(transcribed - released)
+        metrics["time to first token"].append(run.first_token - released)
+        metrics["time to first audio"].append(tts.first_audio_at - released)
+    tts.shutdown()
+    report("Voice to speech (from Talk release)", metrics)
+
+    # Where each chunk's time went, from the service's own timing records
+    stages = {name: [] for name, _, _ in tts_metrics.STAGES}
+    for record in tts.metrics.records:
+        if record["outcome"] == "played":
+            for name in stages:
+                if f"{name}_ms" in record:
+                    stages[name].append(record[f"{name}_ms"] / 1000)
+    report("TTS chunk stages (tts_metrics)", stages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--url", help="Use an already running mock server")
+    parser.add_argument("--ttft", type=float, default=0.4)
+    parser.add_argument("--token-interval", type=float, default=0.02)
+    parser.add_argument("--reply-words", type=int, default=60)
+    parser.add_argument("--transcription-delay", type=float, default=0.3)
+    parser.add_argument("--speech-delay", type=float, default=0.25)
+    parser.add_argument(
+        "--only", choices=("helper", "worker", "voice"), help="Run a single scenario"
+    )
+    args = parser.parse_args()
+
+    stop = None
+    url = args.url
+    if url is None:
+        config = mock_openai_server.MockConfig(
+            ttft=args.ttft,
+            token_interval=args.token_interval,
+            reply_words=args.reply_words,
+            transcription_delay=args.transcription_delay,
+            speech_delay=args.speech_delay,
+            # Short clips keep the runs quick; clip length does not affect latency
+            speech_chars_per_second=200.0,
+        )
+        url, stop = mock_openai_server.start_in_thread(config)
+    # The app modules read these at import time, so they are imported below
+    os.environ["OPENAI_BASE_URL"] = url
+    os.environ.setdefault("OPENAI_API_KEY", "sk-mock")
+
+    import logging
+    from PyQt6.QtWidgets import QApplication
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    # Every app module resets the root logging handlers on import, so import the
+    # ones the scenarios use before turning the console output down. main itself is
+    # not imported: it needs PortAudio for the microphone.
+    import gpt_worker  # noqa: F401
+    import TTS_openai_streaming  # noqa: F401
+    import tts_metrics  # noqa: F401
+
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, logging.StreamHandler) and not isinstance(
+            handler, logging.FileHandler
+        ):
+            handler.setLevel(logging.WARNING)
+
+    print(f"Mock API: {url}  runs: {args.runs}")
+    try:
+        if args.only in (None, "helper"):
+            bench_helper(args.runs)
+        if args.only in (None, "worker"):
+            bench_worker(app, args.runs)
+        if args.only in (None, "voice"):
+            bench_voice(app, args.runs)
+    finally:
+        if stop is not None:
+            stop()
+
+
+if __name__ == "__main__":
+    main()
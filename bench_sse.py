@@ -0,0 +1,149 @@
+"""
+Microbenchmark: Responses stream parsing, old line-by-line json.loads vs sse_parser.
+
+Builds a synthetic SSE body for a long reply (text deltas interleaved with the
+lifecycle/reasoning events the app ignores), slices it into socket-sized chunks and
+times both decoders over it.
+
+Usage:
+    python bench_sse.py [--deltas 4000] [--repeat 20]
+"""
+
+import argparse
+import json
+import time
+
+import sse_parser
+
+
+def build_stream(n_deltas, chunk_size=1400):
+    """
+    Returns a synthetic Responses API SSE body split into network-sized byte chunks.
+    """
+    seq = 0
+    frames = []
+
+    def frame(event_type, payload):
+        nonlocal seq
+        payload = {"type": event_type, "sequence_number": seq, **payload}
+        seq += 1
+        frames.append(f"event: {event_type}\ndata: {json.dumps(payload)}\n\n")
+
+    response = {"id": "resp_bench", "object": "response", "status": "in_progress"}
+    frame("response.created", {"response": response})
+    frame("response.in_progress", {"response": response})
+    for i in range(n_deltas // 4):
+        frame(
+            "response.reasoning_summary_text.delta",
+            {"item_id": "rs_bench", "output_index": 0, "delta": "thinking "},
+        )
+    frame(
+        "response.output_item.added",
+        {"output_index": 1, "item": {"id": "msg_bench", "type": "message"}},
+    )
+    for i in range(n_deltas):
+        frame(
+            "response.output_text.delta",
+            {
+                "item_id": "msg_bench",
+                "output_index": 1,
+                "content_index": 0,
+                "delta": f" word{i} é",
+                "logprobs": [],
+            },
+        )
+    text = " ".join(f"word{i}" for i in range(n_deltas))
+    # The API repeats the full text in each of the *.done events and in completed
+    part = {"type": "output_text", "text": text, "annotations": []}
+    frame(
+        "response.output_text.done",
+        {"item_id": "msg_bench", "output_index": 1, "text": text},
+    )
+    frame(
+        "response.content_part.done",
+        {"item_id": "msg_bench", "output_index": 1, "part": part},
+    )
+    item = {"id": "msg_bench", "type": "message", "role": "assistant"}
+    frame(
+        "response.output_item.done",
+        {"output_index": 1, "item": dict(item, content=[part])},
+    )
+    done = dict(
+        response,
+        status="completed",
+        output=[dict(item, content=[part])],
+        usage={"output_tokens": n_deltas},
+    )
+    frame("response.completed", {"response": done})
+
+    body = "".join(frames).encode("utf-8")
+    return [body[i : i + chunk_size] for i in range(0, len(body), chunk_size)]
+
+
+def parse_legacy(chunks):
+    """
+    The previous approach: decode every line and json.loads every data payload.
+    """
+    count = 0
+    pending = ""
+    for chunk in chunks:
+        pending += chunk.decode("utf-8", errors="ignore")
+        lines = pending.split("\n")
+        pending = lines.pop()
+        for raw in lines:
+            if raw.startswith("data: "):
+                data = raw[6:]
+                if "response.completed" in data:
+                    continue
+                obj = json.loads(data)
+                if obj.get("type") == "response.output_text.delta":
+                    count += 1
+    return count
+
+
+def parse_incremental(chunks):
+    """
+    The sse_parser approach: frame on bytes, decode only handled event types.
+    """
+    count = 0
+    decoder = sse_parser.ResponseStreamDecoder()
+    for chunk in chunks:
+        for event in decoder.feed(chunk):
+            if event.type == sse_parser.TEXT_DELTA:
+                count += 1
+    decoder.flush()
+    return count
+
+
+def best_of(fn, chunks, repeat):
+    fn(chunks)  # warm-up
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(chunks)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--deltas", type=int, default=4000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    chunks = build_stream(args.deltas)
+    size_kb = sum(len(c) for c in chunks) / 1024
+    print(f"Stream: {args.deltas} text deltas, {size_kb:.0f} KiB in {len(chunks)} chunks")
+
+    legacy_t, legacy_n = best_of(parse_legacy, chunks, args.repeat)
+    new_t, new_n = best_of(parse_incremental, chunks, args.repeat)
+    assert legacy_n == new_n == args.deltas, (legacy_n, new_n)
+
+    print(f"legacy json.loads per line : {legacy_t * 1000:8.2f} ms")
+    print(f"sse_parser incremental     : {new_t * 1000:8.2f} ms")
+    print(f"speedup                    : {legacy_t / new_t:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
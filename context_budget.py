@@ -0,0 +1,306 @@
+"""
+Token-budgeted view of the conversation context.
+
+`SidekickUI.context` keeps the whole conversation (it is what Save writes), but the
+payload sent to the model is capped. When the estimated size goes over the budget,
+images in older turns are replaced by a short text stub first, then the oldest turns
+are dropped. Compaction trims down to a low-water mark, so the kept prefix stays the
+same for several turns and prompt caching and server-side chaining keep working.
+
+Older exchanges can also be folded into a running summary (produced off the UI
+thread by a cheap model); the summary then replaces those turns in the payload.
+
+Token counts are estimates (about 4 characters per token for text, and the tile
+formula for images), which is accurate enough for budgeting.
+"""
+
+import base64
+import binascii
+import io
+import logging
+import math
+import os
+import threading
+
+from PIL import Image
+import image_prep
+import logging_config
+
+root_logger = logging_config.setup_root_logging("context_budget.log")
+logger = logging.getLogger(__name__)
+
+__all__ = ("ContextBudget", "estimate_message_tokens", "estimate_tokens")
+
+DEFAULT_BUDGET = int(os.getenv("SIDEKICK_CONTEXT_BUDGET", "32000"))
+# After compaction the payload is cut down to this fraction of the budget
+LOW_WATER = 0.75
+CHARS_PER_TOKEN = 4
+# Per-message framing overhead (role, separators)
+MESSAGE_OVERHEAD = 4
+IMAGE_STUB = "[Image from an earlier turn omitted to save context]"
+
+# Rolling summary: the newest messages are always kept verbatim, and older ones are
+# only summarized once they add up to enough tokens to be worth a request.
+SUMMARY_KEEP_MESSAGES = 6
+SUMMARY_MIN_TOKENS = 2000
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+# Vision token costs: a fixed base plus a cost per 512px tile at high detail
+IMAGE_BASE_TOKENS = 85
+IMAGE_TILE_TOKENS = 170
+IMAGE_TILE_SIZE = 512
+# Used when the image size cannot be read (e.g. a remote URL)
+IMAGE_FALLBACK_TOKENS = 765
+
+_image_tokens = {}  # (len, tail, detail) -> tokens
+
+
+def _image_dimensions(image_url: str):
+    if not image_url.startswith("data:"):
+        return None
+    try:
+        data = base64.b64decode(image_url.partition(",")[2])
+        with Image.open(io.BytesIO(data)) as img:  # reads the header only
+            return img.size
+    except (binascii.Error, OSError, ValueError):
+        return None
+
+
+def estimate_image_tokens(image_url: str, detail: str = "auto") -> int:
+    """
+    Estimates the input tokens an `input_image` part costs at the given detail.
+    """
+    if detail == "low":
+        return IMAGE_BASE_TOKENS
+    key = (len(image_url), image_url[-32:], detail)
+    tokens = _image_tokens.get(key)
+    if tokens is not None:
+        return tokens
+    size = _image_dimensions(image_url)
+    if size is None:
+        tokens = IMAGE_FALLBACK_TOKENS
+    else:
+        # The API scales high-detail images the same way image_prep does
+        w, h = image_prep.target_size(*size, "high")
+        tiles = math.ceil(w / IMAGE_TILE_SIZE) * math.ceil(h / IMAGE_TILE_SIZE)
+        tokens = IMAGE_BASE_TOKENS + IMAGE_TILE_TOKENS * tiles
+    _image_tokens[key] = tokens
+    return tokens
+
+
+def estimate_message_tokens(message: dict) -> int:
+    """
+    Estimates the input tokens of one Responses API message.
+    """
+    content = message.get("content", "")
+    if isinstance(content, str):
+        return MESSAGE_OVERHEAD + math.ceil(len(content) / CHARS_PER_TOKEN)
+    tokens = MESSAGE_OVERHEAD
+    for part in content:
+        if part.get("type") == "input_image":
+            tokens += estimate_image_tokens(
+                part.get("image_url", ""), part.get("detail", "auto")
+            )
+        else:
+            tokens += math.ceil(len(part.get("text", "")) / CHARS_PER_TOKEN)
+    return tokens
+
+
+def estimate_tokens(messages) -> int:
+    """
+    Estimates the input tokens of a list of messages.
+    """
+    return sum(estimate_message_tokens(m) for m in messages)
+
+
+def transcript(messages) -> str:
+    """
+    Renders messages as plain "User: ..."/"Assistant: ..." text, without images.
+    """
+    lines = []
+    for message in messages:
+        content = message.get("content", "")
+        if isinstance(content, str):
+            text = content
+        else:
+            text = "\n".join(
+                "[image]" if part.get("type") == "input_image" else part.get("text", "")
+                for part in content
+            )
+        lines.append(f"{message.get('role', 'user').capitalize()}: {text}")
+    return "\n\n".join(lines)
+
+
+def _has_image(message: dict) -> bool:
+    content = message.get("content")
+    return isinstance(content, list) and any(
+        part.get("type") == "input_image" for part in content
+    )
+
+
+def _stub_images(message: dict) -> dict:
+    content = [
+        {"type": "input_text", "text": IMAGE_STUB}
+        if part.get("type") == "input_image"
+        else part
+        for part in message["content"]
+    ]
+    return dict(message, content=content)
+
+
+class ContextBudget:
+    """Builds the capped request payload from the full conversation context.
+
+    The first message (system prompt) and the newest message are always kept.
+    State is the index of the first kept turn, the index below which images are
+    stubbed and the running summary of messages before `summary_upto`; all of them
+    only move forward until `reset()`.
+    """
+
+    def __init__(self, max_tokens: int = DEFAULT_BUDGET, low_water: float = LOW_WATER):
+        self.max_tokens = max_tokens
+        self.low_water = low_water
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.reset()
+
+    def reset(self):
+        """Forgets compaction state; call when the context is cleared or replaced."""
+        with self._lock:
+            self.start = 1
+            self.image_cutoff = 1
+            self.tokens = 0
+            self.summary = ""
+            self.summary_upto = 1
+            self._summary_pending = False
+            self._summary_changed = False
+            # Summaries started before a reset are discarded when they finish
+            self._generation += 1
+
+    def _window(self, context):
+        window = context[:1]
+        with self._lock:
+            summary, first = self.summary, max(self.start, self.summary_upto)
+        if summary:
+            window.append(
+                {
+                    "role": "developer",
+                    "content": [
+                        {"type": "input_text", "text": SUMMARY_PREFIX + summary}
+                    ],
+                }
+            )
+        for i in range(first, len(context)):
+            message = context[i]
+            if i < self.image_cutoff and _has_image(message):
+                message = _stub_images(message)
+            window.append(message)
+        return window
+
+    def estimate(self, context) -> int:
+        """Returns the estimated size of the payload `build()` would produce now."""
+        self.tokens = estimate_tokens(self._window(context))
+        return self.tokens
+
+    def build(self, context):
+        """
+        Returns the payload for the next request, compacting it if over budget.
+
+        Returns:
+            tuple[list[dict], bool]: The messages to send and whether the kept
+            prefix changed (a server-side chain must then be dropped).
+        """
+        self.start = min(max(self.start, 1), max(len(context) - 1, 1))
+        with self._lock:
+            # A summary that landed since the last request changes the prefix
+            summary_changed, self._summary_changed = self._summary_changed, False
+        window = self._window(context)
+        tokens = estimate_tokens(window)
+        if tokens <= self.max_tokens:
+            self.tokens = tokens
+            return window, summary_changed
+
+        target = int(self.max_tokens * self.low_water)
+        before = tokens
+        with self._lock:
+            self.start = max(self.start, self.summary_upto)
+        # 1. Stub images in every turn but the newest
+        last = len(context) - 1
+        if self.image_cutoff < last and any(
+            _has_image(m) for m in context[self.image_cutoff : last]
+        ):
+            self.image_cutoff = last
+            window = self._window(context)
+            tokens = estimate_tokens(window)
+        # 2. Drop the oldest turns, always starting the window on a user message
+        while tokens > target and self.start < last:
+            self.start += 1
+            while self.start < last and context[self.start].get("role") != "user":
+                self.start += 1
+            window = self._window(context)
+            tokens = estimate_tokens(window)
+        if tokens > self.max_tokens:
+            logger.warning(
+                f"Newest message alone is ~{tokens} tokens, over the {self.max_tokens} budget."
+            )
+        logger.info(
+            f"Context compacted from ~{before} to ~{tokens} tokens "
+            f"(keeping messages {self.start}..{last}, images stubbed before {self.image_cutoff})."
+        )
+        self.tokens = tokens
+        return window, True
+
+    def summarize_async(self, context, summarize):
+        """
+        Folds older turns into the running summary on a background thread.
+
+        Does nothing if a summary is already being made or if the turns older than
+        the newest SUMMARY_KEEP_MESSAGES are too small to be worth it. The result is
+        picked up by the next `build()`.
+
+        Args:
+            context (list): The full conversation context.
+            summarize (callable): `summarize(transcript, previous_summary) -> str`.
+
+        Returns:
+            threading.Thread | None: The worker thread, if one was started.
+        """
+        end = len(context) - SUMMARY_KEEP_MESSAGES
+        # Keep whole exchanges verbatim: the kept tail starts on a user message
+        while end > 1 and context[end].get("role") != "user":
+            end -= 1
+        with self._lock:
+            if self._summary_pending:
+                return None
+            begin = max(self.summary_upto, self.start)
+            if end <= begin:
+                return None
+            turns = context[begin:end]
+            if estimate_tokens(turns) < SUMMARY_MIN_TOKENS:
+                return None
+            self._summary_pending = True
+            generation, previous = self._generation, self.summary
+
+        def _job():
+            try:
+                summary = summarize(transcript(turns), previous)
+            except Exception as e:
+                logger.error(f"Summarizing context failed: {e}")
+                summary = ""
+            with self._lock:
+                if generation != self._generation:
+                    logger.info("Context was reset while summarizing; summary discarded.")
+                    return
+                self._summary_pending = False
+                if summary:
+                    self.summary = summary
+                    self.summary_upto = end
+                    self._summary_changed = True
+                    logger.info(
+                        f"Messages {begin}..{end - 1} (~{estimate_tokens(turns)} tokens) "
+                        f"folded into a ~{estimate_message_tokens({'content': summary})}-token summary."
+                    )
+
+        thread = threading.Thread(target=_job, daemon=True, name="ContextSummary")
+        thread.start()
+        return thread
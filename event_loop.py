@@ -0,0 +1,83 @@
+"""
+Process-wide asyncio event loop running on a background daemon thread.
+
+Async clients (httpx.AsyncClient, edge-tts, AsyncOpenAI) are bound to the loop they
+first run on, so everything async in the app is scheduled here instead of creating a
+new loop per request with asyncio.run().
+"""
+
+import asyncio
+import threading
+import logging
+import logging_config
+
+root_logger = logging_config.setup_root_logging("event_loop.log")
+logger = logging.getLogger(__name__)
+
+__all__ = ("get_loop", "submit", "call_soon", "shutdown")
+
+_loop = None
+_thread = None
+_lock = threading.Lock()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """
+    Returns the shared event loop, starting its thread on first use.
+    """
+    global _loop, _thread
+    with _lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def _run(loop):
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+
+            _thread = threading.Thread(
+                target=_run, args=(_loop,), daemon=True, name="AsyncioLoop"
+            )
+            _thread.start()
+            ready.wait()
+            logger.info("Shared asyncio event loop started.")
+        return _loop
+
+
+def submit(coro):
+    """
+    Schedules a coroutine on the shared loop from any thread.
+
+    Args:
+        coro: The coroutine object to run.
+
+    Returns:
+        concurrent.futures.Future: Cancelling this future cancels the underlying task.
+    """
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+
+def call_soon(callback, *args):
+    """
+    Schedules a plain callback on the shared loop from any thread.
+    """
+    get_loop().call_soon_threadsafe(callback, *args)
+
+
+def shutdown(timeout=2.0):
+    """
+    Stops the shared loop and waits for its thread to exit.
+    """
+    global _loop, _thread
+    with _lock:
+        loop, thread = _loop, _thread
+        _loop, _thread = None, None
+    if loop is None:
+        return
+    loop.call_soon_threadsafe(loop.stop)
+    if thread is not None:
+        thread.join(timeout=timeout)
+    if not loop.is_running():
+        loop.close()
+    logger.info("Shared asyncio event loop stopped.")
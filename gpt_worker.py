@@ -0,0 +1,112 @@
+"""
+Qt worker that streams one GPT reply for the UI.
+
+`GPTWorker` lives on a QThread but runs the request itself on the shared asyncio loop
+from `event_loop`, so an abort cancels the stream (and closes its connection) at once.
+Decoded events are re-emitted as Qt signals for the main thread.
+"""
+
+import concurrent.futures
+import logging
+
+import httpx
+from PyQt6.QtCore import QObject, pyqtSignal, pyqtSlot
+
+import event_loop
+import logging_config
+import openai_helper as openai
+
+root_logger = logging_config.setup_root_logging("gpt_worker.log")
+logger = logging.getLogger(__name__)
+
+__all__ = ("GPTWorker",)
+
+
+class GPTWorker(QObject):
+    chunk = pyqtSignal(object)  # sse_parser.ResponseEvent (text deltas etc.)
+    done = pyqtSignal()  # finished successfully
+    error = pyqtSignal(str)  # error message
+
+    def __init__(self, content, tools=None):
+        super().__init__()
+        self._content = content
+        self._tools = tools
+        self._abort = False
+        self._future = None
+        self._previous_response_id = None
+        self._prompt_cache_key = None
+        self._resumable = False
+        self._emitted = False
+
+    @pyqtSlot()
+    def run(self):
+        if self._abort:
+            self.done.emit()
+            return
+        # Stream on the shared asyncio loop so abort_now() can cancel the request
+        self._future = event_loop.submit(self._stream())
+        if self._abort:
+            self._future.cancel()
+        try:
+            self._future.result()
+            self.done.emit()
+        except concurrent.futures.CancelledError:
+            logger.info("GPT stream cancelled.")
+            self.done.emit()
+        except Exception as e:
+            self.error.emit(str(e))
+
+    async def _stream(self):
+        try:
+            await self._consume()
+        except httpx.HTTPStatusError as e:
+            # The stored chain may have expired; nothing was shown yet, so resend
+            # the full history once instead of failing the turn.
+            if (
+                not self._previous_response_id
+                or self._emitted
+                or e.response.status_code not in (400, 404)
+            ):
+                raise
+            logger.warning(
+                f"Chained request rejected ({e.response.status_code}); resending full history."
+            )
+            self._previous_response_id = None
+            await self._consume()
+
+    async def _consume(self):
+        # With a server-side chain only the newest message (last item) is sent
+        messages = self._content[-1:] if self._previous_response_id else self._content
+        async for obj in openai.chat_with_gpt5_stream_async(
+            messages=messages,
+            tools=self._tools,
+            previous_response_id=self._previous_response_id,
+            prompt_cache_key=self._prompt_cache_key,
+            resumable=self._resumable,
+        ):
+            self._emitted = True
+            self.chunk.emit(obj)
+
+    def abort_now(self):
+        self._abort = True
+        if self._future is not None:
+            # Cancels the streaming task, which closes the connection right away
+            self._future.cancel()
+
+    def set_content(self, content):
+        self._content = content
+
+    def set_tools(self, tools):
+        self._tools = tools
+
+    def set_conversation_state(
+        self, previous_response_id=None, prompt_cache_key=None, resumable=False
+    ):
+        """Chain onto a stored response so only the newest message is uploaded.
+
+        `resumable` streams the reply as a stored background response, so a dropped
+        connection picks up where it left off instead of failing the turn.
+        """
+        self._previous_response_id = previous_response_id
+        self._prompt_cache_key = prompt_cache_key
+        self._resumable = resumable
@@ -0,0 +1,253 @@
+"""
+Shared pooled HTTP transport for all OpenAI traffic (chat, transcription and TTS).
+
+A single keep-alive `httpx.Client` is reused for every blocking request, and a single
+`httpx.AsyncClient` (bound to the shared event loop in `event_loop`) for streaming chat,
+so that only the first call pays for the TCP/TLS handshake. HTTP/2 is enabled when the optional `h2`
+package is installed (pip install "httpx[http2]") and can be turned off with
+SIDEKICK_HTTP2=0.
+"""
+
+import os
+import threading
+import logging
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+import logging_config
+import event_loop
+
+root_logger = logging_config.setup_root_logging("http_transport.log")
+logger = logging.getLogger(__name__)
+
+__all__ = (
+    "get_client",
+    "get_async_client",
+    "get_openai_client",
+    "get_async_openai_client",
+    "prewarm",
+    "close",
+)
+
+HTTP2_ENABLED = os.getenv("SIDEKICK_HTTP2", "1") != "0"
+
+# Pool sizing: chat, transcription and TTS can overlap, so keep a few sockets warm.
+MAX_CONNECTIONS = 10
+MAX_KEEPALIVE_CONNECTIONS = 5
+KEEPALIVE_EXPIRY = 90.0  # seconds an idle connection stays in the pool
+
+# Reasoning models can pause for a long time before the first streamed token.
+TIMEOUT = httpx.Timeout(connect=10.0, read=300.0, write=60.0, pool=10.0)
+PREWARM_TIMEOUT = 5.0
+
+_client = None
+_async_client = None
+_http2 = None
+_openai_clients = {}
+_async_openai_clients = {}
+# Taken on the shared event loop thread as well as from Qt and worker threads, so
+# any wait for it stalls the loop. Critical sections only read, check and swap the
+# module globals; clients are created and closed outside it.
+_lock = threading.Lock()
+_prewarm_in_flight = threading.Event()
+
+
+def _http2_available() -> bool:
+    """
+    Returns True if HTTP/2 is enabled and the `h2` package is importable.
+    """
+    global _http2
+    if _http2 is None:
+        _http2 = HTTP2_ENABLED
+        if _http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.info(
+                    "Package 'h2' not installed; using HTTP/1.1 keep-alive pooling."
+                )
+                _http2 = False
+    return _http2
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+    )
+
+
+def get_client() -> httpx.Client:
+    """
+    Returns the process-wide pooled `httpx.Client`, creating it on first use.
+    """
+    global _client
+    with _lock:
+        client = _client
+    if client is not None and not client.is_closed:
+        return client
+    http2 = _http2_available()
+    created = httpx.Client(http2=http2, timeout=TIMEOUT, limits=_limits())
+    with _lock:
+        if _client is None or _client.is_closed:
+            _client = created
+        client = _client
+    if client is created:
+        logger.info(f"Shared HTTP client created (http2={http2}).")
+    else:
+        created.close()  # another thread got there first
+    return client
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    Returns the process-wide pooled `httpx.AsyncClient`, creating it on first use.
+
+    The client must only be awaited on the shared loop from `event_loop.get_loop()`.
+    """
+    global _async_client
+    with _lock:
+        client = _async_client
+    if client is not None and not client.is_closed:
+        return client
+    http2 = _http2_available()
+    # Built outside the lock; a spare from a lost race has no connections to close
+    created = httpx.AsyncClient(http2=http2, timeout=TIMEOUT, limits=_limits())
+    with _lock:
+        if _async_client is None or _async_client.is_closed:
+            _async_client = created
+        client = _async_client
+    if client is created:
+        logger.info(f"Shared async HTTP client created (http2={http2}).")
+    return client
+
+
+def _sdk_client(cache, api_key, create, http_client):
+    # Like the pools: look up under the lock, build outside it, then install
+    with _lock:
+        sdk_client = cache.get(api_key)
+    if sdk_client is not None and sdk_client._client is http_client:
+        return sdk_client
+    created = create(api_key=api_key, http_client=http_client)
+    with _lock:
+        sdk_client = cache.get(api_key)
+        if sdk_client is None or sdk_client._client is not http_client:
+            cache[api_key] = sdk_client = created
+    return sdk_client
+
+
+def get_openai_client(api_key=None) -> OpenAI:
+    """
+    Returns an `OpenAI` SDK client that sends its requests through the shared pool.
+
+    Args:
+        api_key (str, optional): API key; defaults to the OPENAI_API_KEY environment variable.
+
+    Returns:
+        OpenAI: A cached client instance (one per API key).
+    """
+    api_key = api_key or os.getenv("OPENAI_API_KEY")
+    return _sdk_client(_openai_clients, api_key, OpenAI, get_client())
+
+
+def get_async_openai_client(api_key=None) -> AsyncOpenAI:
+    """
+    Returns an `AsyncOpenAI` SDK client that sends its requests through the shared
+    async pool. Like that pool, it must only be awaited on the shared event loop.
+
+    Args:
+        api_key (str, optional): API key; defaults to the OPENAI_API_KEY environment variable.
+
+    Returns:
+        AsyncOpenAI: A cached client instance (one per API key).
+    """
+    api_key = api_key or os.getenv("OPENAI_API_KEY")
+    return _sdk_client(_async_openai_clients, api_key, AsyncOpenAI, get_async_client())
+
+
+def prewarm(url, headers=None, connections=None):
+    """
+    Opens (or refreshes) pooled connections to `url` in a background thread.
+
+    The request is a cheap HEAD whose only purpose is to leave a live, TLS-negotiated
+    socket in the pool so the next real request skips the handshake. Both the blocking
+    pool and the async (streaming) pool are warmed. Calls made while a previous
+    pre-warm is still running are ignored.
+
+    Args:
+        url (str): Any URL on the target host.
+        headers (dict, optional): Headers to send with the warm-up request.
+        connections (int, optional): Number of parallel sockets to open. Defaults to
+            1 with HTTP/2 (multiplexed) and 2 with HTTP/1.1.
+
+    Returns:
+        threading.Thread | None: The warm-up thread, or None if one is already running.
+    """
+    with _lock:
+        if _prewarm_in_flight.is_set():
+            logger.debug("Pre-warm already in flight, skipping.")
+            return None
+        _prewarm_in_flight.set()
+
+    client = get_client()
+    if connections is None:
+        connections = 1 if _http2_available() else 2
+
+    warmed = []
+
+    async def _warm_async():
+        try:
+            await get_async_client().head(
+                url, headers=headers, timeout=PREWARM_TIMEOUT
+            )
+            warmed.append(True)
+        except httpx.HTTPError as e:
+            logger.warning(f"Async connection pre-warm to {url} failed: {e}")
+
+    def _warm_one():
+        try:
+            client.head(url, headers=headers, timeout=PREWARM_TIMEOUT)
+            warmed.append(True)
+        except httpx.HTTPError as e:
+            logger.warning(f"Connection pre-warm to {url} failed: {e}")
+
+    def _warm():
+        try:
+            workers = [
+                threading.Thread(target=_warm_one, daemon=True)
+                for _ in range(connections)
+            ]
+            async_warm = event_loop.submit(_warm_async())
+            for w in workers:
+                w.start()
+            for w in workers:
+                w.join()
+            async_warm.result()
+            if warmed:
+                logger.info(f"Pre-warmed {len(warmed)} connection(s) to {url}.")
+        finally:
+            _prewarm_in_flight.clear()
+
+    thread = threading.Thread(target=_warm, daemon=True, name="HTTPPrewarm")
+    thread.start()
+    return thread
+
+
+def close():
+    """
+    Closes the shared client and drops all pooled connections.
+    """
+    global _client, _async_client
+    # Detach the clients under the lock, but close them after releasing it: the async
+    # close runs on the shared loop, where a coroutine may be waiting for the lock
+    with _lock:
+        client, _client = _client, None
+        async_client, _async_client = _async_client, None
+        _openai_clients.clear()
+        _async_openai_clients.clear()
+    if client is not None:
+        client.close()
+    if async_client is not None:
+        event_loop.submit(async_client.aclose()).result(timeout=PREWARM_TIMEOUT)
+    logger.info("Shared HTTP client closed.")
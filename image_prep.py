@@ -0,0 +1,179 @@
+"""
+Screenshot preparation for vision requests: downscale, recompress and cache.
+
+Retina screenshots are far larger than what the model actually looks at, so images
+are resized to the model's useful maximum, re-encoded as JPEG and turned into an
+`input_image` content part once. Work can start in the background as soon as a
+screenshot is taken, and results are cached by content hash.
+"""
+
+import base64
+import hashlib
+import io
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional, Union
+
+from PIL import Image
+import logging_config
+
+root_logger = logging_config.setup_root_logging("image_prep.log")
+logger = logging.getLogger(__name__)
+
+__all__ = ("prepare_image", "prepare_image_async", "PreparedImage")
+
+# High detail: the image is fit within 2048x2048, then the short side to 768px.
+# Anything larger is downscaled server-side anyway, so we never send more pixels.
+HIGH_DETAIL_MAX_SIDE = 2048
+HIGH_DETAIL_SHORT_SIDE = 768
+# Low detail is a single 512x512 tile (fixed 85 tokens).
+LOW_DETAIL_MAX_SIDE = 512
+JPEG_QUALITY = 85
+CACHE_SIZE = 16
+
+
+class PreparedImage:
+    """An encoded image ready to embed in a request."""
+
+    __slots__ = ("digest", "width", "height", "detail", "data_url", "size")
+
+    def __init__(self, digest, width, height, detail, data_url):
+        self.digest = digest
+        self.width = width
+        self.height = height
+        self.detail = detail
+        self.data_url = data_url
+        self.size = len(data_url)
+
+    def message(self) -> dict:
+        """
+        Returns the `input_image` content part for the Responses API.
+        """
+        return {"type": "input_image", "image_url": self.data_url, "detail": self.detail}
+
+
+_cache = OrderedDict()  # (digest, detail) -> PreparedImage
+_pending = {}  # path -> Future
+_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ImagePrep")
+
+
+def choose_detail(width: int, height: int) -> str:
+    """
+    Picks "low" for images that already fit in a single low-detail tile, "high" otherwise.
+    """
+    if max(width, height) <= LOW_DETAIL_MAX_SIDE:
+        return "low"
+    return "high"
+
+
+def target_size(width: int, height: int, detail: str):
+    """
+    Returns the largest size the model will use for an image at the given detail.
+    """
+    if detail == "low":
+        scale = min(1.0, LOW_DETAIL_MAX_SIDE / max(width, height))
+    else:
+        scale = min(
+            1.0,
+            HIGH_DETAIL_MAX_SIDE / max(width, height),
+            HIGH_DETAIL_SHORT_SIDE / min(width, height),
+        )
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def _encode(data: bytes, digest: str, detail: Optional[str]) -> PreparedImage:
+    with Image.open(io.BytesIO(data)) as img:
+        img.load()
+        width, height = img.size
+        detail = detail or choose_detail(width, height)
+        size = target_size(width, height, detail)
+        if size != img.size:
+            img = img.resize(size, Image.Resampling.LANCZOS)
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        out = io.BytesIO()
+        img.save(out, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+    encoded = out.getvalue()
+    b64_image = base64.b64encode(encoded).decode("ascii")
+    logger.info(
+        f"Prepared image {digest[:12]}: {width}x{height} -> {size[0]}x{size[1]} "
+        f"({detail} detail), {len(data)} -> {len(encoded)} bytes"
+    )
+    return PreparedImage(
+        digest, size[0], size[1], detail, f"data:image/jpeg;base64,{b64_image}"
+    )
+
+
+def prepare_image(
+    image_path: Union[str, Path], detail: Optional[str] = None
+) -> PreparedImage:
+    """
+    Downscales, recompresses and base64-encodes an image, using the cache when possible.
+
+    If a background preparation for the same path is in flight, waits for it.
+
+    Args:
+        image_path: Path to the image file.
+        detail: "low" or "high"; chosen from the image size when None.
+
+    Returns:
+        PreparedImage: The encoded image.
+
+    Raises:
+        FileNotFoundError: If the file does not exist.
+    """
+    with _lock:
+        future = _pending.get(str(image_path))
+    if future is not None and detail is None:
+        return future.result()
+    return _prepare(image_path, detail)
+
+
+def _prepare(image_path, detail) -> PreparedImage:
+    data = Path(image_path).read_bytes()
+    digest = hashlib.sha256(data).hexdigest()
+    cache_key = (digest, detail)
+    with _lock:
+        cached = _cache.get(cache_key)
+        if cached is not None:
+            _cache.move_to_end(cache_key)
+            logger.info(f"Image cache hit for {digest[:12]}.")
+            return cached
+
+    prepared = _encode(data, digest, detail)
+    with _lock:
+        _cache[cache_key] = prepared
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return prepared
+
+
+def prepare_image_async(image_path: Union[str, Path], detail: Optional[str] = None):
+    """
+    Starts preparing an image in the background.
+
+    A later `prepare_image()` call for the same path picks up the result instead of
+    encoding again.
+
+    Returns:
+        concurrent.futures.Future: Resolves to a PreparedImage.
+    """
+    key = str(image_path)
+
+    def _job():
+        try:
+            return _prepare(image_path, detail)
+        finally:
+            with _lock:
+                _pending.pop(key, None)
+
+    with _lock:
+        future = _pending.get(key)
+        if future is None:
+            future = _executor.submit(_job)
+            _pending[key] = future
+    return future
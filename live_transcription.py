@@ -0,0 +1,227 @@
+"""
+Transcription of a voice recording while it is still being made.
+
+The Talk button feeds microphone blocks to a `SegmentedTranscriber`, which cuts the
+audio at pauses in speech (or at a hard cap during a long monologue) and uploads
+each finished segment for transcription in the background. Results are stitched
+in recording order and reported as they come in, so when the button is released
+only the last segment is still waiting on the network.
+"""
+
+import queue
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+import numpy as np
+import logging_config
+import openai_helper
+
+root_logger = logging_config.setup_root_logging("live_transcription.log")
+logger = logging.getLogger(__name__)
+
+__all__ = ("SegmentedTranscriber",)
+
+# Length of the frames whose loudness is measured
+FRAME_SECONDS = 0.02
+# A frame is silent below this int16 RMS (about -40 dBFS)...
+SILENCE_RMS = 300.0
+# ...or below this fraction of the loudest frame in the segment
+SILENCE_RELATIVE = 0.1
+# A segment ends at a pause at least this long...
+PAUSE_SECONDS = 0.35
+# ...once it holds this much audio
+MIN_SEGMENT_SECONDS = 2.0
+# Without a pause, a segment is cut at its quietest point near this length
+MAX_SEGMENT_SECONDS = 20.0
+# How far back from the cap to look for that quietest point
+CUT_SEARCH_SECONDS = 2.0
+# Segments being transcribed at once
+MAX_IN_FLIGHT = 3
+# Characters of the text so far sent along with the next segment as context
+PROMPT_CHARS = 200
+
+_END = object()
+
+
+class SegmentedTranscriber:
+    """Transcribes a recording segment by segment while it is being fed.
+
+    `feed()` is cheap enough for the audio callback: blocks are handed to a
+    segmenting thread, which sleeps while no audio arrives. `on_text` is called
+    (from a worker thread) with the stitched text each time the transcribed part
+    of the recording grows.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int = 16000,
+        encoding: str = "flac",
+        on_text: Optional[Callable[[str], None]] = None,
+        transcribe: Callable = openai_helper.transcribe_audio,
+    ):
+        self.sample_rate = sample_rate
+        self.encoding = encoding
+        self.on_text = on_text
+        self._transcribe = transcribe
+        self._frame = max(1, int(sample_rate * FRAME_SECONDS))
+
+        # Segmenting state, only touched by the segmenting thread
+        self._blocks = []  # samples of the open segment
+        self._rms = np.zeros(0, dtype=np.float32)  # loudness of its whole frames
+        self._leftover = np.zeros(0, dtype=np.int16)  # samples short of a frame
+
+        # Transcription results, in recording order
+        self._futures = []
+        self._texts = []
+        self._reported = 0
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(
+            max_workers=MAX_IN_FLIGHT, thread_name_prefix="Transcription"
+        )
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._segment_worker, daemon=True, name="TranscriptSegmenter"
+        )
+        self._thread.start()
+
+    def feed(self, samples: np.ndarray):
+        """
+        Adds recorded mono int16 samples; the caller must not reuse the array.
+        """
+        self._queue.put(samples.reshape(-1))
+
+    def finish(self, timeout: Optional[float] = None) -> str:
+        """
+        Ends the recording and returns the full transcription once the last segment
+        is done.
+
+        Raises:
+            Exception: The first error a segment's transcription raised.
+        """
+        self._queue.put(_END)
+        self._thread.join()
+        try:
+            for future in list(self._futures):
+                future.result(timeout)
+        finally:
+            self._pool.shutdown(wait=False)
+        return self.text
+
+    def cancel(self):
+        """Drops the recording and any transcription still in flight."""
+        self._queue.put(_END)
+        self._thread.join()
+        for future in self._futures:
+            future.cancel()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    @property
+    def text(self) -> str:
+        """The transcription of the segments done so far, in order."""
+        with self._lock:
+            return self._stitch(self._reported)
+
+    def _stitch(self, count: int) -> str:
+        parts = (text.strip() for text in self._texts[:count])
+        return " ".join(part for part in parts if part)
+
+    # ------------------------------------------------------------ segmenting
+
+    def _segment_worker(self):
+        while True:
+            block = self._queue.get()
+            if block is _END:
+                break
+            self._add(block)
+            cut = self._find_cut()
+            if cut:
+                self._submit(self._take(cut))
+        # The rest of the recording is the last segment. If no speech was heard at
+        # all, it is sent anyway rather than returning nothing.
+        samples = self._take(len(self._rms))
+        if len(self._leftover):
+            samples = np.concatenate((samples, self._leftover))
+        if self._is_speech(self._rms_of(samples)) or not self._futures:
+            if len(samples):
+                self._submit(samples, force=True)
+
+    def _rms_of(self, samples: np.ndarray) -> np.ndarray:
+        frames = samples[: len(samples) - len(samples) % self._frame]
+        frames = frames.reshape(-1, self._frame).astype(np.float32)
+        return np.sqrt(np.mean(frames * frames, axis=1))
+
+    def _add(self, block: np.ndarray):
+        samples = np.concatenate((self._leftover, block)) if len(self._leftover) else block
+        whole = len(samples) - len(samples) % self._frame
+        self._leftover = samples[whole:]
+        if whole:
+            self._blocks.append(samples[:whole])
+            self._rms = np.concatenate((self._rms, self._rms_of(samples[:whole])))
+
+    def _is_speech(self, rms: np.ndarray) -> bool:
+        return bool(len(rms)) and float(rms.max()) >= SILENCE_RMS
+
+    def _find_cut(self) -> int:
+        """Returns the frame to end the open segment at, or 0 to keep it open."""
+        rms = self._rms
+        frames = len(rms)
+        if frames * FRAME_SECONDS < MIN_SEGMENT_SECONDS:
+            return 0
+        threshold = max(SILENCE_RMS, SILENCE_RELATIVE * float(rms.max()))
+        loud = np.flatnonzero(rms >= threshold)
+        pause = frames - (loud[-1] + 1) if len(loud) else frames
+        if len(loud) and pause * FRAME_SECONDS >= PAUSE_SECONDS:
+            # Cut in the middle of the pause
+            return frames - pause // 2
+        if frames * FRAME_SECONDS >= MAX_SEGMENT_SECONDS:
+            search = max(1, int(CUT_SEARCH_SECONDS / FRAME_SECONDS))
+            return frames - search + int(np.argmin(rms[-search:])) + 1
+        return 0
+
+    def _take(self, frames: int) -> np.ndarray:
+        """Removes the first `frames` frames from the open segment and returns them."""
+        if not self._blocks:
+            return np.zeros(0, dtype=np.int16)
+        samples = np.concatenate(self._blocks)
+        cut = frames * self._frame
+        rest = samples[cut:]
+        self._blocks = [rest] if len(rest) else []
+        self._rms = self._rms[frames:]
+        return samples[:cut]
+
+    # --------------------------------------------------------- transcription
+
+    def _submit(self, samples: np.ndarray, force: bool = False):
+        if not force and not self._is_speech(self._rms_of(samples)):
+            logger.debug("Skipping a segment without speech.")
+            return
+        with self._lock:
+            index = len(self._futures)
+            self._texts.append(None)
+            # Earlier text helps with names and continuity; don't wait for it though
+            prompt = self._stitch(self._reported)[-PROMPT_CHARS:] or None
+        logger.info(
+            f"Transcribing segment {index} ({len(samples) / self.sample_rate:.1f}s)."
+        )
+        future = self._pool.submit(self._transcribe_segment, index, samples, prompt)
+        self._futures.append(future)
+
+    def _transcribe_segment(self, index: int, samples: np.ndarray, prompt: Optional[str]):
+        text = self._transcribe(
+            samples, sample_rate=self.sample_rate, encoding=self.encoding, prompt=prompt
+        )
+        with self._lock:
+            self._texts[index] = text if isinstance(text, str) else ""
+            reported = self._reported
+            while self._reported < len(self._texts) and self._texts[self._reported] is not None:
+                self._reported += 1
+            grew = self._reported > reported
+            stitched = self._stitch(self._reported)
+        if grew and self.on_text is not None:
+            try:
+                self.on_text(stitched)
+            except Exception as e:
+                logger.error(f"Transcript callback failed: {e}")
+        return text
@@ -1,6 +1,6 @@
 import sys
-import datetime, time
-from PyQt6.QtCore import QObject, pyqtSignal, pyqtSlot
+import datetime
+from PyQt6.QtCore import pyqtSignal
 import os
 from PyQt6.QtGui import QIcon
 from PyQt6.QtWidgets import (
@@ -30,56 +30,34 @@ from PyQt6.QtCore import (
 import screen_grab
 import clipboard
 import openai_helper as openai
+import sse_parser
+import image_prep
+import context_budget
+import live_transcription
 import os
 import json
-import pygame, requests
+import hashlib
+import httpx
 
 import sounddevice as sd
 import numpy as np
 import threading
-import tempfile
-import wave
 import logging
 import TTS_openai as TTS
 import logging_config
 import TTS_openai_streaming as TTS_S
+from gpt_worker import GPTWorker
 
 logging_config.setup_root_logging("sidekick.log")
 logger = logging.getLogger(__name__)
 
-
-class GPTWorker(QObject):
-    chunk = pyqtSignal(dict)  # stream text deltas
-    done = pyqtSignal()  # finished successfully
-    error = pyqtSignal(str)  # error message
-
-    def __init__(self, content, tools=None):
-        super().__init__()
-        self._content = content
-        self._tools = tools
-        self._abort = False
-
-    @pyqtSlot()
-    def run(self):
-        try:
-            for obj in openai.chat_with_gpt5_stream(
-                messages=self._content, tools=self._tools
-            ):
-                if self._abort:
-                    break
-                self.chunk.emit(obj)
-            self.done.emit()
-        except Exception as e:
-            self.error.emit(str(e))
-
-    def abort_now(self):
-        self._abort = True
-
-    def set_content(self, content):
-        self._content = content
-
-    def set_tools(self, tools):
-        self._tools = tools
+# Chain turns server-side with previous_response_id so each request only carries the
+# new user message; set SIDEKICK_SERVER_SIDE_STATE=0 to send the full history instead
+SERVER_SIDE_STATE = os.getenv("SIDEKICK_SERVER_SIDE_STATE", "1") != "0"
+# Stream replies as stored background responses that resume after a dropped
+# connection. Off by default: background mode adds time to first token and is not
+# available under Zero Data Retention. Set SIDEKICK_RESUMABLE_STREAMS=1 to enable.
+RESUMABLE_STREAMS = os.getenv("SIDEKICK_RESUMABLE_STREAMS", "0") == "1"
 
 
 class PromptInputEventFilter(QObject):
@@ -113,6 +91,9 @@ class PromptInputEventFilter(QObject):
 class SidekickUI(QWidget):
     """Main UI class for the Sidekick application."""
 
+    # Transcription so far of the recording in progress (from a worker thread)
+    transcript_updated = pyqtSignal(str)
+
     def __init__(self):
         """Initialize the Sidekick UI and state."""
         super().__init__()
@@ -120,7 +101,14 @@ class SidekickUI(QWidget):
         # Keep the window always on top
         self.setWindowFlags(self.windowFlags() | Qt.WindowType.WindowStaysOnTopHint)
 
-        self.mininumAnswerLength = 100
+        # Exact chunks sent to TTS for the reply on display, replayed by Read so
+        # they hit the TTS cache
+        self.spoken_chunks = []
+        self.audio_upload_encoding = "flac"  # "flac", "opus" or "wav"
+        # Transcribes the recording segment by segment while Talk is held
+        self.transcriber = None
+        self.audio_recording = False
+        self.transcript_updated.connect(self.on_transcript_updated)
         self.clipboard = False
         self.screeshot = False
         self.websearch = False
@@ -236,6 +224,15 @@ class SidekickUI(QWidget):
                 ],
             }
         ]
+        # Server-side conversation state (SERVER_SIDE_STATE)
+        self.server_side_state = SERVER_SIDE_STATE
+        self.previous_response_id = None
+        self.pending_response_id = None
+        # Why the last reply was truncated, if it was
+        self.incomplete_reason = None
+        self.prompt_cache_key = self.make_prompt_cache_key()
+        # Caps the payload sent each turn; self.context keeps the full history
+        self.context_budget = context_budget.ContextBudget()
         self.TALK_BUTTON_EXPANDED_DEFAULT_STYLE = """
                 QPushButton {
                     border-radius: 10px;
@@ -386,12 +383,15 @@ class SidekickUI(QWidget):
 
         self.streaming_reply = ""
         self.citations = dict()
-        self.partial_transciption = ""
         self.init_tts_service()
-        self.chunker = TTS_S.SentenceChunker()
+        # Cuts the streamed reply into TTS chunks as the deltas arrive
+        self.chunker = TTS_S.StreamingSentenceChunker()
         self.tts_service.TTS_instructions = "Cheerful and informative fast tone."
 
-        self.add_chunk("Your trusty side kick is READY!")
+        self.add_full_text("Your trusty side kick is READY!")
+
+        # Open pooled API connections early so the first prompt skips the handshake
+        openai.prewarm_connections()
 
         self.init_ui()
 
@@ -625,13 +625,14 @@ class SidekickUI(QWidget):
         context_options_layout.addWidget(self.save_conversation_button)
 
         # Clear context button
-        self.clear_context_button = QPushButton(
-            f"Clear Context ({len(self.context)-1})"
-        )
+        self.clear_context_button = QPushButton()
         self.clear_context_button.clicked.connect(self.clear_context)
         self.clear_context_button.setToolTip(
-            "Clear conversation context. (#) indicates number of messages saved in context."
+            "Clear conversation context. (#) indicates number of messages saved in context, "
+            "followed by the estimated tokens sent per request "
+            f"(budget {self.context_budget.max_tokens})."
         )
+        self.update_context_counter()
 
         context_options_layout.addWidget(self.clear_context_button)
 
@@ -692,6 +693,32 @@ class SidekickUI(QWidget):
     def on_gpt_error(self, error):
         logger.error(f"Received error: {error}")
         self.first_chunk = False
+        self.incomplete_reason = None
+        self.reset_conversation_chain()
+        if self.streaming_reply:
+            # Keep what was already generated on screen and in context
+            logger.info("Keeping partial reply after stream failure.")
+            partial_reply = self.format_web_reply(self.streaming_reply, self.citations)
+            self.reply_display.setPlainText(partial_reply)
+            self.context.append(
+                {
+                    "role": "assistant",
+                    "content": [{"type": "output_text", "text": partial_reply}],
+                }
+            )
+            self.update_context_counter()
+            if self.auto_read and self.chunker.pending:
+                self.flush_partial_transcription()
+        self.streaming_reply = ""
+        self.citations = dict()
+        self.chunker.reset()
+        style = (
+            self.TALK_BUTTON_EXPANDED_DEFAULT_STYLE
+            if self.expand_at_start
+            else self.TALK_BUTTON_COLLAPSED_DEFAULT_STYLE
+        )
+        self.update_talk_button("Talk (Hold)", styleSheet=style)
+        self.talk_button.setEnabled(True)
         self.update_status_bar(f"Error occured. Please check log.", "red", 3000)
         # Re-enable the send button on error
         self.send_button.setEnabled(True)
@@ -723,6 +750,8 @@ class SidekickUI(QWidget):
     def on_screenshot_button_clicked(self):
         self.img_url = screen_grab.grab_area_interactive()
         if self.img_url:
+            # Downscale and encode now so it is ready by the time the prompt is sent
+            image_prep.prepare_image_async(self.img_url)
             self.update_status_bar(
                 text="Screenshot added to context",
                 color="green",
@@ -787,7 +816,31 @@ class SidekickUI(QWidget):
                 ],
             }
         ]
-        self.clear_context_button.setText(f"Clear Context ({len(self.context)-1})")
+        self.reset_conversation_chain()
+        self.context_budget.reset()
+        self.prompt_cache_key = self.make_prompt_cache_key()
+        self.update_context_counter()
+
+    def update_context_counter(self):
+        """Show the message count and estimated payload tokens on the Clear Context button."""
+        tokens = self.context_budget.estimate(self.context)
+        estimate = f"{tokens / 1000:.1f}k" if tokens >= 1000 else str(tokens)
+        self.clear_context_button.setText(
+            f"Clear Context ({len(self.context)-1}) · ~{estimate} tok"
+        )
+
+    def reset_conversation_chain(self):
+        """Forget the server-side chain so the next request sends the full history."""
+        if self.previous_response_id:
+            logger.info("Server-side conversation chain cleared.")
+        self.previous_response_id = None
+        self.pending_response_id = None
+
+    def make_prompt_cache_key(self):
+        """Return a prompt-cache key that is stable for a given system prompt."""
+        system_text = self.context[0]["content"][0]["text"] if self.context else ""
+        digest = hashlib.sha256(system_text.encode("utf-8")).hexdigest()[:16]
+        return f"sidekick-{digest}"
 
     def save_conversation(self):
         """Save the current conversation to a file."""
@@ -825,9 +878,10 @@ class SidekickUI(QWidget):
             try:
                 with open(file_path, "r", encoding="utf-8") as f:
                     self.context = json.load(f)
-                    self.clear_context_button.setText(
-                        f"Clear Context ({len(self.context)})"
-                    )
+                    # The server knows nothing about a loaded history
+                    self.reset_conversation_chain()
+                    self.context_budget.reset()
+                    self.update_context_counter()
             except Exception as e:
                 print(f"Error loading conversation: {e}")
                 self.update_status_bar(
@@ -1069,8 +1123,11 @@ class SidekickUI(QWidget):
                 return
         else:
             """Start recording audio for voice input."""
-            # TTS.clear()
             logger.debug("Talk button pressed")
+            # Barge-in: talking over the assistant silences it and cancels its speech
+            self.stop_playback()
+            # Refresh pooled connections while the user is still speaking
+            openai.prewarm_connections()
             self.update_status_bar(
                 text="Listening...",
                 timer=-1,
@@ -1084,10 +1141,18 @@ class SidekickUI(QWidget):
             self.audio_fs = 16000  # Sample rate
             self.audio_recording = True
             self.audio_frames = []
+            transcriber = live_transcription.SegmentedTranscriber(
+                sample_rate=self.audio_fs,
+                encoding=self.audio_upload_encoding,
+                on_text=self.transcript_updated.emit,
+            )
+            self.transcriber = transcriber
 
             def callback(indata, frames, time, status):
                 if self.audio_recording:
-                    self.audio_frames.append(indata.copy())
+                    block = indata.copy()
+                    self.audio_frames.append(block)
+                    transcriber.feed(block)
                 else:
                     raise sd.CallbackStop()
 
@@ -1125,6 +1190,9 @@ class SidekickUI(QWidget):
                 audio_data = np.concatenate(self.audio_frames, axis=0)
             except Exception as e:
                 logger.error(f"Error combining audio frames: {e}")
+                if self.transcriber is not None:
+                    self.transcriber.cancel()
+                    self.transcriber = None
                 self.update_status_bar(
                     text="Error Recording",
                     color="red",
@@ -1136,23 +1204,26 @@ class SidekickUI(QWidget):
                     else self.TALK_BUTTON_COLLAPSED_DEFAULT_STYLE
                 )
                 self.update_talk_button("Talk (Hold)", styleSheet=style)
-                self.clean_last_audio_tempfile()
                 return
 
             logger.debug(f"Recorded {len(audio_data)} samples.")
 
-            # Save as WAV to a temporary file
-            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as wav_temp:
-                with wave.open(wav_temp, "wb") as wf:
-                    wf.setnchannels(1)
-                    wf.setsampwidth(2)  # 16-bit audio
-                    wf.setframerate(self.audio_fs)
-                    wf.writeframes(audio_data.tobytes())
-                self.last_audio_wav_path = wav_temp.name  # Store path for later use
-
-            logger.debug(f"Audio saved as wav in tempfile: {self.last_audio_wav_path}")
             try:
-                transcribed_text = openai.transcribe_audio(self.last_audio_wav_path)
+                # Earlier segments were transcribed while Talk was held; this waits
+                # for the last one
+                transcriber, self.transcriber = self.transcriber, None
+                try:
+                    transcribed_text = transcriber.finish()
+                except Exception as e:
+                    logger.warning(
+                        f"Live transcription failed ({e}); transcribing the whole recording."
+                    )
+                    # Upload straight from memory, compressed (no temp WAV round trip)
+                    transcribed_text = openai.transcribe_audio(
+                        audio_data,
+                        sample_rate=self.audio_fs,
+                        encoding=self.audio_upload_encoding,
+                    )
             except Exception as e:
                 logger.error(f"Error transcribing audio: {e}")
                 self.update_status_bar(
@@ -1167,26 +1238,16 @@ class SidekickUI(QWidget):
                 )
                 self.update_talk_button("Talk (Hold)", styleSheet=style)
                 return
-            finally:
-                # Clean up the temporary audio file
-                logger.info("Cleaning up last audio tempfile.")
-                self.clean_last_audio_tempfile()
 
             logger.debug(f"Transcribed text: {transcribed_text}")
             self.prompt_input.setText(transcribed_text)
             self.talk_button.setEnabled(True)
             self.on_send_button_clicked_nonblocking()
 
-    def clean_last_audio_tempfile(self):
-        """Delete the last temporary audio file if it exists."""
-        if hasattr(self, "last_audio_wav_path") and self.last_audio_wav_path:
-            try:
-                if os.path.exists(self.last_audio_wav_path):
-                    os.remove(self.last_audio_wav_path)
-                    print(f"Deleted tempfile: {self.last_audio_wav_path}")
-                self.last_audio_wav_path = None
-            except Exception as e:
-                print(f"Error deleting tempfile: {e}")
+    def on_transcript_updated(self, text):
+        """Show the transcription so far while Talk is held."""
+        if self.audio_recording:
+            self.prompt_input.setText(text)
 
     def on_websearch_state_changed(self, state):
         """Handle websearch checkbox state change."""
@@ -1216,17 +1277,6 @@ class SidekickUI(QWidget):
             except Exception as e:
                 logger.error(f"Error waiting for GPT thread to finish: {e}")
 
-        try:
-            is_playing = pygame.mixer.get_init() and pygame.mixer.music.get_busy()
-            if is_playing:
-                if pygame.mixer.get_init() and pygame.mixer.music.get_busy():
-                    pygame.mixer.music.stop()
-                    # TTS.clear()
-                    logger.info("Audio playback stopped before quitting.")
-        except Exception as e:
-            logger.error(f"Error stopping audio playback: {e}")
-        self.clean_last_audio_tempfile()
-
         if self.tts_service:
             self.tts_service.shutdown()
 
@@ -1250,7 +1300,7 @@ class SidekickUI(QWidget):
     def check_api_key(self):
         try:
             openai.chat_with_gpt5("hi")
-        except requests.exceptions.HTTPError as e:
+        except httpx.HTTPStatusError as e:
             if not self.expand_at_start:
                 self.on_expand_button_toggle()
 
@@ -1269,13 +1319,17 @@ class SidekickUI(QWidget):
 
         if self.tts_service.is_playing:
             self.stop_playback()
-            time.sleep(0.3)
 
         else:
             # Prepare the content of reply_display to be added as a chunk
             text = self.reply_display.toPlainText().strip()
             logging.debug(f"Text to read from reply_display: '{text}'")
-            if text:
+            if text and self.spoken_chunks:
+                logging.info("Replaying the chunks already spoken for this reply.")
+                self.tts_service.start_reply(" ".join(self.spoken_chunks))
+                for chunk in self.spoken_chunks:
+                    self.tts_service.add_chunk(chunk)
+            elif text:
                 logging.info("Adding chunk to TTS worker.")
                 self.add_full_text(text)
             else:
@@ -1295,33 +1349,27 @@ class SidekickUI(QWidget):
             self.first_chunk = True
             QApplication.processEvents()
 
-        t = chunk.get("type")
-        if t == "response.output_text.delta":
-            # Depending on provider schema, text might be in obj["delta"]["text"] or obj["output_text"]["delta"]
-            delta = chunk.get("delta", {})
+        t = chunk.type
+        if t == openai.STREAM_RETRYING_EVENT:
+            attempt = chunk.data.get("attempt")
+            logger.warning(f"Connection lost, resuming stream (attempt {attempt}).")
+            self.update_status_bar(
+                f"Connection lost, resuming (attempt {attempt})...", "orange", -1
+            )
+            # Restore the "Thinking..." state on the next event from the resumed stream
+            self.first_chunk = False
+        elif t == "response.output_text.delta":
+            delta = chunk.delta
             if delta:
                 if len(delta) < 30:
                     self.streaming_reply += delta
                     self.reply_display.setPlainText(self.streaming_reply)
 
                     if self.auto_read and not self.websearch:
-                        self.partial_transciption += delta
-                        logger.info(
-                            f"Updated partial_transciption: {self.partial_transciption}"
-                        )
-                        if len(self.partial_transciption) > self.mininumAnswerLength:
-                            logger.info(
-                                "partial_transciption length exceeded mininumAnswerLength, creating chunks."
-                            )
-                            chunks, self.partial_transciption = (
-                                self.chunker.create_chunks(self.partial_transciption)
-                            )
-                            logger.info(
-                                f"Chunks created: {chunks}, Remaining partial_transciption: {self.partial_transciption}"
-                            )
-                            for chunk in chunks:
-                                logger.info(f"Sending chunk to TTS: {chunk}")
-                                self.add_chunk(chunk)
+                        # Adaptive chunking: a short first clause, then larger chunks
+                        for chunk in self.chunker.feed(delta):
+                            logger.info(f"Sending chunk to TTS: {chunk}")
+                            self.add_chunk(chunk)
                 else:
                     logger.info(f"Delta is long, treating as citation: {delta}")
                     if not self.citations.get(delta, 0):
@@ -1338,9 +1386,18 @@ class SidekickUI(QWidget):
                         f"Appended citation order to streaming_reply: {self.streaming_reply}"
                     )
 
+        elif t == "response.completed":
+            self.pending_response_id = chunk.data.get("response", {}).get("id")
+
+        elif t == "response.incomplete":
+            # The reply was cut short (e.g. max_output_tokens); keep what arrived
+            self.pending_response_id = chunk.data.get("response", {}).get("id")
+            self.incomplete_reason = sse_parser.incomplete_reason(chunk)
+            logger.warning(f"Reply incomplete: {self.incomplete_reason}")
+
         elif t == "response.output_text.annotation.added":
-            url = chunk.get("annotation", {}).get("url")
-            title = chunk.get("annotation", {}).get("title", {})
+            url = chunk.data.get("annotation", {}).get("url")
+            title = chunk.data.get("annotation", {}).get("title", {})
             logger.info(f"Annotation added: url={url}, title={title}")
             for key in self.citations.keys():
                 if url in key:
@@ -1350,13 +1407,24 @@ class SidekickUI(QWidget):
 
     def on_gpt_done_streaming(self):
         logger.info("on_gpt_done_streaming called")
+        incomplete_reason, self.incomplete_reason = self.incomplete_reason, None
         if self.gpt_worker._abort:
             logger.info("DONE AFTER ABORT")
             self.reply_display.clear()
             logger.debug("Reply display cleared due to abort.")
+            self.reset_conversation_chain()
         else:
             logger.info("Received done")
-            self.clear_status_bar()
+            if incomplete_reason:
+                self.update_status_bar(
+                    f"Reply cut short ({incomplete_reason}).", "orange", 5000
+                )
+            else:
+                self.clear_status_bar()
+            if self.server_side_state and self.pending_response_id:
+                self.previous_response_id = self.pending_response_id
+            else:
+                self.reset_conversation_chain()
             if self.websearch:
                 logger.debug("Websearch mode active. Formatting web reply.")
                 final_reply = self.format_web_reply(
@@ -1369,11 +1437,11 @@ class SidekickUI(QWidget):
                     )
                     self.on_read_button_clicked_streaming()
             else:
-                if self.auto_read and self.partial_transciption:
+                if self.auto_read and self.chunker.pending:
                     logger.info(
-                        f"auto_read is enabled and partial_transciption exists, adding chunk: {self.partial_transciption}"
+                        "auto_read is enabled and unsent reply text remains, flushing it to TTS."
                     )
-                    self.add_chunk(self.partial_transciption)
+                    self.flush_partial_transcription()
 
             reply = self.streaming_reply
             logger.debug(f"Appending assistant reply to context: {reply}")
@@ -1385,16 +1453,20 @@ class SidekickUI(QWidget):
             )
             self.first_chunk = False
             # Update the clear context button to show the number of exchanges
-            self.clear_context_button.setText(f"Clear Context ({len(self.context)-1})")
+            self.update_context_counter()
+            # Condense older turns while the user reads, ready for the next prompt
+            self.context_budget.summarize_async(
+                self.context, openai.summarize_conversation
+            )
 
             # Clear the prompt input field
             self.prompt_input.clear()
             logger.info("Prompt input cleared and context button updated.")
 
-        logger.debug("Resetting streaming_reply, citations, and partial_transciption.")
+        logger.debug("Resetting streaming_reply, citations, and the TTS chunker.")
         self.streaming_reply = ""
         self.citations = dict()
-        self.partial_transciption = ""
+        self.chunker.reset()
 
         style = (
             self.TALK_BUTTON_EXPANDED_DEFAULT_STYLE
@@ -1407,8 +1479,6 @@ class SidekickUI(QWidget):
         self.talk_button.setEnabled(True)
         self.clear_status_bar()
         logger.debug("Talk button enabled.")
-        self.clean_last_audio_tempfile()
-        logger.debug("Cleaned last audio tempfile.")
         # Re-enable the send button when done
         self.send_button.setEnabled(True)
         self.prompt_input.setEnabled(True)
@@ -1452,10 +1522,9 @@ class SidekickUI(QWidget):
             self.gpt_worker = None
 
     def on_send_button_clicked_nonblocking(self):
-        if self.tts_service.is_playing:
-            logger.info("Audio playback already in progress. Stopping.")
-            self.stop_playback()
-            time.sleep(0.3)
+        # A new reply starts a new TTS epoch: speech left over from the previous one
+        # is cancelled, including requests still being synthesized
+        self.stop_playback()
 
         if self.prompt_input.toPlainText():
             # Disable UI controls during processing
@@ -1463,6 +1532,9 @@ class SidekickUI(QWidget):
             self.send_button.setEnabled(False)
             self.prompt_input.setEnabled(False)
             self.reply_display.clear()
+            self.spoken_chunks = []
+            self.chunker.reset()
+            self.tts_service.start_reply()
 
             # Start the GPT service
             if not self.launch_gpt_service():
@@ -1531,8 +1603,19 @@ class SidekickUI(QWidget):
             logger.info("User message appended to context. Sending to OpenAI.")
             tools = [{"type": "web_search_preview"}] if self.websearch else None
 
-            self.gpt_worker.set_content(self.context)
+            payload, compacted = self.context_budget.build(self.context)
+            if compacted:
+                # The kept prefix changed, so the stored chain no longer matches it
+                self.reset_conversation_chain()
+            self.update_context_counter()
+
+            self.gpt_worker.set_content(payload)
             self.gpt_worker.set_tools(tools)
+            self.gpt_worker.set_conversation_state(
+                self.previous_response_id if self.server_side_state else None,
+                self.prompt_cache_key,
+                resumable=RESUMABLE_STREAMS,
+            )
             self.gpt_worker.moveToThread(self.gpt_thread)
 
             # Start the worker thread
@@ -1568,10 +1651,16 @@ class SidekickUI(QWidget):
     def add_chunk(self, text):
         """Add current text as a single chunk"""
         self.tts_service.add_chunk(text)
+        self.spoken_chunks.append(text)
         logger.info("Chunk added to service.")
 
+    def flush_partial_transcription(self):
+        """Send the rest of a finished reply to TTS, still within the chunk size cap"""
+        for chunk in self.chunker.flush():
+            self.add_chunk(chunk)
+
     def add_full_text(self, text):
-        self.tts_service.add_text(text)
+        self.spoken_chunks.extend(self.tts_service.add_text(text) or [])
         logger.info("Full text added to service.")
 
     def start_playback(self):
@@ -0,0 +1,403 @@
+"""
+Local stand-in for the parts of the OpenAI API that Sidekick uses.
+
+Serves `/v1/responses` (SSE streaming with a configurable time-to-first-token and
+token cadence, background mode with resume and cancel, and plain JSON replies),
+`/v1/audio/transcriptions` and `/v1/audio/speech` (a canned tone whose length follows
+the input text, after a configurable delay). Point the app at it with
+OPENAI_BASE_URL=http://127.0.0.1:<port>/v1 and any OPENAI_API_KEY.
+
+Usage:
+    python mock_openai_server.py [--port 8765] [--ttft 0.4] [--token-interval 0.02]
+"""
+
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import logging
+import threading
+import wave
+
+import numpy as np
+from aiohttp import web
+import logging_config
+
+try:
+    import soundfile
+except ImportError:  # mp3/flac/opus fall back to WAV without soundfile
+    soundfile = None
+
+root_logger = logging_config.setup_root_logging("mock_openai_server.log")
+logger = logging.getLogger(__name__)
+
+__all__ = ("MockConfig", "create_app", "start_in_thread")
+
+SPEECH_SAMPLE_RATE = 24000
+# soundfile (format, subtype) per speech response_format
+_SOUNDFILE_FORMATS = {
+    "mp3": ("MP3", "MPEG_LAYER_III"),
+    "flac": ("FLAC", "PCM_16"),
+    "opus": ("OGG", "OPUS"),
+}
+_CONTENT_TYPES = {
+    "mp3": "audio/mpeg",
+    "wav": "audio/wav",
+    "flac": "audio/flac",
+    "opus": "audio/ogg",
+    "pcm": "audio/pcm",
+}
+
+
+class MockConfig:
+    """Timing and content knobs for the mock server (all times in seconds)."""
+
+    def __init__(
+        self,
+        ttft=0.4,
+        token_interval=0.02,
+        reply_words=120,
+        transcription_delay=0.3,
+        transcription_text="What is the capital of France and why is it famous?",
+        speech_delay=0.25,
+        speech_chars_per_second=15.0,
+        speech_chunk_bytes=4096,
+        speech_chunk_interval=0.0,
+    ):
+        self.ttft = ttft
+        self.token_interval = token_interval
+        self.reply_words = reply_words
+        self.transcription_delay = transcription_delay
+        self.transcription_text = transcription_text
+        self.speech_delay = speech_delay
+        self.speech_chars_per_second = speech_chars_per_second
+        self.speech_chunk_bytes = speech_chunk_bytes
+        self.speech_chunk_interval = speech_chunk_interval
+
+    def reply_text(self):
+        """Returns the canned assistant reply: short two-clause sentences of filler words."""
+        words = []
+        for i in range(self.reply_words):
+            if i % 12 == 11:
+                words.append(f"word{i}.")
+            elif i % 12 == 4:
+                words.append(f"word{i},")
+            else:
+                words.append(f"word{i}")
+        text = " ".join(words)
+        # Capitalise each sentence so the TTS sentence chunker splits it
+        return ". ".join(s.strip().capitalize() for s in text.split(".") if s.strip()) + "."
+
+
+class _MockResponse:
+    """A generated reply whose SSE frames can be streamed (and re-streamed) by sequence."""
+
+    def __init__(self, response_id, model, text, config):
+        self.id = response_id
+        self.model = model
+        self.text = text
+        self.config = config
+        self.frames = []  # (sequence_number, encoded frame)
+        self.status = "queued"
+        self.changed = asyncio.Condition()
+        self.task = None
+
+    def resource(self, status=None):
+        return {
+            "id": self.id,
+            "object": "response",
+            "model": self.model,
+            "status": status or self.status,
+        }
+
+    async def _emit(self, event_type, payload):
+        seq = len(self.frames)
+        body = {"type": event_type, "sequence_number": seq, **payload}
+        frame = f"event: {event_type}\ndata: {json.dumps(body)}\n\n".encode("utf-8")
+        async with self.changed:
+            self.frames.append((seq, frame))
+            self.changed.notify_all()
+
+    async def produce(self):
+        try:
+            self.status = "in_progress"
+            await self._emit("response.created", {"response": self.resource()})
+            await self._emit("response.in_progress", {"response": self.resource()})
+            await asyncio.sleep(self.config.ttft)
+            item = {"id": f"msg_{self.id}", "type": "message", "role": "assistant"}
+            await self._emit(
+                "response.output_item.added",
+                {"output_index": 0, "item": dict(item, content=[])},
+            )
+            # One frame per word, the way the API streams small deltas
+            for i, word in enumerate(self.text.split(" ")):
+                delta = word if i == 0 else " " + word
+                await self._emit(
+                    "response.output_text.delta",
+                    {
+                        "item_id": item["id"],
+                        "output_index": 0,
+                        "content_index": 0,
+                        "delta": delta,
+                    },
+                )
+                if self.config.token_interval:
+                    await asyncio.sleep(self.config.token_interval)
+            part = {"type": "output_text", "text": self.text, "annotations": []}
+            await self._emit(
+                "response.output_text.done",
+                {"item_id": item["id"], "output_index": 0, "text": self.text},
+            )
+            await self._emit(
+                "response.output_item.done",
+                {"output_index": 0, "item": dict(item, content=[part])},
+            )
+            self.status = "completed"
+            done = dict(
+                self.resource(),
+                output=[dict(item, content=[part])],
+                usage={
+                    "input_tokens": 0,
+                    "output_tokens": len(self.text.split(" ")),
+                    "input_tokens_details": {"cached_tokens": 0},
+                },
+            )
+            await self._emit("response.completed", {"response": done})
+        except asyncio.CancelledError:
+            self.status = "cancelled"
+            async with self.changed:
+                self.changed.notify_all()
+            raise
+
+    @property
+    def finished(self):
+        return self.status in ("completed", "cancelled")
+
+    async def stream(self, request, starting_after=-1):
+        resp = web.StreamResponse(
+            headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"}
+        )
+        await resp.prepare(request)
+        index = starting_after + 1
+        while True:
+            async with self.changed:
+                await self.changed.wait_for(
+                    lambda: len(self.frames) > index or self.finished
+                )
+                frames = self.frames[index:]
+            for _, frame in frames:
+                await resp.write(frame)
+            index += len(frames)
+            if self.finished and index >= len(self.frames):
+                break
+        await resp.write_eof()
+        return resp
+
+
+def _tone(seconds, sample_rate=SPEECH_SAMPLE_RATE):
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    # A quiet 220 Hz tone with short fades so chunk joins do not click
+    samples = 0.2 * np.sin(2 * np.pi * 220 * t)
+    fade = min(len(samples) // 2, sample_rate // 100)
+    if fade:
+        ramp = np.linspace(0.0, 1.0, fade)
+        samples[:fade] *= ramp
+        samples[-fade:] *= ramp[::-1]
+    return (samples * 32767).astype(np.int16)
+
+
+def encode_speech(seconds, response_format="mp3"):
+    """
+    Returns (body, content type) for a canned speech clip of the given length.
+    """
+    pcm = _tone(seconds)
+    if response_format == "pcm":
+        return pcm.tobytes(), _CONTENT_TYPES["pcm"]
+    target = _SOUNDFILE_FORMATS.get(response_format)
+    if target is not None and soundfile is not None:
+        out = io.BytesIO()
+        try:
+            soundfile.write(
+                out, pcm, SPEECH_SAMPLE_RATE, format=target[0], subtype=target[1]
+            )
+            return out.getvalue(), _CONTENT_TYPES[response_format]
+        except (RuntimeError, TypeError, ValueError) as e:
+            logger.warning(f"Cannot encode {response_format} ({e}); sending WAV.")
+    out = io.BytesIO()
+    with wave.open(out, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(SPEECH_SAMPLE_RATE)
+        wf.writeframes(pcm.tobytes())
+    return out.getvalue(), _CONTENT_TYPES["wav"]
+
+
+def create_app(config=None) -> web.Application:
+    """
+    Builds the aiohttp application serving the mock endpoints under /v1.
+    """
+    config = config or MockConfig()
+    responses = {}
+    ids = itertools.count(1)
+    speech_cache = {}
+
+    async def create_response(request):
+        body = await request.json()
+        model = body.get("model", "gpt-5-mini")
+        response = _MockResponse(f"resp_mock{next(ids)}", model, config.reply_text(), config)
+        if not body.get("stream"):
+            await asyncio.sleep(config.ttft)
+            response.status = "completed"
+            part = {"type": "output_text", "text": response.text, "annotations": []}
+            item = {"id": f"msg_{response.id}", "type": "message", "role": "assistant"}
+            return web.json_response(
+                dict(response.resource(), output=[dict(item, content=[part])])
+            )
+        responses[response.id] = response
+        response.task = asyncio.ensure_future(response.produce())
+        return await response.stream(request)
+
+    async def get_response(request):
+        response = responses.get(request.match_info["response_id"])
+        if response is None:
+            return web.json_response(
+                {"error": {"message": "No such response", "type": "invalid_request_error"}},
+                status=404,
+            )
+        if request.query.get("stream") != "true":
+            return web.json_response(response.resource())
+        starting_after = int(request.query.get("starting_after", -1))
+        return await response.stream(request, starting_after)
+
+    async def cancel_response(request):
+        response = responses.get(request.match_info["response_id"])
+        if response is None:
+            return web.json_response({"error": {"message": "No such response"}}, status=404)
+        if response.task is not None and not response.task.done():
+            response.task.cancel()
+        return web.json_response(response.resource("cancelled"))
+
+    async def transcriptions(request):
+        form = await request.post()
+        await asyncio.sleep(config.transcription_delay)
+        if form.get("response_format") == "text":
+            return web.Response(text=config.transcription_text)
+        return web.json_response({"text": config.transcription_text})
+
+    async def speech(request):
+        body = await request.json()
+        text = body.get("input", "")
+        response_format = body.get("response_format", "mp3")
+        seconds = round(max(0.3, len(text) / config.speech_chars_per_second), 1)
+        key = (seconds, response_format)
+        if key not in speech_cache:
+            loop = asyncio.get_running_loop()
+            speech_cache[key] = await loop.run_in_executor(
+                None, encode_speech, seconds, response_format
+            )
+        audio, content_type = speech_cache[key]
+        await asyncio.sleep(config.speech_delay)
+        resp = web.StreamResponse(headers={"Content-Type": content_type})
+        await resp.prepare(request)
+        step = config.speech_chunk_bytes
+        try:
+            for i in range(0, len(audio), step):
+                await resp.write(audio[i : i + step])
+                if config.speech_chunk_interval:
+                    await asyncio.sleep(config.speech_chunk_interval)
+            await resp.write_eof()
+        except ConnectionResetError:
+            # The client cancelled the request (TTS stop / barge-in)
+            logger.info("Speech request cancelled by the client.")
+        return resp
+
+    async def ok(request):
+        # Connection pre-warm (HEAD on the base URL) and anything else
+        return web.Response(text="ok")
+
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.add_routes(
+        [
+            web.post("/v1/responses", create_response),
+            web.get("/v1/responses/{response_id}", get_response),
+            web.post("/v1/responses/{response_id}/cancel", cancel_response),
+            web.post("/v1/audio/transcriptions", transcriptions),
+            web.post("/v1/audio/speech", speech),
+            web.route("*", "/{tail:.*}", ok),
+        ]
+    )
+    return app
+
+
+def start_in_thread(config=None, host="127.0.0.1", port=0):
+    """
+    Runs the mock server on a daemon thread with its own event loop.
+
+    Args:
+        config (MockConfig, optional): Server timing and content settings.
+        host (str): Interface to bind.
+        port (int): Port to bind; 0 picks a free one.
+
+    Returns:
+        tuple[str, callable]: The base URL (ending in /v1) and a function that stops
+        the server.
+    """
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+    state = {}
+
+    async def _start():
+        runner = web.AppRunner(create_app(config), access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, host, port)
+        await site.start()
+        state["runner"] = runner
+        state["port"] = site._server.sockets[0].getsockname()[1]
+
+    def _run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(_start())
+        started.set()
+        loop.run_forever()
+
+    thread = threading.Thread(target=_run, daemon=True, name="MockOpenAIServer")
+    thread.start()
+    started.wait()
+
+    def stop():
+        asyncio.run_coroutine_threadsafe(state["runner"].cleanup(), loop).result(5)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=5)
+
+    url = f"http://{host}:{state['port']}/v1"
+    logger.info(f"Mock OpenAI server listening on {url}")
+    return url, stop
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ttft", type=float, default=0.4)
+    parser.add_argument("--token-interval", type=float, default=0.02)
+    parser.add_argument("--reply-words", type=int, default=120)
+    parser.add_argument("--transcription-delay", type=float, default=0.3)
+    parser.add_argument("--speech-delay", type=float, default=0.25)
+    parser.add_argument("--speech-chunk-interval", type=float, default=0.0)
+    args = parser.parse_args()
+
+    config = MockConfig(
+        ttft=args.ttft,
+        token_interval=args.token_interval,
+        reply_words=args.reply_words,
+        transcription_delay=args.transcription_delay,
+        speech_delay=args.speech_delay,
+        speech_chunk_interval=args.speech_chunk_interval,
+    )
+    print(f"Serving on http://{args.host}:{args.port}/v1")
+    web.run_app(create_app(config), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
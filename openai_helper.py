@@ -1,15 +1,34 @@
 import os
-import requests
-import json, logging
+import io
+import wave
+import asyncio
+import random
+import httpx
+import logging
 import logging_config
+import http_transport
+import sse_parser
+import image_prep
 
 root_logger = logging_config.setup_root_logging("openai.log")
 logger = logging.getLogger(__name__)
 
 # Get OpenAI API key from environment variable
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-# Set OpenAI API base URL
-OPENAI_API_BASE = "https://api.openai.com/v1"
+# Set OpenAI API base URL (OPENAI_BASE_URL is also honoured by the SDK clients, e.g.
+# to point the whole app at mock_openai_server.py)
+OPENAI_API_BASE = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1").rstrip("/")
+
+# Resumable streaming: retry budget and jittered backoff bounds (seconds)
+STREAM_MAX_RETRIES = 4
+STREAM_BACKOFF_BASE = 0.5
+STREAM_BACKOFF_MAX = 8.0
+# Synthetic event yielded by the async stream before each resume attempt
+STREAM_RETRYING_EVENT = "sidekick.stream.retrying"
+STREAM_TERMINAL_EVENTS = sse_parser.TERMINAL_EVENT_TYPES
+
+# Strong references to fire-and-forget tasks so they are not garbage collected
+_background_tasks = set()
 
 
 def openai_headers():
@@ -22,6 +41,15 @@ def openai_headers():
     }
 
 
+def prewarm_connections():
+    """
+    Pre-warms pooled connections to the OpenAI API in the background.
+    """
+    return http_transport.prewarm(
+        OPENAI_API_BASE, headers={"Authorization": f"Bearer {OPENAI_API_KEY}"}
+    )
+
+
 def chat_with_gpt5(
     messages,
     model="gpt-5-mini",  # May need to be "gpt-5-2025-08-07" or similar
@@ -61,18 +89,22 @@ def chat_with_gpt5(
         payload["tools"] = tools
     if tool_choice:
         payload["tool_choice"] = tool_choice
+    if reasoning:
+        payload["reasoning"] = reasoning
 
     logger.info(
         f"Sending request to {url} with model={model}, tools={tools}, tool_choice={tool_choice}, max_tokens={max_tokens}, stream={stream}, reasoning={reasoning}"
     )
 
     try:
-        response = requests.post(url, headers=openai_headers(), json=payload)
+        response = http_transport.get_client().post(
+            url, headers=openai_headers(), json=payload
+        )
         response.raise_for_status()
-    except requests.exceptions.HTTPError as e:
+    except httpx.HTTPStatusError as e:
         logger.error(f"HTTP error occurred: {e}")
         raise
-    except requests.exceptions.RequestException as e:
+    except httpx.RequestError as e:
         logger.error(f"Request exception occurred: {e}")
         raise
 
@@ -94,6 +126,64 @@ def chat_with_gpt5(
     return assistant_text
 
 
+SUMMARY_MODEL = "gpt-5-nano"
+SUMMARY_INSTRUCTIONS = (
+    "You maintain a running summary of a conversation between a user and an "
+    "assistant. Merge the existing summary (if any) with the new transcript into one "
+    "concise summary. Keep every fact, name, number, decision, preference and open "
+    "question that later turns might rely on; drop pleasantries and repetition. "
+    "Write plain prose or short bullet points, no preamble."
+)
+
+
+def summarize_conversation(
+    transcript, previous_summary=None, model=SUMMARY_MODEL, max_tokens=1500
+):
+    """
+    Condenses a conversation transcript into a running summary with a cheap model.
+
+    Args:
+        transcript (str): The turns to fold in, as "User: ..."/"Assistant: ..." text.
+        previous_summary (str, optional): The summary the transcript continues from.
+        model (str): Model name to use (default SUMMARY_MODEL).
+        max_tokens (int): Maximum number of output tokens.
+
+    Returns:
+        str: The updated summary.
+    """
+    text = transcript
+    if previous_summary:
+        text = f"Existing summary:\n{previous_summary}\n\nNew transcript:\n{transcript}"
+    messages = [
+        {
+            "role": "developer",
+            "content": [{"type": "input_text", "text": SUMMARY_INSTRUCTIONS}],
+        },
+        {"role": "user", "content": [{"type": "input_text", "text": text}]},
+    ]
+    return chat_with_gpt5(
+        messages, model=model, max_tokens=max_tokens, reasoning={"effort": "minimal"}
+    ).strip()
+
+
+def _check_stream_event(event):
+    """
+    Raises for error events and logs stream completion; returns the event otherwise.
+    """
+    if event.type in sse_parser.ERROR_EVENT_TYPES:
+        logger.error(f"Stream reported {event.type}: {event.data}")
+        raise sse_parser.ResponseStreamError(event)
+    if event.type == sse_parser.RESPONSE_COMPLETED:
+        usage = event.data.get("response", {}).get("usage")
+        logger.info(f"Streaming response completed. Usage: {usage}")
+    elif event.type == sse_parser.RESPONSE_INCOMPLETE:
+        usage = event.data.get("response", {}).get("usage")
+        logger.warning(
+            f"Streaming response incomplete ({sse_parser.incomplete_reason(event)}). Usage: {usage}"
+        )
+    return event
+
+
 def chat_with_gpt5_stream(
     messages,
     model="gpt-5-mini",
@@ -110,7 +200,10 @@ def chat_with_gpt5_stream(
         reasoning (dict, optional): Additional reasoning parameters for GPT-5.
 
     Yields:
-        dict: Parsed JSON objects from the streaming response.
+        sse_parser.ResponseEvent: Decoded text deltas, annotations and lifecycle events.
+
+    Raises:
+        sse_parser.ResponseStreamError: If the stream reports an error or a failed response.
     """
     url = f"{OPENAI_API_BASE}/responses"
     payload = {
@@ -125,10 +218,12 @@ def chat_with_gpt5_stream(
     logger.info(
         f"Sending streaming request to {url} with model={model}, tools={tools}, reasoning={reasoning}"
     )
-    with requests.post(url, headers=openai_headers(), json=payload, stream=True) as r:
+    with http_transport.get_client().stream(
+        "POST", url, headers=openai_headers(), json=payload
+    ) as r:
         try:
             r.raise_for_status()
-        except requests.exceptions.HTTPError as e:
+        except httpx.HTTPStatusError as e:
             # Handle HTTP errors with logging
             if r.status_code == 401:
                 logger.error("HTTP 401 Unauthorized: Check your OpenAI API key.")
@@ -138,11 +233,11 @@ def chat_with_gpt5_stream(
                 )
             else:
                 logger.error(f"HTTP error occurred: {e}")
-                logger.debug(f"Response content: {r.content}")
+                logger.debug(f"Response content: {r.read()}")
             raise
-        except requests.exceptions.RequestException as e:
+        except httpx.RequestError as e:
             logger.exception(
-                "Exception occurred during OpenAI streaming request (RequestException)"
+                "Exception occurred during OpenAI streaming request (RequestError)"
             )
             raise
         except Exception as e:
@@ -151,116 +246,375 @@ def chat_with_gpt5_stream(
             )
             raise
 
-        logger.info("Streaming response received, starting to process lines.")
-        # Iterate over each line in the streaming response
-        for raw in r.iter_lines(decode_unicode=True):
-            if not raw:
-                continue
-            if raw.startswith("data: "):
-                data = raw[6:]
-                # logger.debug(f"Received streaming data chunk: {data}")
-                if "response.completed" in data:
-                    logger.info("Received [DONE] from streaming response.")
-                    continue
-                try:
-                    obj = json.loads(data)
-                    # logger.debug(f"Parsed streaming object: {obj}")
-                    # logger.info(f"Received streaming data chunk.")
-                except Exception as ex:
-                    logger.warning(f"Failed to parse streaming data chunk: ({ex})")
-                    continue
-                yield obj
-
-
-def attach_image_message(image_path):
+        logger.info("Streaming response received, starting to decode events.")
+        decoder = sse_parser.ResponseStreamDecoder()
+        for raw in r.iter_bytes():
+            for event in decoder.feed(raw):
+                yield _check_stream_event(event)
+        for event in decoder.flush():
+            yield _check_stream_event(event)
+
+
+async def chat_with_gpt5_stream_async(
+    messages,
+    model="gpt-5-mini",
+    tools=None,
+    reasoning=None,
+    resumable=False,
+    max_retries=STREAM_MAX_RETRIES,
+    previous_response_id=None,
+    prompt_cache_key=None,
+):
+    """
+    Async version of `chat_with_gpt5_stream` built on the shared `httpx.AsyncClient`.
+
+    Must run on the shared loop from `event_loop`. Cancelling the consuming task
+    exits the response context immediately, which closes the underlying connection
+    instead of waiting for the next server-sent event.
+
+    With `resumable`, the response runs in background mode so that a dropped
+    connection can be resumed from the last received sequence number instead of
+    regenerating the reply. Retries use jittered exponential backoff; before each
+    one a synthetic `STREAM_RETRYING_EVENT` is yielded so callers can show it.
+    Background mode requires `store=True`, so the response is retained by OpenAI
+    (30 days by default) and is not available under Zero Data Retention; callers
+    opt in explicitly (SIDEKICK_RESUMABLE_STREAMS in the app).
+
+    Args:
+        messages (list): List of message dicts for the conversation.
+        model (str): Model name to use (default "gpt-5-mini").
+        tools (list, optional): List of tools to provide to the model.
+        reasoning (dict, optional): Additional reasoning parameters for GPT-5.
+        resumable (bool): Run as a stored background response and resume the stream
+            after transport failures (default False).
+        max_retries (int): Consecutive resume attempts before giving up.
+        previous_response_id (str, optional): Continue a stored conversation server-side;
+            `messages` then only needs the new turn.
+        prompt_cache_key (str, optional): Stable key that routes requests sharing a
+            prefix to the same prompt cache.
+
+    Yields:
+        sse_parser.ResponseEvent: Decoded text deltas, annotations and lifecycle events.
+
+    Raises:
+        sse_parser.ResponseStreamError: If the stream reports an error or a failed response.
+        httpx.HTTPError: If the request fails and cannot be resumed.
+    """
+    url = f"{OPENAI_API_BASE}/responses"
+    payload = {
+        "model": model,
+        "input": messages,
+        "stream": True,
+    }
+
+    if tools:
+        payload["tools"] = tools
+    if resumable:
+        # Background responses keep generating server-side and can be re-streamed
+        payload["background"] = True
+        payload["store"] = True
+    if previous_response_id:
+        payload["previous_response_id"] = previous_response_id
+        payload["store"] = True
+    if prompt_cache_key:
+        payload["prompt_cache_key"] = prompt_cache_key
+    logger.info(
+        f"Sending async streaming request to {url} with model={model}, tools={tools}, reasoning={reasoning}, resumable={resumable}, previous_response_id={previous_response_id}, input_items={len(messages)}"
+    )
+    client = http_transport.get_async_client()
+    response_id = None
+    last_sequence_number = None
+    attempt = 0
+    finished = False
+
+    try:
+        while not finished:
+            decoder = None
+            if response_id is None:
+                request = client.stream(
+                    "POST", url, headers=openai_headers(), json=payload
+                )
+            else:
+                logger.info(
+                    f"Resuming response {response_id} after sequence {last_sequence_number}."
+                )
+                params = {"stream": "true"}
+                if last_sequence_number is not None:
+                    params["starting_after"] = last_sequence_number
+                request = client.stream(
+                    "GET", f"{url}/{response_id}", headers=openai_headers(), params=params
+                )
+            try:
+                async with request as r:
+                    if r.is_error:
+                        await r.aread()
+                        if r.status_code == 401:
+                            logger.error(
+                                "HTTP 401 Unauthorized: Check your OpenAI API key."
+                            )
+                        elif r.status_code == 403:
+                            logger.error(
+                                "HTTP 403 Forbidden: Check your OpenAI API key or account permissions."
+                            )
+                        else:
+                            logger.error(f"HTTP error occurred: {r.status_code}")
+                            logger.debug(f"Response content: {r.content}")
+                        r.raise_for_status()
+
+                    logger.info("Streaming response received, starting to decode events.")
+                    decoder = sse_parser.ResponseStreamDecoder(
+                        last_sequence_number=last_sequence_number
+                    )
+                    async for raw in r.aiter_bytes():
+                        for event in decoder.feed(raw):
+                            if event.type == sse_parser.RESPONSE_CREATED:
+                                response_id = event.data.get("response", {}).get("id")
+                            finished = event.type in STREAM_TERMINAL_EVENTS
+                            attempt = 0
+                            yield _check_stream_event(event)
+                    for event in decoder.flush():
+                        finished = event.type in STREAM_TERMINAL_EVENTS
+                        yield _check_stream_event(event)
+                    if not finished:
+                        if not resumable:
+                            return
+                        raise httpx.RemoteProtocolError(
+                            "Stream ended before the response completed."
+                        )
+            except httpx.TransportError as e:
+                if decoder is not None:
+                    # Resume after the last event received, even a skipped one
+                    last_sequence_number = decoder.resume_point()
+                # Only resume once the server has told us which response to resume;
+                # a POST that never connected can simply be sent again.
+                can_retry = resumable and (
+                    response_id is not None or isinstance(e, httpx.ConnectError)
+                )
+                if not can_retry or attempt >= max_retries:
+                    logger.error(f"Streaming transport failure, giving up: {e!r}")
+                    raise
+                attempt += 1
+                delay = _backoff_delay(attempt)
+                logger.warning(
+                    f"Streaming transport failure ({e!r}); retry {attempt}/{max_retries} in {delay:.2f}s."
+                )
+                yield sse_parser.ResponseEvent(
+                    STREAM_RETRYING_EVENT,
+                    data={"attempt": attempt, "delay": delay, "error": str(e)},
+                )
+                await asyncio.sleep(delay)
+    except asyncio.CancelledError:
+        logger.info("Streaming request cancelled, closing connection.")
+        if resumable and response_id is not None and not finished:
+            # A background response keeps running (and billing) unless cancelled
+            task = asyncio.ensure_future(_cancel_background_response(response_id))
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
+        raise
+
+
+def _backoff_delay(attempt):
+    """
+    Returns an exponential backoff delay with jitter for the given retry attempt.
+    """
+    delay = min(STREAM_BACKOFF_MAX, STREAM_BACKOFF_BASE * 2 ** (attempt - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+async def _cancel_background_response(response_id):
+    """
+    Cancels a background response that is no longer being consumed.
+    """
+    url = f"{OPENAI_API_BASE}/responses/{response_id}/cancel"
+    try:
+        r = await http_transport.get_async_client().post(url, headers=openai_headers())
+        r.raise_for_status()
+        logger.info(f"Cancelled background response {response_id}.")
+    except httpx.HTTPError as e:
+        logger.warning(f"Failed to cancel background response {response_id}: {e}")
+
+
+def attach_image_message(image_path, detail=None):
     """
     Returns a message dict for OpenAI API with an attached image.
 
+    The image is downscaled to the model's useful maximum and recompressed by
+    `image_prep`; a preparation already started with `image_prep.prepare_image_async`
+    (or a cached one with the same content) is reused.
+
     Args:
         image_path (str): Path to the image file.
+        detail (str, optional): "low" or "high"; chosen from the image size when None.
 
     Returns:
         dict: Message dict for OpenAI API, with image data encoded as base64.
     """
     logger.info(f"Attaching image from path: {image_path}")
     try:
-        with open(image_path, "rb") as f:
-            image_data = f.read()
-        logger.info(
-            f"Successfully read image file: {image_path} ({len(image_data)} bytes)"
-        )
+        prepared = image_prep.prepare_image(image_path, detail)
     except FileNotFoundError:
         logger.error(f"Image file not found: {image_path}")
         return {
             "type": "input_text",
             "text": "I didn't include an image. Ask me to attach it correctly.",
         }
+    except Exception as e:
+        logger.warning(f"Image preparation failed ({e}); attaching original file.")
+        return _attach_raw_image(image_path)
 
-    import base64
-    import mimetypes
+    logger.info(
+        f"Attached image {prepared.width}x{prepared.height} ({prepared.detail} detail, {prepared.size} bytes encoded)"
+    )
+    return prepared.message()
 
-    def get_image_mime_type(image_path):
-        """
-        Returns the MIME type for the given image file path.
-        """
-        mime_type, _ = mimetypes.guess_type(image_path)
-        return mime_type or "image/png"  # fallback
 
-    mime_type = get_image_mime_type(image_path)
+def _attach_raw_image(image_path):
+    """
+    Returns an `input_image` part with the file's original bytes, base64-encoded.
+    """
+    import base64
+    import mimetypes
 
+    with open(image_path, "rb") as f:
+        image_data = f.read()
+    mime_type, _ = mimetypes.guess_type(str(image_path))
     b64_image = base64.b64encode(image_data).decode("utf-8")
-
     return {
         "type": "input_image",
-        "image_url": f"data:{mime_type};base64,{b64_image}",
+        "image_url": f"data:{mime_type or 'image/png'};base64,{b64_image}",
     }
 
 
+AUDIO_UPLOAD_FORMATS = {
+    # encoding: (soundfile format, soundfile subtype, file extension, MIME type)
+    "flac": ("FLAC", "PCM_16", "flac", "audio/flac"),
+    "opus": ("OGG", "OPUS", "ogg", "audio/ogg"),
+    "wav": ("WAV", "PCM_16", "wav", "audio/wav"),
+}
+
+
+def encode_audio(samples, sample_rate=16000, encoding="flac"):
+    """
+    Encodes mono 16-bit PCM samples in memory for upload.
+
+    FLAC and Opus need the optional `soundfile` package (libsndfile); without it,
+    or if the codec is unavailable, the samples are sent as WAV instead.
+
+    Args:
+        samples (numpy.ndarray): int16 samples, shape (n,) or (n, 1).
+        sample_rate (int): Sample rate of `samples` in Hz.
+        encoding (str): One of "flac", "opus" or "wav".
+
+    Returns:
+        tuple: (filename, encoded bytes, MIME type) ready for a multipart upload.
+    """
+    if encoding not in AUDIO_UPLOAD_FORMATS:
+        raise ValueError(f"Unsupported audio encoding: {encoding}")
+    if encoding != "wav":
+        sf_format, subtype, ext, mime = AUDIO_UPLOAD_FORMATS[encoding]
+        try:
+            import soundfile
+
+            buf = io.BytesIO()
+            soundfile.write(buf, samples, sample_rate, format=sf_format, subtype=subtype)
+            return f"audio.{ext}", buf.getvalue(), mime
+        except ImportError:
+            logger.warning("Package 'soundfile' not installed; uploading audio as WAV.")
+        except Exception as e:
+            logger.warning(f"{encoding} encoding failed ({e}); uploading audio as WAV.")
+
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)  # 16-bit audio
+        wf.setframerate(sample_rate)
+        wf.writeframes(samples.astype("<i2", copy=False).tobytes())
+    return "audio.wav", buf.getvalue(), "audio/wav"
+
+
 def transcribe_audio(
-    audio_path, model="whisper-1", language="en", prompt=None, response_format="text"
+    audio,
+    model="whisper-1",
+    language="en",
+    prompt=None,
+    response_format="text",
+    sample_rate=16000,
+    encoding="flac",
 ):
+    """
+    Transcribes audio with the OpenAI transcription API.
+
+    Recorded samples are encoded and uploaded straight from memory, so no temporary
+    file is written. FLAC is lossless and typically about half the size of raw
+    16 kHz PCM; Opus is much smaller still.
+
+    Args:
+        audio: A file path, encoded audio bytes, a binary file-like object, or a
+            numpy array of mono int16 samples.
+        model (str): Transcription model (default "whisper-1").
+        language (str, optional): ISO-639-1 language hint.
+        prompt (str, optional): Text to guide the transcription.
+        response_format (str): "text", "json", "verbose_json", ...
+        sample_rate (int): Sample rate in Hz when `audio` is a numpy array.
+        encoding (str): Upload encoding for numpy input: "flac", "opus" or "wav".
+
+    Returns:
+        str | dict: The transcription text, or parsed JSON for JSON formats.
+    """
     url = f"{OPENAI_API_BASE}/audio/transcriptions"
+    source = audio if isinstance(audio, (str, os.PathLike)) else type(audio).__name__
     logger.info(
-        f"Preparing to transcribe audio: {audio_path} with model={model}, language={language}, response_format={response_format}"
+        f"Preparing to transcribe audio: {source} with model={model}, language={language}, response_format={response_format}"
     )
 
     try:
-        with open(audio_path, "rb") as audio_file:
-            data = {
-                "model": model,
-                "response_format": response_format,
-            }
-            if language:
-                data["language"] = language
-            if prompt:
-                data["prompt"] = prompt
-
-            # Send multipart form-data
-            response = requests.post(
-                url,
-                headers={
-                    "Authorization": f"Bearer {OPENAI_API_KEY}"
-                },  # No Content-Type here
-                data=data,
-                files={"file": audio_file},
+        if isinstance(audio, (str, os.PathLike)):
+            with open(audio, "rb") as audio_file:
+                upload = (os.path.basename(audio), audio_file.read())
+        elif isinstance(audio, (bytes, bytearray)):
+            upload = ("audio.wav", bytes(audio))
+        elif hasattr(audio, "read"):
+            upload = (os.path.basename(getattr(audio, "name", "audio.wav")), audio)
+        else:
+            filename, encoded, mime = encode_audio(audio, sample_rate, encoding)
+            logger.info(
+                f"Encoded {len(audio)} samples as {filename} ({len(encoded)} bytes, raw PCM {len(audio) * 2} bytes)."
             )
+            upload = (filename, encoded, mime)
 
-            if response.status_code == 400:
-                logger.debug(
-                    f"Transcription API 400 response content: {response.content.decode(errors='replace')}"
-                )
-            response.raise_for_status()
+        data = {
+            "model": model,
+            "response_format": response_format,
+        }
+        if language:
+            data["language"] = language
+        if prompt:
+            data["prompt"] = prompt
+
+        # Send multipart form-data
+        response = http_transport.get_client().post(
+            url,
+            headers={"Authorization": f"Bearer {OPENAI_API_KEY}"},  # No Content-Type here
+            data=data,
+            files={"file": upload},
+        )
+
+        if response.status_code == 400:
+            logger.debug(
+                f"Transcription API 400 response content: {response.content.decode(errors='replace')}"
+            )
+        response.raise_for_status()
 
-            logger.info(f"Transcription request successful for {audio_path}")
+        logger.info(f"Transcription request successful for {source}")
 
-            if response_format in ("json", "verbose_json"):
-                return response.json()
-            return response.text
+        if response_format in ("json", "verbose_json"):
+            return response.json()
+        return response.text
 
     except FileNotFoundError:
-        logger.error(f"Audio file not found: {audio_path}")
+        logger.error(f"Audio file not found: {audio}")
         raise
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"Request to OpenAI transcription API failed: {e}")
         raise
     except Exception as e:
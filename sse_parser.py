@@ -0,0 +1,256 @@
+"""
+Incremental server-sent events (SSE) decoder for the OpenAI Responses stream.
+
+The stream is fed as raw byte chunks straight from the socket. Frames are split on
+blank lines, the event type is read from the `event:` field without touching the
+JSON body, and only the event types the app actually consumes are decoded (with
+`jiter` when available, falling back to `json`).
+"""
+
+import logging
+from typing import List, NamedTuple, Optional
+
+import logging_config
+
+try:
+    from jiter import from_json as _loads
+except ImportError:  # jiter ships with the openai SDK, but stay usable without it
+    from json import loads as _loads
+
+
+root_logger = logging_config.setup_root_logging("sse_parser.log")
+logger = logging.getLogger(__name__)
+
+__all__ = (
+    "ResponseEvent",
+    "ResponseStreamError",
+    "ResponseStreamDecoder",
+    "SSEDecoder",
+    "parse_frame",
+    "incomplete_reason",
+    "HANDLED_EVENT_TYPES",
+)
+
+TEXT_DELTA = "response.output_text.delta"
+ANNOTATION_ADDED = "response.output_text.annotation.added"
+RESPONSE_CREATED = "response.created"
+RESPONSE_COMPLETED = "response.completed"
+# A truncated reply (e.g. max_output_tokens); it still ends the stream normally
+RESPONSE_INCOMPLETE = "response.incomplete"
+
+ERROR_EVENT_TYPES = frozenset({"error", "response.failed"})
+
+# Events after which the server sends nothing more for the response
+TERMINAL_EVENT_TYPES = frozenset({RESPONSE_COMPLETED, RESPONSE_INCOMPLETE}) | ERROR_EVENT_TYPES
+
+# Events that are fully decoded; everything else is skipped after reading its type.
+HANDLED_EVENT_TYPES = frozenset(
+    {TEXT_DELTA, ANNOTATION_ADDED, RESPONSE_CREATED} | TERMINAL_EVENT_TYPES
+)
+
+
+class ResponseEvent(NamedTuple):
+    """A decoded Responses API stream event.
+
+    `delta` carries the text of `response.output_text.delta` events (with `data`
+    left as None to keep cross-thread signals light); every other handled event
+    carries its decoded payload in `data`.
+    """
+
+    type: str
+    delta: str = ""
+    data: Optional[dict] = None
+
+
+class ResponseStreamError(Exception):
+    """Raised when the stream reports an `error` or a failed response."""
+
+    def __init__(self, event: ResponseEvent):
+        self.event = event
+        data = event.data or {}
+        error = data.get("error") or data.get("response", {}).get("error") or {}
+        message = error.get("message") or data.get("message")
+        super().__init__(message or f"Stream reported {event.type}")
+
+
+def incomplete_reason(event: ResponseEvent) -> str:
+    """
+    Returns why a `response.incomplete` event's reply was cut short.
+    """
+    response = (event.data or {}).get("response") or {}
+    details = response.get("incomplete_details") or {}
+    return details.get("reason") or "unknown reason"
+
+
+class SSEDecoder:
+    """Splits a byte stream into (event, data) frames per the SSE framing rules.
+
+    Frames are cut on blank lines with `bytes.split`, only when a chunk actually
+    completes a frame; the per-line work only happens inside frames that are kept.
+    """
+
+    def __init__(self):
+        # Chunks of the frame in progress; joined only once a frame boundary arrives
+        # so large events spread over many reads are not rescanned on every chunk.
+        self._pending = []
+        self._pending_cr = False
+
+    def split(self, chunk: bytes) -> List[bytes]:
+        """
+        Feeds raw bytes and returns the raw (unparsed) frames completed by them.
+        """
+        if self._pending_cr or b"\r" in chunk:
+            chunk = self._normalise_newlines(chunk)
+        pending = self._pending
+        if b"\n\n" not in chunk and not (
+            pending and pending[-1].endswith(b"\n") and chunk.startswith(b"\n")
+        ):
+            if chunk:
+                pending.append(chunk)
+            return []
+        pending.append(chunk)
+        parts = b"".join(pending).split(b"\n\n")
+        rest = parts.pop()
+        self._pending = [rest] if rest else []
+        return parts
+
+    def _normalise_newlines(self, chunk: bytes) -> bytes:
+        # CRLF and lone CR both end a line; a CR at the very end of a chunk may be
+        # the first half of a CRLF, so it is held back until the next chunk.
+        if self._pending_cr:
+            chunk = b"\r" + chunk
+        self._pending_cr = chunk.endswith(b"\r")
+        if self._pending_cr:
+            chunk = chunk[:-1]
+        return chunk.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+
+    def feed(self, chunk: bytes) -> List[tuple]:
+        """
+        Feeds raw bytes and returns the frames completed by them.
+
+        Returns:
+            list[tuple[bytes | None, bytes]]: (event field, joined data field) per frame.
+        """
+        frames = (parse_frame(part) for part in self.split(chunk))
+        return [frame for frame in frames if frame is not None]
+
+    def flush(self) -> List[bytes]:
+        """
+        Returns a trailing raw frame that was not terminated by a blank line.
+        """
+        buf = b"".join(self._pending).strip(b"\n")
+        self._pending = []
+        self._pending_cr = False
+        return [buf] if buf else []
+
+
+def parse_frame(part: bytes):
+    """
+    Parses one raw SSE frame into (event, data), or None for comment-only frames.
+    """
+    event = None
+    data = []
+    for line in part.split(b"\n"):
+        if not line or line.startswith(b":"):  # comment / keep-alive
+            continue
+        field, sep, value = line.partition(b":")
+        if sep and value.startswith(b" "):
+            value = value[1:]
+        if field == b"data":
+            data.append(value)
+        elif field == b"event":
+            event = value
+    if event is None and not data:
+        return None
+    return event, b"\n".join(data)
+
+
+class ResponseStreamDecoder:
+    """Turns raw Responses API stream bytes into `ResponseEvent`s the app consumes."""
+
+    def __init__(self, handled_types=HANDLED_EVENT_TYPES, last_sequence_number=None):
+        self._handled = frozenset(handled_types)
+        self._handled_raw = frozenset(t.encode("ascii") for t in self._handled)
+        self._sse = SSEDecoder()
+        self.skipped = 0
+        self._sequence_number = last_sequence_number
+        # The newest frame skipped since the last decoded one; its body is only
+        # parsed if resume_point() is called.
+        self._skipped_frame = None
+
+    def resume_point(self) -> Optional[int]:
+        """
+        Returns the sequence_number of the newest event, including skipped ones, to
+        resume the stream after. Parses the newest skipped frame's body if needed.
+        """
+        part, self._skipped_frame = self._skipped_frame, None
+        if part is not None:
+            frame = parse_frame(part)
+            try:
+                obj = _loads(frame[1]) if frame and frame[1] else None
+            except ValueError:
+                obj = None
+            if isinstance(obj, dict) and obj.get("sequence_number") is not None:
+                self._sequence_number = obj["sequence_number"]
+        return self._sequence_number
+
+    def feed(self, chunk: bytes) -> List[ResponseEvent]:
+        """
+        Feeds raw bytes and returns the handled events they complete.
+        """
+        return self._decode(self._sse.split(chunk))
+
+    def flush(self) -> List[ResponseEvent]:
+        """
+        Returns any event left in the buffer at end of stream.
+        """
+        return self._decode(self._sse.flush())
+
+    def _decode(self, parts) -> List[ResponseEvent]:
+        events = []
+        handled_raw = self._handled_raw
+        for part in parts:
+            # Fast path for the canonical "event: <type>\ndata: <json>" frame: the
+            # type is compared as raw bytes and unhandled bodies are never decoded.
+            if part.startswith(b"event: "):
+                nl = part.find(b"\n")
+                if nl < 0:  # a frame with an event type but no data
+                    if part[7:] not in handled_raw:
+                        self.skipped += 1
+                    continue
+                if part[7:nl] not in handled_raw:
+                    self.skipped += 1
+                    self._skipped_frame = part
+                    continue
+                if part.startswith(b"data: ", nl + 1) and part.find(b"\n", nl + 1) == -1:
+                    data = part[nl + 7 :]
+                else:
+                    data = parse_frame(part)[1]
+            else:
+                frame = parse_frame(part)
+                if frame is None:
+                    continue
+                event_type, data = frame
+                if event_type is not None and event_type not in handled_raw:
+                    self.skipped += 1
+                    self._skipped_frame = part
+                    continue
+            if not data or data == b"[DONE]":
+                continue
+            try:
+                obj = _loads(data)
+            except ValueError as ex:
+                logger.warning(f"Failed to parse streaming data chunk: ({ex})")
+                continue
+            sequence_number = obj.get("sequence_number")
+            if sequence_number is not None:
+                self._sequence_number = sequence_number
+                self._skipped_frame = None
+            etype = obj.get("type")
+            if etype == TEXT_DELTA:
+                events.append(ResponseEvent(etype, obj.get("delta", "")))
+            elif etype in self._handled:
+                events.append(ResponseEvent(etype, data=obj))
+            else:
+                self.skipped += 1
+        return events
@@ -0,0 +1,112 @@
+import io
+import wave
+
+import numpy as np
+import pytest
+
+import audio_decode
+
+
+def tone(rate, seconds=1.0):
+    t = np.arange(int(rate * seconds)) / rate
+    noise = np.random.RandomState(0).randn(len(t)) * 300
+    return (np.sin(2 * np.pi * 440 * t) * 8000 + noise).astype(np.int16)
+
+
+def feed(decoder, data: bytes, step: int):
+    out = []
+    for i in range(0, len(data), step):
+        block = decoder.process(data[i : i + step])
+        if block is not None:
+            out.append(np.frombuffer(block, dtype=np.int16))
+    block = decoder.flush()
+    if block is not None:
+        out.append(np.frombuffer(block, dtype=np.int16))
+    return np.concatenate(out) if out else np.zeros(0, dtype=np.int16)
+
+
+@pytest.mark.parametrize("src_rate, dst_rate", [(24000, 48000), (24000, 44100), (44100, 24000)])
+def test_resampler_blocks_join_seamlessly(src_rate, dst_rate):
+    samples = tone(src_rate)
+    whole = audio_decode.resample(samples, src_rate, dst_rate)
+    resampler = audio_decode.Resampler(src_rate, dst_rate)
+    blocks = [resampler.process(samples[i : i + 997]) for i in range(0, len(samples), 997)]
+    joined = np.concatenate(blocks)
+    # Same length, same samples up to the rounding of the carried position
+    assert len(joined) == len(whole)
+    assert np.abs(joined.astype(int) - whole).max() <= 1
+    assert abs(len(whole) - len(samples) * dst_rate / src_rate) <= 1
+
+
+def test_pcm_converter_keeps_odd_bytes():
+    samples = tone(24000, 0.1)
+    converter = audio_decode.PCMConverter(24000)
+    assert np.array_equal(feed(converter, samples.tobytes(), 333), samples)
+
+
+def test_wav_stream_with_split_header():
+    samples = tone(22050, 0.2)
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(22050)
+        wav.writeframes(samples.tobytes())
+    data = buf.getvalue()
+    for step in (3, 40, len(data)):
+        decoder = audio_decode.WAVStreamDecoder(22050)
+        assert np.array_equal(feed(decoder, data, step), samples)
+
+
+def test_wav_stream_rejects_other_formats():
+    decoder = audio_decode.WAVStreamDecoder(24000)
+    with pytest.raises(ValueError):
+        decoder.process(b"OggS" + bytes(20))
+
+
+def mp3_or_skip():
+    soundfile = pytest.importorskip("soundfile")
+    if "MP3" not in soundfile.available_formats():
+        pytest.skip("libsndfile was built without MP3")
+    return soundfile
+
+
+def encode_mp3(soundfile, samples, rate, bitrate_mode, level):
+    buf = io.BytesIO()
+    with soundfile.SoundFile(
+        buf,
+        "w",
+        rate,
+        1,
+        format="MP3",
+        subtype="MPEG_LAYER_III",
+        bitrate_mode=bitrate_mode,
+        compression_level=level,
+    ) as f:
+        f.write(samples)
+    return buf.getvalue()
+
+
+@pytest.mark.parametrize("bitrate_mode", ["CONSTANT", "VARIABLE"])
+@pytest.mark.parametrize("level", [0.0, 0.9])
+def test_mp3_stream_matches_whole_file_decode(bitrate_mode, level):
+    soundfile = mp3_or_skip()
+    rate = 24000
+    samples = tone(rate, 3.0)
+    samples[rate // 2 : rate] = 0
+    data = encode_mp3(soundfile, samples, rate, bitrate_mode, level)
+    whole, _ = audio_decode.decode(data, "mp3")
+    streamed = feed(audio_decode.MP3StreamDecoder(rate), data, 500)
+
+    # The stream keeps the encoder delay that a whole-file decode may trim, so line
+    # the two up first; VBR batches must not be cut short either.
+    assert len(streamed) >= len(whole) - 1152
+    best = None
+    for offset in range(-1152, 1153):
+        a = streamed[max(offset, 0) :]
+        b = whole[max(-offset, 0) :]
+        n = min(len(a), len(b)) - 2000
+        diff = np.abs(a[2000:n].astype(int) - b[2000:n]).max()
+        if best is None or diff < best:
+            best = diff
+    assert best <= 1
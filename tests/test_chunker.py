@@ -0,0 +1,68 @@
+import pytest
+
+import TTS_openai_streaming as TTS_S
+from bench_chunker import build_reply, chunk_incremental, chunk_rescan, split_deltas
+
+
+def normalise(chunks):
+    return [" ".join(chunk.split()) for chunk in chunks]
+
+
+def rescan_whole(text):
+    # What next_chunks gives for a reply that arrives in one piece
+    chunker = TTS_S.SentenceChunker()
+    chunks, rest = chunker.next_chunks(text)
+    return chunks + chunker.next_chunks(rest, len(chunks), final=True)[0]
+
+
+def streamed_whole(text):
+    chunker = TTS_S.StreamingSentenceChunker()
+    return chunker.feed(text) + chunker.flush()
+
+
+@pytest.mark.parametrize("kb", [2, 8, 32])
+def test_whole_reply_matches_next_chunks(kb):
+    text = build_reply(kb)
+    assert normalise(streamed_whole(text)) == normalise(rescan_whole(text))
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "Hello there. How are you? Fine!",
+        "Steps:\n1. Install the package\n2. Run the benchmark\n3. Compare the numbers\n",
+        'He said "stop." Then he left. "Why?" she asked.',
+        "The U.S. team won. Mr. Smith agreed, e.g. on the score. J. R. R. Tolkien wrote it.",
+        "Version 3.5 is out. It costs $2.50 today.",
+        "no punctuation at all " * 30,
+        "Short",
+        "",
+    ],
+)
+def test_edge_cases_match_next_chunks(text):
+    assert normalise(streamed_whole(text)) == normalise(rescan_whole(text))
+
+
+def test_streaming_waits_for_the_next_word():
+    # Re-scanning cuts when a delta ends right after "U.S. "; streaming does not
+    deltas = ["The results are in from the ", "U.S. ", "team and they look good. ", "Next."]
+    assert "The results are in from the U.S." in normalise(chunk_rescan(deltas))
+    assert all(chunk != "The results are in from the U.S." for chunk in chunk_incremental(deltas))
+    assert normalise(chunk_incremental(deltas)) == normalise(rescan_whole("".join(deltas)))
+
+
+def test_deltas_cover_the_whole_reply():
+    text = build_reply(8)
+    for delta_chars in (1, 4, 17):
+        chunks = chunk_incremental(split_deltas(text, delta_chars))
+        assert " ".join(normalise(chunks)) == " ".join(text.split())
+
+
+def test_chunk_sizes_grow_and_stay_capped():
+    chunker = TTS_S.StreamingSentenceChunker()
+    text = "First sentence here, with a clause that is long enough. " + "Next one. " * 20
+    chunks = chunker.feed(text) + chunker.flush()
+    assert chunks[0] == "First sentence here,"
+    assert chunks[1] == "with a clause that is long enough."
+    assert normalise(chunks[2:4]) == ["Next one. Next one.", "Next one. Next one. Next one."]
+    assert all(len(chunk) <= chunker.max_chunk_chars for chunk in chunks)
@@ -0,0 +1,66 @@
+import context_budget
+
+
+def text_message(role, chars):
+    return {"role": role, "content": [{"type": "input_text", "text": "x" * chars}]}
+
+
+def image_message():
+    return {
+        "role": "user",
+        "content": [
+            {"type": "input_text", "text": "What is on screen?"},
+            {"type": "input_image", "image_url": "https://example.com/a.png"},
+        ],
+    }
+
+
+def conversation(turns, chars=400):
+    context = [{"role": "developer", "content": "You are helpful."}]
+    for _ in range(turns):
+        context += [text_message("user", chars), text_message("assistant", chars)]
+    return context
+
+
+def test_small_context_is_sent_whole():
+    context = conversation(3)
+    window, changed = context_budget.ContextBudget(max_tokens=10000).build(context)
+    assert window == context
+    assert not changed
+
+
+def test_compaction_keeps_system_prompt_and_newest_message():
+    context = conversation(20) + [text_message("user", 40)]
+    budget = context_budget.ContextBudget(max_tokens=1000)
+    window, changed = budget.build(context)
+    assert changed
+    assert window[0] is context[0] and window[-1] is context[-1]
+    assert window[1]["role"] == "user"
+    assert context_budget.estimate_tokens(window) <= 1000 * budget.low_water
+    # The window only moves forward, so the next build reuses the same prefix
+    context.append(text_message("assistant", 40))
+    again, changed = budget.build(context)
+    assert not changed
+    assert again[:-1] == window
+
+
+def test_old_images_are_stubbed_first():
+    context = conversation(1) + [image_message(), text_message("assistant", 40)]
+    context.append(text_message("user", 40))
+    tokens = context_budget.estimate_tokens(context)
+    window, _ = context_budget.ContextBudget(max_tokens=tokens - 1).build(context)
+    assert len(window) == len(context)
+    assert window[3]["content"][1]["text"] == context_budget.IMAGE_STUB
+
+
+def test_summary_replaces_old_turns():
+    context = conversation(20, chars=2000)
+    budget = context_budget.ContextBudget(max_tokens=100000)
+    thread = budget.summarize_async(context, lambda transcript, previous: "They said x.")
+    thread.join()
+    window, changed = budget.build(context)
+    assert changed
+    assert window[1]["content"][0]["text"] == context_budget.SUMMARY_PREFIX + "They said x."
+    assert len(window) - 2 <= context_budget.SUMMARY_KEEP_MESSAGES
+    budget.reset()
+    assert budget.build(context)[0] == context
@@ -0,0 +1,97 @@
+import json
+
+import pytest
+
+import openai_helper
+import sse_parser
+
+
+def frame(payload, event_type=None):
+    event_type = event_type or payload["type"]
+    return f"event: {event_type}\ndata: {json.dumps(payload)}\n\n".encode()
+
+
+def delta(text, sequence_number):
+    return frame(
+        {"type": sse_parser.TEXT_DELTA, "delta": text, "sequence_number": sequence_number}
+    )
+
+
+def decode_all(data: bytes, step: int):
+    decoder = sse_parser.ResponseStreamDecoder()
+    events = []
+    for i in range(0, len(data), step):
+        events += decoder.feed(data[i : i + step])
+    return events + decoder.flush()
+
+
+def test_deltas_survive_any_chunking():
+    data = b"".join(delta(text, i) for i, text in enumerate(["Hel", "lo, ", "wörld"]))
+    for step in (1, 2, 7, 64, len(data)):
+        events = decode_all(data, step)
+        assert "".join(event.delta for event in events) == "Hello, wörld"
+
+
+def test_crlf_split_across_chunks():
+    data = delta("a", 0).replace(b"\n", b"\r\n") + delta("b", 1).replace(b"\n", b"\r\n")
+    cut = data.index(b"\r\n\r\n") + 1  # between the CR and LF of a blank line
+    decoder = sse_parser.ResponseStreamDecoder()
+    events = decoder.feed(data[:cut]) + decoder.feed(data[cut:]) + decoder.flush()
+    assert [event.delta for event in events] == ["a", "b"]
+
+
+def test_unterminated_last_frame_is_flushed():
+    decoder = sse_parser.ResponseStreamDecoder()
+    assert decoder.feed(delta("a", 0)[:-2]) == []
+    assert [event.delta for event in decoder.flush()] == ["a"]
+
+
+def test_comments_and_event_only_frames_are_ignored():
+    data = b": keep-alive\n\nevent: response.in_progress\n\n" + delta("a", 0) + b"data: [DONE]\n\n"
+    decoder = sse_parser.ResponseStreamDecoder()
+    assert [event.delta for event in decoder.feed(data)] == ["a"]
+    assert decoder.skipped == 1
+
+
+def test_unhandled_events_are_skipped():
+    data = frame({"type": "response.output_item.added", "sequence_number": 0}) + delta("a", 1)
+    decoder = sse_parser.ResponseStreamDecoder()
+    events = decoder.feed(data)
+    assert [event.type for event in events] == [sse_parser.TEXT_DELTA]
+    assert decoder.skipped == 1
+
+
+def test_resume_point_includes_skipped_events():
+    decoder = sse_parser.ResponseStreamDecoder(last_sequence_number=4)
+    assert decoder.resume_point() == 4
+    decoder.feed(delta("a", 5))
+    assert decoder.resume_point() == 5
+    decoder.feed(frame({"type": "response.output_text.done", "sequence_number": 6}))
+    decoder.feed(frame({"type": "response.content_part.done", "sequence_number": 7}))
+    assert decoder.resume_point() == 7
+    decoder.feed(delta("b", 8))
+    assert decoder.resume_point() == 8
+
+
+def test_incomplete_is_terminal_with_reason():
+    payload = {
+        "type": sse_parser.RESPONSE_INCOMPLETE,
+        "response": {"incomplete_details": {"reason": "max_output_tokens"}},
+    }
+    (event,) = sse_parser.ResponseStreamDecoder().feed(frame(payload))
+    assert event.type in sse_parser.TERMINAL_EVENT_TYPES
+    assert sse_parser.incomplete_reason(event) == "max_output_tokens"
+    assert openai_helper._check_stream_event(event) is event
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        {"type": "error", "message": "rate limited"},
+        {"type": "response.failed", "response": {"error": {"message": "rate limited"}}},
+    ],
+)
+def test_error_events_raise(payload):
+    (event,) = sse_parser.ResponseStreamDecoder().feed(frame(payload))
+    with pytest.raises(sse_parser.ResponseStreamError, match="rate limited"):
+        openai_helper._check_stream_event(event)
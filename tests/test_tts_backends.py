@@ -0,0 +1,127 @@
+import pytest
+
+import tts_backends
+
+
+class FakeBackend(tts_backends.TTSBackend):
+    def __init__(self, name, expected_latency=0.5, offline=False):
+        self.name = name
+        self.expected_latency = expected_latency
+        self.offline = offline
+
+    def stream(self, text, settings):
+        raise RuntimeError(f"{self.name} does not synthesize")
+
+    def voices(self):
+        return [self.name]
+
+
+def test_backends_must_implement_stream_and_voices():
+    class Incomplete(tts_backends.TTSBackend):
+        def voices(self):
+            return []
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(tts_backends.time, "monotonic", clock)
+    return clock
+
+
+def test_active_backend_kept_within_switch_margin(clock):
+    a, b = FakeBackend("a"), FakeBackend("b")
+    selector = tts_backends.BackendSelector([a, b])
+    selector.record_latency(a, 0.6)
+    selector.record_latency(b, 0.5)
+    assert selector.choose() is a  # 0.6 s is within SWITCH_MARGIN of 0.5 s
+    selector.record_latency(a, 0.6 + 10 / tts_backends.LATENCY_SMOOTHING)
+    assert selector.choose() is b
+    assert selector.active is b
+
+
+def test_stale_measurements_fall_back_to_expected_latency(clock):
+    a, b = FakeBackend("a", expected_latency=0.5), FakeBackend("b", expected_latency=1.0)
+    selector = tts_backends.BackendSelector([b, a])
+    selector.record_latency(b, 0.1)
+    assert selector.choose() is b
+    clock.now += tts_backends.STALE_SECONDS + 1
+    assert selector.choose() is a
+
+
+def test_failure_cooldown_grows_and_ends(clock):
+    a, b = FakeBackend("a", 0.2), FakeBackend("b", 0.5)
+    selector = tts_backends.BackendSelector([a, b])
+    selector.record_failure(a, RuntimeError("down"))
+    assert selector.choose() is b
+    clock.now += tts_backends.FAILURE_COOLDOWN + 1
+    assert selector.choose() is a
+    selector.record_failure(a, RuntimeError("down"))
+    selector.record_failure(a, RuntimeError("down"))
+    clock.now += 2 * tts_backends.FAILURE_COOLDOWN + 1
+    assert selector.choose() is b  # the third failure in a row waits 4x as long
+    selector.record_latency(a, 0.2)
+    assert selector.choose() is a
+
+
+def test_fallback_does_not_change_active_backend(clock):
+    a, b = FakeBackend("a", 0.2), FakeBackend("b", 0.5)
+    selector = tts_backends.BackendSelector([a, b])
+    assert selector.choose(exclude=[a]) is b
+    assert selector.active is a
+    assert selector.choose(exclude=[a, b]) is None
+    assert selector.choose(accept=lambda backend: backend is b) is b
+
+
+def test_everything_down_tries_the_longest_waiting(clock):
+    a, b = FakeBackend("a"), FakeBackend("b")
+    selector = tts_backends.BackendSelector([a, b])
+    selector.record_failure(a, RuntimeError("down"))
+    clock.now += 1
+    selector.record_failure(b, RuntimeError("down"))
+    assert selector.choose() is a
+
+
+def test_local_backend_only_for_short_whole_replies_or_outages(clock):
+    online, local = FakeBackend("openai", 0.6), FakeBackend("local", 0.1, offline=True)
+    selector = tts_backends.BackendSelector([online, local])
+    short = "Sure."
+    long = "word " * tts_backends.SHORT_TEXT_CHARS
+    assert selector.choose(text=short) is local
+    assert selector.choose(text=long) is online
+    assert selector.choose() is online  # still streaming: the length is unknown
+    assert selector.choose(text="   ") is online
+    selector.record_failure(online, RuntimeError("down"))
+    assert selector.choose() is local
+    assert selector.choose(text=long) is local
+
+
+def test_gpt_4o_mini_tts_cost():
+    backend = tts_backends.OpenAIBackend(client=None)
+    settings = {"model": "gpt-4o-mini-tts", "speed": 1.0}
+    text = "x" * backend.CHARS_PER_MINUTE
+    tokens = len(text) / backend.CHARS_PER_TOKEN
+    assert backend.cost(text, settings) == pytest.approx(0.015 + tokens * 0.60 / 1e6)
+    assert backend.cost(text, {"model": "tts-1", "speed": 1.0}) == pytest.approx(
+        len(text) * 15.0 / 1e6
+    )
+
+
+def test_usage_summary():
+    a = FakeBackend("a")
+    selector = tts_backends.BackendSelector([a])
+    selector.record_usage(a, "hello", {})
+    summary = selector.summary()["a"]
+    assert (summary["chunks"], summary["chars"], summary["latency_ms"]) == (1, 5, None)
+    assert "a" in selector.format_summary()
@@ -0,0 +1,49 @@
+import os
+
+import tts_cache
+
+
+def test_cache_key_depends_on_every_setting():
+    base = ("Hello", "alloy", "tts-1", None, 1.0, "pcm")
+    keys = {tts_cache.cache_key(*base)}
+    for i, value in enumerate(("Hi", "echo", "tts-1-hd", "calm", 1.25, "mp3")):
+        keys.add(tts_cache.cache_key(*base[:i], value, *base[i + 1 :]))
+    assert len(keys) == 7
+    assert tts_cache.cache_key(*base) == tts_cache.cache_key("Hello", "alloy", "tts-1", "", 1)
+
+
+def test_memory_lru_eviction():
+    cache = tts_cache.TTSCache(directory=None, memory_bytes=10)
+    cache.put("a", b"1234")
+    cache.put("b", b"1234")
+    assert cache.get("a") == b"1234"  # a is now newer than b
+    cache.put("c", b"1234")
+    assert "b" not in cache
+    assert cache.get("a") == b"1234" and cache.get("c") == b"1234"
+    assert (cache.hits, cache.misses) == (3, 0)
+    assert cache.get("b") is None and cache.misses == 1
+
+
+def test_disk_lru_eviction_and_reload(tmp_path):
+    directory = str(tmp_path / "tts")
+    cache = tts_cache.TTSCache(directory=directory, memory_bytes=0, disk_bytes=10)
+    cache.put("a", b"1234")
+    cache.put("b", b"1234")
+    assert cache.get("a") == b"1234"
+    cache.put("c", b"1234")
+    assert sorted(os.listdir(directory)) == ["a.audio", "c.audio"]
+    assert "b" not in cache and "a" in cache
+
+    reloaded = tts_cache.TTSCache(directory=directory, memory_bytes=0, disk_bytes=10)
+    assert reloaded.get("c") == b"1234"
+    reloaded.clear()
+    assert os.listdir(directory) == []
+    assert "c" not in reloaded
+
+
+def test_missing_disk_entry_is_a_miss(tmp_path):
+    cache = tts_cache.TTSCache(directory=str(tmp_path), memory_bytes=0)
+    cache.put("a", b"1234")
+    os.remove(tmp_path / "a.audio")
+    assert cache.get("a") is None
+    assert "a" not in cache
@@ -0,0 +1,565 @@
+"""
+Speech synthesis backends for TTSService, and latency-based selection between them.
+
+A backend turns one chunk of text into audio bytes, streamed as they arrive. It
+also lists its voices and estimates what a chunk costs. TTSService asks a
+`BackendSelector` which backend to use at the start of each reply, and keeps it
+for the whole reply so the voice does not change halfway. The selector keeps a
+smoothed time-to-first-audio per backend and takes a backend out of rotation for a
+while when it fails. It stays on the active backend while it keeps up, and moves
+to the fastest healthy one when the active backend degrades.
+
+Latency-based switching only applies once a second online backend is enabled
+(e.g. "openai,edge,local"); with the default list there is nothing to switch to.
+Backends are not probed: one that is not in use is only measured when a fallback
+sends it a chunk, and otherwise its `expected_latency` stands in for it.
+
+The offline backend (espeak-ng, or `say` on macOS) does not compete on latency.
+It is a fallback: it takes over while the online backends are failing (offline,
+rate limited), and otherwise only speaks complete replies of up to
+SIDEKICK_TTS_LOCAL_CHARS characters, such as status phrases, with no network
+round trip. It never speaks part of a longer reply.
+
+SIDEKICK_TTS_BACKENDS lists the backends to use, in order of preference
+(default "openai,local"). The free edge-tts voices are opt-in ("openai,edge,local").
+"""
+
+import asyncio
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import logging
+from abc import ABC, abstractmethod
+from typing import Callable, Iterable, List, Optional
+
+import logging_config
+import audio_decode
+import event_loop
+import tts_cache
+
+try:
+    import edge_tts
+except ImportError:
+    edge_tts = None
+
+root_logger = logging_config.setup_root_logging("tts_backends.log")
+logger = logging.getLogger(__name__)
+
+__all__ = (
+    "TTSBackend",
+    "OpenAIBackend",
+    "EdgeTTSBackend",
+    "LocalBackend",
+    "BackendSelector",
+    "default_backends",
+)
+
+DEFAULT_BACKENDS = os.getenv("SIDEKICK_TTS_BACKENDS", "openai,local")
+# Whole replies up to this many characters go to the offline backend; 0 turns that off
+SHORT_TEXT_CHARS = int(os.getenv("SIDEKICK_TTS_LOCAL_CHARS", "40"))
+
+# Weight of the newest time-to-first-audio sample in a backend's running average
+LATENCY_SMOOTHING = 0.3
+# Another backend must be this much faster before the active one is given up
+SWITCH_MARGIN = 1.5
+# Measurements older than this no longer count; the backend's prior is used instead
+STALE_SECONDS = 300.0
+# A failed backend sits out this long, doubling with each further failure
+FAILURE_COOLDOWN = 30.0
+MAX_FAILURE_COOLDOWN = 300.0
+
+_END = object()
+
+
+class TTSBackend(ABC):
+    """A speech synthesizer TTSService can drive.
+
+    `settings` is the service's speech settings (model, voice, speed,
+    response_format and instructions, as for OpenAI's `audio.speech.create`).
+    Backends use the ones they understand.
+    """
+
+    name = "backend"
+    # Time to first audio assumed until the backend has been measured, in seconds
+    expected_latency = 1.0
+    # Synthesizes on this machine: used for short replies and when the others fail
+    offline = False
+
+    def available(self) -> bool:
+        """True if the backend can be used in this environment."""
+        return True
+
+    def speech_format(self, settings: dict) -> str:
+        """The audio format `stream()` returns for these settings ("pcm", "mp3", ...)."""
+        return settings["response_format"]
+
+    @abstractmethod
+    def stream(self, text: str, settings: dict):
+        """
+        Starts synthesizing `text`.
+
+        Returns:
+            A context manager for the response: `iter_bytes(size)` yields the audio
+            as it arrives, and `close()` (from any thread) aborts the download.
+        """
+        raise NotImplementedError
+
+    def synthesize(self, text: str, settings: dict) -> bytes:
+        """
+        Returns the complete audio for `text`.
+        """
+        with self.stream(text, settings) as response:
+            return b"".join(response.iter_bytes())
+
+    @abstractmethod
+    def voices(self) -> List[str]:
+        """Names of the voices the backend offers."""
+        raise NotImplementedError
+
+    def cost(self, text: str, settings: dict) -> float:
+        """Estimated price of synthesizing `text`, in USD."""
+        return 0.0
+
+    def cache_key(self, text: str, settings: dict) -> str:
+        """Key of the synthesized audio in the TTS cache."""
+        return tts_cache.cache_key(
+            text,
+            settings["voice"],
+            settings["model"],
+            settings["instructions"],
+            settings["speed"],
+            self.speech_format(settings),
+        )
+
+
+class OpenAIBackend(TTSBackend):
+    """OpenAI's speech endpoint, through the shared pooled client."""
+
+    name = "openai"
+    expected_latency = 0.6
+
+    VOICES = (
+        "alloy",
+        "ash",
+        "ballad",
+        "coral",
+        "echo",
+        "fable",
+        "onyx",
+        "nova",
+        "sage",
+        "shimmer",
+        "verse",
+    )
+    # USD per million input characters
+    PRICE_PER_MILLION_CHARS = {"tts-1": 15.0, "tts-1-hd": 30.0}
+    # gpt-4o-mini-tts is billed by token: $0.60 per million text tokens in, and
+    # audio out that OpenAI estimates at $0.015 per minute
+    PRICE_PER_MILLION_TEXT_TOKENS = {"gpt-4o-mini-tts": 0.60}
+    PRICE_PER_AUDIO_MINUTE = {"gpt-4o-mini-tts": 0.015}
+    CHARS_PER_TOKEN = 4
+    # About 150 words a minute at speed 1.0
+    CHARS_PER_MINUTE = 900
+    DEFAULT_PRICE_PER_MILLION_CHARS = 15.0
+
+    def __init__(self, client):
+        self.client = client
+
+    def stream(self, text: str, settings: dict):
+        return self.client.audio.speech.with_streaming_response.create(
+            input=text, **settings
+        )
+
+    def voices(self) -> List[str]:
+        return list(self.VOICES)
+
+    def cost(self, text: str, settings: dict) -> float:
+        model = settings["model"]
+        if model in self.PRICE_PER_AUDIO_MINUTE:
+            minutes = len(text) / (self.CHARS_PER_MINUTE * settings["speed"])
+            tokens = len(text) / self.CHARS_PER_TOKEN
+            return (
+                minutes * self.PRICE_PER_AUDIO_MINUTE[model]
+                + tokens * self.PRICE_PER_MILLION_TEXT_TOKENS[model] / 1e6
+            )
+        price = self.PRICE_PER_MILLION_CHARS.get(model, self.DEFAULT_PRICE_PER_MILLION_CHARS)
+        return len(text) * price / 1e6
+
+
+class _EdgeResponse:
+    """A streaming edge-tts synthesis, read from a worker thread."""
+
+    def __init__(self, communicate):
+        self._queue = queue.Queue()
+        self._future = event_loop.submit(self._pump(communicate))
+
+    async def _pump(self, communicate):
+        try:
+            async for chunk in communicate.stream():
+                if chunk["type"] == "audio":
+                    self._queue.put(chunk["data"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._queue.put(e)
+        finally:
+            self._queue.put(_END)
+
+    def iter_bytes(self, chunk_size: Optional[int] = None):
+        while True:
+            item = self._queue.get()
+            if item is _END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def close(self):
+        self._future.cancel()
+        self._queue.put(_END)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class EdgeTTSBackend(TTSBackend):
+    """Microsoft Edge's online voices through edge-tts (free, MP3 only)."""
+
+    name = "edge"
+    expected_latency = 0.8
+    DEFAULT_VOICE = "en-US-AndrewNeural"
+
+    def __init__(self, voice: str = DEFAULT_VOICE):
+        self.voice = voice
+        self._voices = None
+
+    def available(self) -> bool:
+        return edge_tts is not None and audio_decode.can_decode("mp3")
+
+    def speech_format(self, settings: dict) -> str:
+        return "mp3"
+
+    def _rate(self, settings: dict) -> str:
+        return f"{round((settings['speed'] - 1.0) * 100):+d}%"
+
+    def stream(self, text: str, settings: dict):
+        return _EdgeResponse(edge_tts.Communicate(text, self.voice, rate=self._rate(settings)))
+
+    def voices(self) -> List[str]:
+        if self._voices is None:
+            voices = event_loop.submit(edge_tts.list_voices()).result(timeout=30)
+            self._voices = sorted(voice["ShortName"] for voice in voices)
+        return list(self._voices)
+
+    def cache_key(self, text: str, settings: dict) -> str:
+        return tts_cache.cache_key(
+            text, self.voice, "edge-tts", None, settings["speed"], "mp3"
+        )
+
+
+class _ProcessResponse:
+    """Audio from a local synthesizer process: its stdout, or the file it writes."""
+
+    def __init__(self, command: List[str], output_path: Optional[str] = None):
+        self._output_path = output_path
+        self._process = subprocess.Popen(
+            command,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL if output_path else subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+
+    def iter_bytes(self, chunk_size: Optional[int] = None):
+        process = self._process
+        if self._output_path is None:
+            while True:
+                data = process.stdout.read1(chunk_size or 65536)
+                if not data:
+                    break
+                yield data
+        if process.wait() != 0:
+            error = process.stderr.read().decode(errors="replace").strip()
+            raise RuntimeError(f"Local TTS exited with {process.returncode}: {error}")
+        if self._output_path is not None:
+            with open(self._output_path, "rb") as f:
+                yield f.read()
+
+    def close(self):
+        if self._process.poll() is None:
+            self._process.kill()
+        self._process.wait()
+        for stream in (self._process.stdout, self._process.stderr):
+            if stream is not None:
+                stream.close()
+        if self._output_path is not None:
+            try:
+                os.remove(self._output_path)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class LocalBackend(TTSBackend):
+    """Offline speech from espeak-ng (or espeak), or macOS `say`; mono 16-bit WAV."""
+
+    name = "local"
+    expected_latency = 0.05
+    offline = True
+    # Speaking rate of both engines at speed 1.0, in words per minute
+    WORDS_PER_MINUTE = 175
+
+    def __init__(self, voice: Optional[str] = None):
+        self.voice = voice
+        self.engine = None
+        for engine in ("espeak-ng", "espeak", "say"):
+            path = shutil.which(engine)
+            if path:
+                self.engine, self.command = engine, path
+                break
+        self._voices = None
+
+    def available(self) -> bool:
+        return self.engine is not None
+
+    def speech_format(self, settings: dict) -> str:
+        return "wav"
+
+    def stream(self, text: str, settings: dict):
+        rate = str(round(self.WORDS_PER_MINUTE * settings["speed"]))
+        voice = ["-v", self.voice] if self.voice else []
+        if self.engine == "say":
+            # say cannot write WAV to a pipe
+            fd, path = tempfile.mkstemp(suffix=".wav")
+            os.close(fd)
+            command = [self.command, *voice, "-r", rate, "--file-format=WAVE"]
+            command += ["--data-format=LEI16@22050", "-o", path, "--", text]
+            return _ProcessResponse(command, output_path=path)
+        return _ProcessResponse([self.command, "--stdout", *voice, "-s", rate, "--", text])
+
+    def voices(self) -> List[str]:
+        if self._voices is None:
+            if self.engine == "say":
+                listing = subprocess.run(
+                    [self.command, "-v", "?"], capture_output=True, text=True, timeout=10
+                ).stdout
+                # "Name   en_US    # sample sentence"; names may contain spaces
+                self._voices = [line.split("  ")[0] for line in listing.splitlines() if line]
+            else:
+                listing = subprocess.run(
+                    [self.command, "--voices"], capture_output=True, text=True, timeout=10
+                ).stdout
+                # "Pty Language Age/Gender VoiceName File Other Languages"; names use
+                # underscores instead of spaces, and -v accepts them
+                rows = (line.split() for line in listing.splitlines()[1:])
+                self._voices = [row[3] for row in rows if len(row) >= 5]
+        return list(self._voices)
+
+    def cache_key(self, text: str, settings: dict) -> str:
+        return tts_cache.cache_key(
+            text, self.voice or "", self.engine, None, settings["speed"], "wav"
+        )
+
+
+def default_backends(client, names: str = DEFAULT_BACKENDS) -> List[TTSBackend]:
+    """
+    Returns the backends named in `names` (comma-separated) that are usable here.
+    """
+    factories = {
+        "openai": lambda: OpenAIBackend(client),
+        "edge": EdgeTTSBackend,
+        "local": LocalBackend,
+    }
+    backends = []
+    for name in (part.strip() for part in names.split(",")):
+        if not name:
+            continue
+        if name not in factories:
+            logger.warning(f"Unknown TTS backend {name!r}; ignoring it.")
+            continue
+        backend = factories[name]()
+        if backend.available():
+            backends.append(backend)
+        else:
+            logger.info(f"TTS backend {name!r} is unavailable here.")
+    if not backends:
+        backends.append(OpenAIBackend(client))
+    return backends
+
+
+class _BackendStats:
+    __slots__ = (
+        "backend",
+        "latency",
+        "measured_at",
+        "failures",
+        "down_until",
+        "chunks",
+        "chars",
+        "cost",
+    )
+
+    def __init__(self, backend: TTSBackend):
+        self.backend = backend
+        self.latency = None  # smoothed time to first audio, in seconds
+        self.measured_at = 0.0
+        self.failures = 0  # consecutive
+        self.down_until = 0.0
+        self.chunks = 0
+        self.chars = 0
+        self.cost = 0.0
+
+    def score(self, now: float) -> float:
+        if self.latency is None or now - self.measured_at > STALE_SECONDS:
+            return self.backend.expected_latency
+        return self.latency
+
+
+class BackendSelector:
+    """Chooses a backend per reply from measured latency and failures; thread-safe."""
+
+    def __init__(self, backends: Iterable[TTSBackend]):
+        self._stats = [_BackendStats(backend) for backend in backends]
+        if not self._stats:
+            raise ValueError("At least one TTS backend is required")
+        self._active = self._stats[0]
+        self._lock = threading.Lock()
+
+    @property
+    def backends(self) -> List[TTSBackend]:
+        return [stats.backend for stats in self._stats]
+
+    @property
+    def active(self) -> TTSBackend:
+        return self._active.backend
+
+    def _find(self, backend: TTSBackend) -> _BackendStats:
+        return next(stats for stats in self._stats if stats.backend is backend)
+
+    def choose(
+        self,
+        exclude: Iterable[TTSBackend] = (),
+        accept: Optional[Callable[[TTSBackend], bool]] = None,
+        text: Optional[str] = None,
+    ) -> Optional[TTSBackend]:
+        """
+        Returns the backend to use next, or None if every candidate is excluded.
+
+        Backends that failed recently are skipped while any other is healthy, and
+        offline backends are only used for a short complete reply (`text`) or
+        while every online one is failing. A fallback choice (with `exclude`) does
+        not change the active backend.
+
+        Args:
+            exclude: Backends already tried for the chunk being retried.
+            accept: Further filter, e.g. on the audio format a backend returns.
+            text: The whole reply, if it is already complete; None while it streams.
+        """
+        exclude = tuple(exclude)
+        now = time.monotonic()
+        with self._lock:
+            candidates = [
+                stats
+                for stats in self._stats
+                if stats.backend not in exclude and (accept is None or accept(stats.backend))
+            ]
+            if not candidates:
+                return None
+            healthy = [stats for stats in candidates if stats.down_until <= now]
+            offline = [stats for stats in healthy if stats.backend.offline]
+            if offline and text is not None and 0 < len(text.strip()) <= SHORT_TEXT_CHARS:
+                return offline[0].backend
+            # Online backends when any is healthy, else whatever still works
+            healthy = [stats for stats in healthy if not stats.backend.offline] or healthy
+            if not healthy:
+                # Everything is cooling down; the one that has waited longest gets a try
+                healthy = [min(candidates, key=lambda stats: stats.down_until)]
+            best = min(healthy, key=lambda stats: stats.score(now))
+            active = self._active
+            if active in healthy and active.score(now) <= best.score(now) * SWITCH_MARGIN:
+                best = active
+            if not exclude and best is not active:
+                logger.info(
+                    f"TTS backend switched: {active.backend.name} -> {best.backend.name} "
+                    f"({active.score(now) * 1000:.0f} ms vs {best.score(now) * 1000:.0f} ms, "
+                    f"{active.failures} failure(s))"
+                )
+                self._active = best
+            return best.backend
+
+    def record_latency(self, backend: TTSBackend, seconds: float):
+        """Adds a time-to-first-audio measurement; the backend counts as healthy again."""
+        with self._lock:
+            stats = self._find(backend)
+            if stats.latency is None or time.monotonic() - stats.measured_at > STALE_SECONDS:
+                stats.latency = seconds
+            else:
+                stats.latency += LATENCY_SMOOTHING * (seconds - stats.latency)
+            stats.measured_at = time.monotonic()
+            stats.failures = 0
+            stats.down_until = 0.0
+
+    def record_failure(self, backend: TTSBackend, error: Exception):
+        """Takes a backend out of rotation for a cooldown that grows with each failure."""
+        with self._lock:
+            stats = self._find(backend)
+            stats.failures += 1
+            cooldown = min(FAILURE_COOLDOWN * 2 ** (stats.failures - 1), MAX_FAILURE_COOLDOWN)
+            stats.down_until = time.monotonic() + cooldown
+        logger.warning(
+            f"TTS backend {backend.name} failed ({error}); skipping it for {cooldown:.0f}s."
+        )
+
+    def record_usage(self, backend: TTSBackend, text: str, settings: dict):
+        """Counts a synthesized chunk and its estimated cost against the backend."""
+        cost = backend.cost(text, settings)
+        with self._lock:
+            stats = self._find(backend)
+            stats.chunks += 1
+            stats.chars += len(text)
+            stats.cost += cost
+
+    def summary(self) -> dict:
+        """
+        Returns {backend: {"latency_ms", "failures", "healthy", "chunks", "chars",
+        "cost_usd"}}.
+        """
+        now = time.monotonic()
+        with self._lock:
+            return {
+                stats.backend.name: {
+                    "latency_ms": (
+                        None if stats.latency is None else round(stats.latency * 1000, 1)
+                    ),
+                    "failures": stats.failures,
+                    "healthy": stats.down_until <= now,
+                    "chunks": stats.chunks,
+                    "chars": stats.chars,
+                    "cost_usd": round(stats.cost, 4),
+                }
+                for stats in self._stats
+            }
+
+    def format_summary(self) -> str:
+        """
+        Returns the per-backend summary as a small text table.
+        """
+        lines = [f"  {'backend':<10}{'chunks':>7}{'chars':>8}{'ttfa ms':>9}{'est. $':>9}"]
+        for name, stats in self.summary().items():
+            latency = "-" if stats["latency_ms"] is None else f"{stats['latency_ms']:.0f}"
+            lines.append(
+                f"  {name:<10}{stats['chunks']:>7}{stats['chars']:>8}{latency:>9}"
+                f"{stats['cost_usd']:>9.4f}"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,196 @@
+"""
+Content-addressed cache for synthesized speech, in memory and on disk.
+
+Entries are keyed by a hash of everything that affects the audio (text, voice, model,
+instructions, speed and format). A small in-memory LRU serves repeats within a
+session; a size-bounded directory of files, evicted least-recently-used by
+modification time, keeps audio across restarts.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import logging
+from collections import OrderedDict
+from typing import Optional
+
+import logging_config
+
+try:
+    from platformdirs import user_cache_dir
+except ImportError:  # optional; fall back to the XDG default
+
+    def user_cache_dir(appname):
+        base = os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+        return os.path.join(base, appname)
+
+
+root_logger = logging_config.setup_root_logging("tts_cache.log")
+logger = logging.getLogger(__name__)
+
+__all__ = ("TTSCache", "cache_key")
+
+# Per-user, so the cache neither depends on the working directory nor lands in the repo
+DEFAULT_DIRECTORY = os.getenv("SIDEKICK_TTS_CACHE_DIR") or os.path.join(
+    user_cache_dir("sidekick"), "tts"
+)
+DEFAULT_MEMORY_BYTES = 32 * 1024 * 1024
+DEFAULT_DISK_BYTES = int(os.getenv("SIDEKICK_TTS_CACHE_MB", "256")) * 1024 * 1024
+_SUFFIX = ".audio"
+
+
+def cache_key(text, voice, model, instructions=None, speed=1.0, response_format="pcm"):
+    """
+    Returns the hex digest identifying a synthesis request.
+    """
+    parts = [text, voice, model, instructions or "", float(speed), response_format]
+    blob = json.dumps(parts, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class TTSCache:
+    """Two-level LRU cache of audio bytes; safe to use from several threads."""
+
+    def __init__(
+        self,
+        directory: Optional[str] = DEFAULT_DIRECTORY,
+        memory_bytes: int = DEFAULT_MEMORY_BYTES,
+        disk_bytes: int = DEFAULT_DISK_BYTES,
+    ):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._memory = OrderedDict()  # key -> bytes
+        self._memory_size = 0
+        self._disk = OrderedDict()  # key -> size, oldest first
+        self._disk_size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if directory and disk_bytes > 0:
+            self._load_index()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + _SUFFIX)
+
+    def _load_index(self):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            entries = []
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.name.endswith(_SUFFIX) and entry.is_file():
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, entry.name[: -len(_SUFFIX)], stat.st_size))
+        except OSError as e:
+            logger.warning(f"TTS disk cache unavailable ({e}); using memory only.")
+            self.directory = None
+            return
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_size += size
+        logger.info(
+            f"TTS disk cache: {len(self._disk)} entries, {self._disk_size / 1e6:.1f} MB."
+        )
+        self._evict_disk()
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._memory or (self.directory is not None and key in self._disk)
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        Returns cached audio for `key`, or None.
+        """
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return audio
+            on_disk = self.directory is not None and key in self._disk
+            if on_disk:
+                self._disk.move_to_end(key)
+        if not on_disk:
+            with self._lock:
+                self.misses += 1
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                audio = f.read()
+            os.utime(path)  # recency for the next session's LRU order
+        except OSError:
+            with self._lock:
+                self._disk_size -= self._disk.pop(key, 0)
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+            self._remember(key, audio)
+        return audio
+
+    def put(self, key: str, audio: bytes):
+        """
+        Stores audio in memory and on disk, evicting least recently used entries.
+        """
+        if not audio:
+            return
+        with self._lock:
+            self._remember(key, audio)
+            if self.directory is None or key in self._disk:
+                return
+        path = self._path(key)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(audio)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"Could not write TTS cache entry: {e}")
+            return
+        with self._lock:
+            self._disk[key] = len(audio)
+            self._disk_size += len(audio)
+        self._evict_disk()
+
+    def _remember(self, key, audio):
+        # Caller holds the lock
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        self._memory[key] = audio
+        self._memory_size += len(audio)
+        while self._memory_size > self.memory_bytes and self._memory:
+            _, old = self._memory.popitem(last=False)
+            self._memory_size -= len(old)
+
+    def _evict_disk(self):
+        victims = []
+        with self._lock:
+            while self._disk_size > self.disk_bytes and self._disk:
+                key, size = self._disk.popitem(last=False)
+                self._disk_size -= size
+                victims.append(key)
+        for key in victims:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+        if victims:
+            logger.info(f"Evicted {len(victims)} TTS cache entries from disk.")
+
+    def clear(self):
+        """Empties both levels."""
+        with self._lock:
+            keys = list(self._disk)
+            self._memory.clear()
+            self._memory_size = 0
+            self._disk.clear()
+            self._disk_size = 0
+        for key in keys:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
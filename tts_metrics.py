@@ -0,0 +1,234 @@
+"""
+Per-chunk timing records for the streaming TTS pipeline.
+
+TTSService stamps a `ChunkTiming` as each chunk moves through it (queued, dispatched
+to synthesis, first byte, synthesized, ready in order, playing, played) and hands it
+to `TTSMetrics` once the chunk is done. Records are kept for the session, appended to
+a JSONL log as they complete, and summarized as p50/p95 per stage, so a slow
+read-aloud can be pinned on queueing, synthesis or playback.
+"""
+
+import datetime
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+import logging
+from typing import Callable, Optional
+
+import numpy as np
+import logging_config
+
+try:
+    from platformdirs import user_log_dir
+except ImportError:  # optional; fall back to the XDG state directory
+
+    def user_log_dir(appname):
+        base = os.getenv("XDG_STATE_HOME") or os.path.join(
+            os.path.expanduser("~"), ".local", "state"
+        )
+        return os.path.join(base, appname, "log")
+
+
+root_logger = logging_config.setup_root_logging("tts_metrics.log")
+logger = logging.getLogger(__name__)
+
+__all__ = ("ChunkTiming", "TTSMetrics", "STAGES")
+
+# Per-user, so the records accumulate in one place whatever the working directory
+DEFAULT_LOG_PATH = os.getenv("SIDEKICK_TTS_METRICS_LOG") or os.path.join(
+    user_log_dir("sidekick"), "tts_metrics.jsonl"
+)
+
+# Durations reported per chunk, in milliseconds: (name, from stamp, to stamp)
+STAGES = (
+    ("queue", "added_at", "dispatched_at"),
+    ("first_byte", "dispatched_at", "first_byte_at"),
+    ("synthesis", "dispatched_at", "synthesized_at"),
+    ("wait_for_turn", "ready_at", "play_started_at"),
+    ("time_to_audio", "added_at", "play_started_at"),
+    ("playback", "play_started_at", "played_at"),
+)
+
+_ids = itertools.count(1)
+_END = object()
+
+
+class ChunkTiming:
+    """Timestamps (time.perf_counter) and sizes for one chunk; None until reached."""
+
+    __slots__ = (
+        "id",
+        "epoch",
+        "reply",
+        "chars",
+        "created",
+        "source",
+        "backend",
+        "outcome",
+        "bytes",
+        "audio_seconds",
+        "added_at",
+        "dispatched_at",
+        "first_byte_at",
+        "synthesized_at",
+        "ready_at",
+        "play_started_at",
+        "played_at",
+    )
+
+    def __init__(self, text: str, epoch: int, reply: int = 0):
+        self.id = next(_ids)
+        self.epoch = epoch
+        self.reply = reply  # chunks of one reply are spoken by the same backend
+        self.chars = len(text)
+        self.created = datetime.datetime.now().isoformat(timespec="milliseconds")
+        self.source = None  # "network" or "cache"
+        self.backend = None  # name of the TTS backend that synthesized it
+        self.outcome = None  # "played", "interrupted", "cancelled" or "failed"
+        self.bytes = 0
+        self.audio_seconds = 0.0
+        self.added_at = time.perf_counter()
+        self.dispatched_at = None
+        self.first_byte_at = None
+        self.synthesized_at = None
+        self.ready_at = None
+        self.play_started_at = None
+        self.played_at = None
+
+    def durations(self) -> dict:
+        """
+        Returns the stage durations in milliseconds, for the stages the chunk reached.
+        """
+        result = {}
+        for name, start, end in STAGES:
+            start, end = getattr(self, start), getattr(self, end)
+            if start is not None and end is not None:
+                result[name] = round((end - start) * 1000, 1)
+        return result
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "epoch": self.epoch,
+            "reply": self.reply,
+            "created": self.created,
+            "chars": self.chars,
+            "source": self.source,
+            "backend": self.backend,
+            "outcome": self.outcome,
+            "bytes": self.bytes,
+            "audio_seconds": round(self.audio_seconds, 3),
+            **{f"{name}_ms": ms for name, ms in self.durations().items()},
+        }
+
+
+class TTSMetrics:
+    """Collects finished `ChunkTiming` records for a session.
+
+    `record()` is cheap and safe from any thread, including the audio device
+    callback; the JSONL file is written and `on_record` is called from a writer
+    thread that sleeps while there is nothing to record.
+    """
+
+    def __init__(
+        self,
+        log_path: Optional[str] = DEFAULT_LOG_PATH,
+        on_record: Optional[Callable[[dict], None]] = None,
+    ):
+        self.log_path = log_path
+        self.on_record = on_record
+        self.session = datetime.datetime.now().isoformat(timespec="seconds")
+        self.records = []
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._writer = None
+
+    def record(self, timing: ChunkTiming, outcome: str):
+        """
+        Stores a finished chunk's timing with its outcome.
+        """
+        timing.outcome = outcome
+        entry = dict(timing.to_dict(), session=self.session)
+        with self._lock:
+            self.records.append(entry)
+            if self._writer is None:
+                self._writer = threading.Thread(
+                    target=self._write_records, daemon=True, name="TTSMetricsWriter"
+                )
+                self._writer.start()
+        self._queue.put(entry)
+
+    def _write_records(self):
+        if self.log_path:
+            try:
+                os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+            except OSError as e:
+                logger.warning(f"Could not create the TTS metrics directory: {e}")
+        while True:
+            entry = self._queue.get()
+            if entry is _END:
+                break
+            if self.log_path:
+                try:
+                    with open(self.log_path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(entry) + "\n")
+                except OSError as e:
+                    logger.warning(f"Could not write TTS metrics: {e}")
+                    self.log_path = None
+            if self.on_record is not None:
+                try:
+                    self.on_record(entry)
+                except Exception as e:
+                    logger.error(f"TTS metrics callback failed: {e}")
+
+    def summary(self, outcome: Optional[str] = "played") -> dict:
+        """
+        Returns {stage: {"n", "p50", "p95", "mean", "max"}} in milliseconds over this
+        session's records (only those with `outcome`, or all of them if None).
+        """
+        with self._lock:
+            records = [r for r in self.records if outcome is None or r["outcome"] == outcome]
+        result = {}
+        for name, _, _ in STAGES:
+            samples = [r[f"{name}_ms"] for r in records if f"{name}_ms" in r]
+            if samples:
+                ms = np.asarray(samples)
+                result[name] = {
+                    "n": len(samples),
+                    "p50": round(float(np.percentile(ms, 50)), 1),
+                    "p95": round(float(np.percentile(ms, 95)), 1),
+                    "mean": round(float(ms.mean()), 1),
+                    "max": round(float(ms.max()), 1),
+                }
+        return result
+
+    def format_summary(self) -> str:
+        """
+        Returns the session summary as a small text table.
+        """
+        lines = [f"  {'stage':<16}{'n':>5}{'p50 ms':>10}{'p95 ms':>10}"]
+        for name, stats in self.summary().items():
+            lines.append(f"  {name:<16}{stats['n']:>5}{stats['p50']:>10.1f}{stats['p95']:>10.1f}")
+        return "\n".join(lines)
+
+    def export(self, path: str) -> int:
+        """
+        Writes this session's records to `path` as JSONL; returns how many.
+        """
+        with self._lock:
+            records = list(self.records)
+        with open(path, "w", encoding="utf-8") as f:
+            for entry in records:
+                f.write(json.dumps(entry) + "\n")
+        return len(records)
+
+    def close(self):
+        """Flushes pending records and stops the writer thread."""
+        with self._lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            self._queue.put(_END)
+            writer.join(timeout=2.0)